@@ -8,13 +8,13 @@ import config
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
 from telegram.error import BadRequest, TelegramError
-import aiohttp
 import database
+from config_loader import json_config
+from catalog_sync import get_catalog_sync_service
 import sqlite3
 from datetime import datetime, timedelta
 import logging
 import os
-import shutil
 import json
 import asyncio
 import psutil
@@ -162,62 +162,9 @@ async def safe_edit_message_text(update, text: str, reply_markup=None, parse_mod
 # ============================
 
 def ensure_database_tables():
-    """Ensure all required tables exist dengan schema yang lengkap"""
-    tables = {
-        'products': """
-            CREATE TABLE IF NOT EXISTS products (
-                code TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                status TEXT DEFAULT 'active',
-                description TEXT,
-                category TEXT,
-                provider TEXT,
-                gangguan INTEGER DEFAULT 0,
-                kosong INTEGER DEFAULT 0,
-                stock INTEGER DEFAULT 0,
-                updated_at TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """,
-        'users': """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                username TEXT,
-                balance REAL DEFAULT 0,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """,
-        'topups': """
-            CREATE TABLE IF NOT EXISTS topups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                payment_method TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                approved_at TEXT,
-                approved_by TEXT
-            )
-        """
-    }
-    
+    """Ensure all required tables exist - lewat migration runner database.py"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        for table_name, schema in tables.items():
-            c.execute(schema)
-        
-        # Create indexes
-        c.execute("CREATE INDEX IF NOT EXISTS idx_products_status ON products(status)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_topups_status ON topups(status)")
-        
-        conn.commit()
-        conn.close()
-        logger.info("Database tables ensured successfully")
-        return True
+        return database.init_database()
     except Exception as e:
         logger.error(f"Database setup error: {e}")
         return False
@@ -244,6 +191,11 @@ def execute_sql(query: str, params=(), fetch: bool = False):
             raise e
         finally:
             conn.close()
+        
+        if not fetch and 'products' in query.lower():
+            database.invalidate_product_catalog()
+        if not fetch and 'users' in query.lower():
+            database.invalidate_user_cache()
             
         return result
     except Exception as e:
@@ -345,7 +297,7 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ============================
 
 async def updateproduk(update_or_query, context):
-    """Complete product update dari provider API"""
+    """Update produk dari provider: jalankan catalog sync sekarang"""
     user_id = None
     try:
         if hasattr(update_or_query, "message") and update_or_query.message:
@@ -355,171 +307,40 @@ async def updateproduk(update_or_query, context):
             msg_func = update_or_query.edit_message_text
             user_id = update_or_query.from_user.id
 
-        # Initial setup
         await msg_func("🔄 Memulai update produk dari provider...")
-        
-        # Validate configuration
-        if not hasattr(config, 'API_KEY_PROVIDER') or not config.API_KEY_PROVIDER:
-            await msg_func("❌ API Key Provider tidak dikonfigurasi.")
-            return
-
-        api_key = config.API_KEY_PROVIDER
-        url = f"https://panel.khfy-store.com/api_v2/list_product?api_key={api_key}"
 
-        # Fetch data dengan retry
-        data = None
-        for attempt in range(3):
-            try:
-                await msg_func(f"📡 Mengambil data... (Percobaan {attempt + 1}/3)")
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, timeout=30) as resp:
-                        if resp.status == 200:
-                            data = await resp.json()
-                            break
-                        else:
-                            await msg_func(f"❌ HTTP {resp.status}, retrying...")
-            except Exception as e:
-                if attempt == 2:
-                    await msg_func(f"❌ Gagal mengambil data: {e}")
-                    return
-                await asyncio.sleep(2)
-
-        if not data or not data.get("ok", False):
-            await msg_func("❌ Response invalid dari provider.")
+        stats = await get_catalog_sync_service().run_now()
+        if not stats:
+            await msg_func("❌ Gagal mengambil / memproses data produk dari provider.")
             return
 
-        produk_list = data.get("data", [])
-        if not produk_list:
-            await msg_func("⚠️ Tidak ada data produk.")
-            return
+        success_msg = (
+            f"✅ **UPDATE PRODUK BERHASIL**\n\n"
+            f"📊 **Statistik:**\n"
+            f"├ Total Diproses: `{stats['total']}`\n"
+            f"├ 🆕 Produk Baru: `{stats['new']}`\n"
+            f"├ ✏️ Produk Diupdate: `{stats['updated']}`\n"
+            f"├ 💾 Tidak Berubah: `{stats['unchanged']}`\n"
+            f"├ 🟢 Stok Tersedia: `{stats['active']}`\n"
+            f"├ 🚧 Stok Gangguan: `{stats['gangguan']}`\n"
+            f"├ 🔴 Stok Kosong: `{stats['kosong']}`\n"
+            f"├ 💤 Dinonaktifkan: `{stats['deactivated']}`\n"
+            f"└ ⏭️ Dilewati: `{stats['skipped']}`\n\n"
+            f"⏰ **Update:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
+        )
 
-        # Ensure database
-        if not ensure_database_tables():
-            await msg_func("❌ Gagal setup database.")
-            return
+        await msg_func(success_msg, parse_mode='Markdown')
+
+        await log_admin_action(user_id, "UPDATE_PRODUCTS",
+                               f"Total: {stats['total']}, New: {stats['new']}, "
+                               f"Updated: {stats['updated']}, Active: {stats['active']}")
 
-        # Process products
-        await msg_func("📊 Memproses data produk...")
-        
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        try:
-            c.execute("BEGIN TRANSACTION")
-            c.execute("UPDATE products SET status = 'inactive'")
-            
-            stats = {
-                'total': 0, 'new': 0, 'updated': 0, 
-                'active': 0, 'gangguan': 0, 'kosong': 0, 'skipped': 0
-            }
-            
-            for prod in produk_list:
-                code = str(prod.get("kode_produk", "")).strip()
-                name = str(prod.get("nama_produk", "")).strip()
-                price = float(prod.get("harga_final", 0))
-                gangguan = int(prod.get("gangguan", 0))
-                kosong = int(prod.get("kosong", 0))
-                provider_code = str(prod.get("kode_provider", "")).strip()
-                description = str(prod.get("deskripsi", "")).strip() or f"Produk {name}"
-                
-                # Validation
-                if not code or not name or price <= 0:
-                    stats['skipped'] += 1
-                    continue
-                
-                # Check existing
-                existing = fetch_one("SELECT code FROM products WHERE code = ?", (code,))
-                is_new = not existing
-                
-                # Stock calculation
-                stock = 0
-                if gangguan == 1:
-                    stock = 0
-                    stats['gangguan'] += 1
-                elif kosong == 1:
-                    stock = 0
-                    stats['kosong'] += 1
-                else:
-                    stock = 100
-                    stats['active'] += 1
-                
-                # Categorization
-                category = categorize_product(name)
-                
-                now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Insert/Update
-                c.execute("""
-                    INSERT INTO products (code, name, price, status, description, category, provider, gangguan, kosong, stock, updated_at)
-                    VALUES (?, ?, ?, 'active', ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(code) DO UPDATE SET
-                        name=excluded.name, price=excluded.price, status='active',
-                        description=excluded.description, category=excluded.category,
-                        provider=excluded.provider, gangguan=excluded.gangguan,
-                        kosong=excluded.kosong, stock=excluded.stock, updated_at=excluded.updated_at
-                """, (code, name, price, description, category, provider_code, gangguan, kosong, stock, now))
-                
-                stats['total'] += 1
-                if is_new:
-                    stats['new'] += 1
-                else:
-                    stats['updated'] += 1
-            
-            conn.commit()
-            
-            # Success message
-            success_msg = (
-                f"✅ **UPDATE PRODUK BERHASIL**\n\n"
-                f"📊 **Statistik:**\n"
-                f"├ Total Diproses: `{stats['total']}`\n"
-                f"├ 🆕 Produk Baru: `{stats['new']}`\n"
-                f"├ ✏️ Produk Diupdate: `{stats['updated']}`\n"
-                f"├ 🟢 Stok Tersedia: `{stats['active']}`\n"
-                f"├ 🚧 Stok Gangguan: `{stats['gangguan']}`\n"
-                f"├ 🔴 Stok Kosong: `{stats['kosong']}`\n"
-                f"└ ⏭️ Dilewati: `{stats['skipped']}`\n\n"
-                f"⏰ **Update:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
-            )
-            
-            await msg_func(success_msg, parse_mode='Markdown')
-            
-            await log_admin_action(user_id, "UPDATE_PRODUCTS", 
-                                f"Total: {stats['total']}, New: {stats['new']}, "
-                                f"Updated: {stats['updated']}, Active: {stats['active']}")
-                
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-            
     except Exception as e:
         logger.error(f"Update produk error: {e}")
         await safe_reply_message(update_or_query, f"❌ Error: {str(e)}")
 
-def categorize_product(name: str) -> str:
-    """Smart product categorization"""
-    name_lower = name.lower()
-    
-    categories = {
-        'Pulsa': ['pulsa'],
-        'Internet': ['data', 'internet', 'kuota', 'indihome'],
-        'Listrik': ['listrik', 'pln'],
-        'Game': ['game', 'voucher game', 'steam', 'mobile legend'],
-        'E-Money': ['emoney', 'gopay', 'dana', 'ovo', 'shopeepay'],
-        'Entertainment': ['spotify', 'youtube', 'netflix', 'disney+'],
-        'Telepon': ['telkom', 'telepon', 'tsel'],
-        'Paket Bonus': ['akrab', 'bonus']
-    }
-    
-    for category, keywords in categories.items():
-        if any(keyword in name_lower for keyword in keywords):
-            return category
-    
-    return 'Umum'
-
 async def sync_stok_from_provider(update_or_query, context):
-    """Stock synchronization dari provider"""
+    """Stock synchronization dari provider: jalankan catalog sync sekarang"""
     try:
         if hasattr(update_or_query, "message") and update_or_query.message:
             msg_func = update_or_query.message.reply_text
@@ -529,81 +350,27 @@ async def sync_stok_from_provider(update_or_query, context):
             user_id = update_or_query.from_user.id
 
         await msg_func("🔄 Sync stok dari provider...")
-        
-        # Validate config
-        if not hasattr(config, 'API_KEY_PROVIDER') or not config.API_KEY_PROVIDER:
-            await msg_func("❌ API Key tidak dikonfigurasi.")
-            return
-
-        api_key = config.API_KEY_PROVIDER
-        url = f"https://panel.khfy-store.com/api_v2/list_product?api_key={api_key}"
-
-        # Fetch data
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=30) as resp:
-                if resp.status != 200:
-                    await msg_func(f"❌ HTTP Error: {resp.status}")
-                    return
-                data = await resp.json()
 
-        if not data.get("ok", False):
-            await msg_func("❌ Response error dari provider.")
+        stats = await get_catalog_sync_service().run_now()
+        if not stats:
+            await msg_func("❌ Gagal sync stok dari provider.")
             return
 
-        produk_list = data.get("data", [])
-        if not produk_list:
-            await msg_func("⚠️ Tidak ada data stok.")
-            return
-
-        # Process stock sync
-        stats = {'updated': 0, 'active': 0, 'gangguan': 0, 'kosong': 0, 'not_found': 0}
-        
-        for prod in produk_list:
-            code = str(prod.get("kode_produk", "")).strip()
-            gangguan = int(prod.get("gangguan", 0))
-            kosong = int(prod.get("kosong", 0))
-            
-            if not code:
-                continue
-            
-            # Determine stock
-            stock = 0
-            if gangguan == 1:
-                stock = 0
-                stats['gangguan'] += 1
-            elif kosong == 1:
-                stock = 0
-                stats['kosong'] += 1
-            else:
-                stock = 100
-                stats['active'] += 1
-            
-            # Update database
-            result = execute_sql(
-                "UPDATE products SET stock = ?, gangguan = ?, kosong = ?, updated_at = ? WHERE code = ? AND status = 'active'",
-                (stock, gangguan, kosong, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), code)
-            )
-            
-            if result and result > 0:
-                stats['updated'] += 1
-            else:
-                stats['not_found'] += 1
-
-        # Report
         report = (
             f"✅ **SYNC STOK BERHASIL**\n\n"
             f"📊 **Hasil:**\n"
             f"├ Produk Diupdate: `{stats['updated']}`\n"
+            f"├ 💾 Tidak Berubah: `{stats['unchanged']}`\n"
             f"├ 🟢 Tersedia: `{stats['active']}`\n"
             f"├ 🚧 Gangguan: `{stats['gangguan']}`\n"
             f"├ 🔴 Kosong: `{stats['kosong']}`\n"
-            f"└ ❌ Tidak Ditemukan: `{stats['not_found']}`\n\n"
+            f"└ 🆕 Produk Baru: `{stats['new']}`\n\n"
             f"⏰ **Sync:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
         )
-        
+
         await msg_func(report, parse_mode='Markdown')
         await log_admin_action(user_id, "SYNC_STOCK", f"Updated: {stats['updated']}")
-        
+
     except Exception as e:
         logger.error(f"Sync stock error: {e}")
         await safe_reply_message(update_or_query, f"❌ Sync error: {str(e)}")
@@ -679,29 +446,26 @@ async def cek_stok_produk(update_or_query, context):
         await safe_reply_message(update_or_query, "❌ Gagal menganalisis stok.")
 
 async def listproduk(update_or_query, context):
-    """Product listing dengan pagination"""
+    """Product listing dengan keyset pagination (cursor di callback_data)"""
     try:
         if hasattr(update_or_query, "message") and update_or_query.message:
             msg_func = update_or_query.message.reply_text
         else:
             msg_func = update_or_query.edit_message_text
 
+        cursor = context.user_data.get('product_cursor')
         page = context.user_data.get('product_page', 0)
         limit = 20
-        offset = page * limit
         
-        products = fetch_all("""
-            SELECT code, name, price, category, stock, gangguan, kosong 
-            FROM products WHERE status='active' 
-            ORDER BY category, name 
-            LIMIT ? OFFSET ?
-        """, (limit, offset))
+        result = await database.db.get_products_page(cursor=cursor, limit=limit)
+        products = result['items']
         
-        if not products and page == 0:
+        if not products and not cursor:
             await msg_func("📭 Tidak ada produk aktif.")
             return
         elif not products:
             await msg_func("📭 Tidak ada produk lagi.")
+            context.user_data.pop('product_cursor', None)
             context.user_data['product_page'] = 0
             return
         
@@ -709,33 +473,37 @@ async def listproduk(update_or_query, context):
         message = f"📋 **DAFTAR PRODUK** (Halaman {page + 1})\n\n"
         
         current_category = None
-        for code, name, price, category, stock, gang, kos in products:
+        for product in products:
+            category = product['category'] or 'Umum'
             if category != current_category:
                 message += f"\n**{category.upper()}:**\n"
                 current_category = category
             
             # Status emoji
-            if gang == 1:
+            stock = product['stock'] or 0
+            if product['gangguan'] == 1:
                 emoji = "🚧"
-            elif kos == 1 or stock == 0:
+            elif product['kosong'] == 1 or stock == 0:
                 emoji = "🔴"
             elif stock < 10:
                 emoji = "🟡"
             else:
                 emoji = "🟢"
             
-            message += f"{emoji} `{code}` - {name} - Rp {price:,}\n"
+            message += f"{emoji} `{product['code']}` - {product['name']} - Rp {product['price']:,}\n"
         
         message += f"\n📄 Halaman {page + 1} | Total: {len(products)} produk"
         
-        # Pagination buttons
+        # Pagination buttons (cursor opaque, muat di callback_data)
         keyboard = []
-        if page > 0:
-            keyboard.append(InlineKeyboardButton("⬅️ Sebelumnya", callback_data="product_prev"))
+        page_cursors = context.user_data.setdefault('admin_product_page_cursors', {})
+        if result['prev_cursor']:
+            keyboard.append(InlineKeyboardButton("⬅️ Sebelumnya", callback_data=database.cursor_callback_data(
+                'product_page_', 'p', result['prev_cursor'], page_cursors)))
         
-        has_more = len(products) == limit
-        if has_more:
-            keyboard.append(InlineKeyboardButton("Selanjutnya ➡️", callback_data="product_next"))
+        if result['next_cursor']:
+            keyboard.append(InlineKeyboardButton("Selanjutnya ➡️", callback_data=database.cursor_callback_data(
+                'product_page_', 'n', result['next_cursor'], page_cursors)))
         
         if keyboard:
             keyboard = [keyboard]
@@ -884,7 +652,7 @@ async def edit_harga_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
         
     try:
-        new_price = float(update.message.text)
+        new_price = database.to_rupiah(update.message.text)
         product_code = context.user_data.get('selected_product')
         
         if new_price <= 0:
@@ -894,7 +662,7 @@ async def edit_harga_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Update price
         result = execute_sql(
             "UPDATE products SET price = ?, updated_at = ? WHERE code = ?",
-            (new_price, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), product_code)
+            (new_price, datetime.now(), product_code)
         )
         
         if result and result > 0:
@@ -936,7 +704,7 @@ async def edit_deskripsi_handler(update: Update, context: ContextTypes.DEFAULT_T
     # Update description
     result = execute_sql(
         "UPDATE products SET description = ?, updated_at = ? WHERE code = ?",
-        (new_description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), product_code)
+        (new_description, datetime.now(), product_code)
     )
     
     if result and result > 0:
@@ -975,7 +743,7 @@ async def edit_stock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Update stock
         result = execute_sql(
             "UPDATE products SET stock = ?, updated_at = ? WHERE code = ?",
-            (new_stock, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), product_code)
+            (new_stock, datetime.now(), product_code)
         )
         
         if result and result > 0:
@@ -1091,7 +859,7 @@ async def topup_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"💰 **Amount:** Rp {amount:,}\n"
             f"💳 **Method:** {method or 'Unknown'}\n"
             f"💎 **Saldo Sekarang:** Rp {balance or 0:,}\n"
-            f"⏰ **Waktu:** {created_at}\n\n"
+            f"⏰ **Waktu:** {database.format_timestamp(created_at, '%d-%m-%Y %H:%M')}\n\n"
             f"**Pilih aksi:**"
         )
 
@@ -1129,7 +897,7 @@ async def approve_topup_handler(update: Update, context: ContextTypes.DEFAULT_TY
         # Update topup status
         execute_sql(
             "UPDATE topups SET status = 'approved', approved_at = ?, approved_by = ? WHERE id = ?",
-            (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), admin_id, topup_id)
+            (datetime.now(), admin_id, topup_id)
         )
         
         # Update user balance
@@ -1187,7 +955,7 @@ async def reject_topup_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         # Update topup status
         result = execute_sql(
             "UPDATE topups SET status = 'rejected', approved_at = ?, approved_by = ? WHERE id = ? AND status = 'pending'",
-            (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), admin_id, topup_id)
+            (datetime.now(), admin_id, topup_id)
         )
         
         if result and result > 0:
@@ -1348,7 +1116,7 @@ async def confirm_balance_handler(update: Update, context: ContextTypes.DEFAULT_
         return ConversationHandler.END
         
     try:
-        amount = float(update.message.text)
+        amount = database.to_rupiah(update.message.text)
         user_id = context.user_data.get('balance_user_id')
         action = context.user_data.get('balance_action')
         current_balance = context.user_data.get('current_balance', 0)
@@ -1497,23 +1265,21 @@ async def backup_database_from_query(query, context):
     await query.answer()
     
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_database_{timestamp}.db"
+        # Online backup bertahap di executor (tidak memblokir event loop)
+        backup_filename = await database.db.backup_database()
+        if not backup_filename:
+            raise RuntimeError("backup_database failed")
+        await database.db.rotate_backups()
         
-        # Create backup
-        shutil.copy2(DB_PATH, backup_filename)
-        
-        # Send backup file
+        # Send backup file (tetap disimpan di folder backup, ikut rotasi)
         with open(backup_filename, 'rb') as backup_file:
             await query.message.reply_document(
                 document=backup_file,
+                filename=os.path.basename(backup_filename),
                 caption=f"💾 **BACKUP DATABASE**\n\nBackup created: {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}",
                 parse_mode='Markdown'
             )
         
-        # Cleanup
-        os.remove(backup_filename)
-        
         await log_admin_action(query.from_user.id, "BACKUP_DATABASE", f"File: {backup_filename}")
         
     except Exception as e:
@@ -1571,19 +1337,78 @@ async def system_health_from_query(query, context):
         await query.message.reply_text("❌ Gagal memuat system health.")
 
 async def cleanup_data_from_query(query, context):
-    """Data cleanup functionality"""
+    """Preview data cleanup, minta konfirmasi sebelum menghapus"""
     await query.answer()
     
     try:
-        # Cleanup old data (example: orders older than 30 days)
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+        cleanup_days = json_config.get('database.cleanup_days', 30)
+        preview = await database.db.preview_cleanup(cleanup_days)
+        if not preview:
+            raise RuntimeError("preview cleanup gagal")
+        delete = preview['delete']
+        history_days = preview['history_days']
         
-        deleted_orders = execute_sql("DELETE FROM topups WHERE status != 'pending' AND created_at < ?", (thirty_days_ago,)) or 0
+        message = (
+            f"🧹 **KONFIRMASI DATA CLEANUP**\n\n"
+            f"🗑️ **Akan dihapus permanen:**\n"
+            f"├ Topup > {cleanup_days} hari: `{delete.get('topups', 0) + delete.get('legacy_topups', 0)}` data\n"
+            f"├ Notifikasi & log > {cleanup_days} hari: `{delete.get('notifications', 0) + delete.get('system_logs', 0) + delete.get('admin_logs', 0)}` data\n"
+        )
+        if preview['archive']:
+            archive = preview['archive_counts']
+            message += (
+                f"\n📦 **Dipindah ke arsip (> {history_days} hari):**\n"
+                f"├ Order: `{archive.get('orders', 0)}` data\n"
+                f"├ Transaksi: `{archive.get('transactions', 0)}` data\n"
+            )
+        else:
+            message += (
+                f"├ Order > {history_days} hari: `{delete.get('orders', 0)}` data\n"
+                f"├ Transaksi > {history_days} hari: `{delete.get('transactions', 0)}` data\n"
+            )
+        message += "\n⚠️ Lanjutkan cleanup?"
+        
+        await safe_edit_message_text(
+            query,
+            message,
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("✅ Ya, bersihkan", callback_data="admin_cleanup_confirm")],
+                [InlineKeyboardButton("⬅️ Kembali", callback_data="admin_back")]
+            ])
+        )
+        
+    except Exception as e:
+        logger.error(f"Cleanup preview error: {e}")
+        await safe_edit_message_text(
+            query,
+            "❌ Gagal memuat preview cleanup.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("⬅️ Kembali", callback_data="admin_back")]
+            ])
+        )
+
+async def confirm_cleanup_from_query(query, context):
+    """Jalankan data cleanup setelah dikonfirmasi admin"""
+    await query.answer()
+    
+    try:
+        # Cleanup bertahap per batch (tidak menahan write lock order lain);
+        # orders/transactions memakai ARCHIVE_AFTER_DAYS, bukan cleanup_days
+        cleanup_days = json_config.get('database.cleanup_days', 30)
+        result = await database.db.cleanup_old_data(cleanup_days)
+        if not result:
+            raise RuntimeError("cleanup dibatalkan")
+        orders = result.get('orders', 0) + result.get('archived_orders', 0)
+        transactions = result.get('transactions', 0) + result.get('archived_transactions', 0)
         
         message = (
             f"🧹 **DATA CLEANUP BERHASIL**\n\n"
             f"📊 **Data yang dibersihkan:**\n"
-            f"├ Topup lama: `{deleted_orders}` data\n"
+            f"├ Order {'diarsipkan' if 'archived_orders' in result else 'dihapus'}: `{orders}` data\n"
+            f"├ Transaksi {'diarsipkan' if 'archived_transactions' in result else 'dihapus'}: `{transactions}` data\n"
+            f"├ Topup: `{result.get('topups', 0) + result.get('legacy_topups', 0)}` data\n"
+            f"├ Notifikasi & log: `{result.get('notifications', 0) + result.get('system_logs', 0) + result.get('admin_logs', 0)}` data\n"
+            f"├ Halaman dikembalikan: `{result.get('vacuum_pages', 0)}`\n"
             f"⏰ **Waktu:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
         )
         
@@ -1595,7 +1420,7 @@ async def cleanup_data_from_query(query, context):
             ])
         )
         
-        await log_admin_action(query.from_user.id, "DATA_CLEANUP", f"Orders: {deleted_orders}")
+        await log_admin_action(query.from_user.id, "DATA_CLEANUP", f"Orders: {orders}, Transactions: {transactions}")
         
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
@@ -1614,6 +1439,12 @@ async def show_stats_menu(query, context):
         total_products = safe_db_call('get_total_products', 0) or fetch_one("SELECT COUNT(*) FROM products WHERE status='active'")[0] or 0
         total_orders = safe_db_call('get_total_orders', 0) or fetch_one("SELECT COUNT(*) FROM topups WHERE status='approved'")[0] or 0
         total_revenue = safe_db_call('get_total_revenue', 0) or fetch_one("SELECT COALESCE(SUM(amount), 0) FROM topups WHERE status='approved'")[0] or 0
+        daily_stats = safe_db_call('get_daily_stats', [], 7) or []
+        
+        daily_lines = "".join(
+            f"├ `{day['date']}`: {day['orders']} order, Rp {day['revenue'] or 0:,.0f}\n"
+            for day in daily_stats
+        )
         
         message = (
             "📊 **STATISTIK BOT**\n\n"
@@ -1621,7 +1452,8 @@ async def show_stats_menu(query, context):
             f"📦 **Active Products:** `{total_products}`\n"
             f"🛒 **Total Orders:** `{total_orders}`\n"
             f"💰 **Total Revenue:** `Rp {total_revenue:,}`\n\n"
-            f"⏰ **Update:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
+            + (f"📈 **7 Hari Terakhir:**\n{daily_lines}\n" if daily_lines else "")
+            + f"⏰ **Update:** {datetime.now().strftime('%d-%m-%Y %H:%M')}"
         )
         
         await safe_edit_message_text(
@@ -1668,19 +1500,24 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         elif data == "back_to_users":
             await show_users_menu(query, context)
             
-        # Product pagination
-        elif data == "product_prev":
-            context.user_data['product_page'] = max(0, context.user_data.get('product_page', 0) - 1)
-            await listproduk(query, context)
-            
-        elif data == "product_next":
-            context.user_data['product_page'] = context.user_data.get('product_page', 0) + 1
+        # Product pagination (keyset cursor)
+        elif data.startswith("product_page_"):
+            cursor = database.callback_cursor(data[len("product_page_"):],
+                                              context.user_data.get('admin_product_page_cursors', {}))
+            direction, _ = database.decode_cursor(cursor)
+            page = context.user_data.get('product_page', 0)
+            context.user_data['product_page'] = max(0, page - 1) if direction == 'p' else page + 1
+            context.user_data['product_cursor'] = cursor
             await listproduk(query, context)
             
         # Broadcast confirmation
         elif data == "confirm_broadcast":
             await confirm_broadcast_handler(update, context)
             
+        # Cleanup confirmation
+        elif data == "admin_cleanup_confirm":
+            await confirm_cleanup_from_query(query, context)
+            
         # Main features
         elif data in ["admin_update", "admin_sync_stock", "admin_check_stock", "admin_list_produk", 
                      "admin_edit_produk", "admin_topup", "admin_manage_balance", "admin_users",
@@ -1702,6 +1539,12 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
                 "admin_cleanup": cleanup_data_from_query
             }
             
+            if data == "admin_list_produk":
+                # Mulai dari halaman pertama
+                context.user_data.pop('product_cursor', None)
+                context.user_data.pop('admin_product_page_cursors', None)
+                context.user_data['product_page'] = 0
+            
             handler = feature_handlers.get(data)
             if handler:
                 await handler(query, context)
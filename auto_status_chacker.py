@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any
 import database
 import config
+from khfypay_client import get_khfypay_client
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,7 @@ class KhfyPayStatusChecker:
         self.is_running = False
         self.api_key = getattr(config, 'KHFYPAY_API_KEY', '')
         self.base_url = "https://panel.khfy-store.com/api_v2"
+        self.client = get_khfypay_client()
     
     async def start(self):
         """Start auto status checker"""
@@ -91,21 +93,16 @@ class KhfyPayStatusChecker:
                 logger.error("KhfyPay API key not configured")
                 return None
             
-            url = f"{self.base_url}/history"
             params = {
                 "api_key": self.api_key,
                 "refid": ref_id
             }
             
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        logger.error(f"KhfyPay API error: {response.status}")
-                        return None
-                        
+            return await self.client.request('history', params)
+            
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"KhfyPay API error: {e.status}")
+            return None
         except asyncio.TimeoutError:
             logger.error(f"⏰ Timeout checking KhfyPay status for {ref_id}")
             return None
@@ -125,50 +122,45 @@ class KhfyPayStatusChecker:
             if new_status == order['status']:
                 return
             
-            # Update order status using database function
-            success = database.update_order_status(
-                order_id=order_id,
-                status=new_status,
-                sn=sn,
-                note=note
-            )
+            # Update order status using database function (gagal: status + refund satu transaksi)
+            if new_status == 'failed':
+                success = await self.process_auto_refund(order, sn=sn, note=note)
+            else:
+                success = database.update_order_status(
+                    order_id=order_id,
+                    status=new_status,
+                    sn=sn,
+                    note=note
+                )
             
             if success:
                 logger.info(f"✅ Order {order_id} auto-updated to: {new_status}")
                 
                 # Send notification to user
                 await self.send_status_notification(order, new_status, sn, note)
-                
-                # Process refund if failed
-                if new_status == 'failed':
-                    await self.process_auto_refund(order)
             else:
                 logger.error(f"❌ Failed to auto-update order {order_id}")
                 
         except Exception as e:
             logger.error(f"❌ Error updating order status: {e}")
     
-    async def process_auto_refund(self, order: Dict[str, Any]):
-        """Process automatic refund for failed orders"""
+    async def process_auto_refund(self, order: Dict[str, Any], sn: str = None, note: str = "") -> bool:
+        """Tandai order gagal dan refund (sekali saja, lihat database.fail_order_with_refund)"""
         try:
             user_id = order['user_id']
             amount = order['price']
             
-            # Refund user balance
-            success = database.update_user_balance(
-                user_id,
-                amount,
-                f"Auto-refund for failed order {order['id']}",
-                "refund"
-            )
+            success = database.fail_order_with_refund(order['id'], note=note or "", sn=sn or "")
             
             if success:
                 logger.info(f"💰 Auto-refund processed for order {order['id']}: {amount} to user {user_id}")
             else:
-                logger.error(f"❌ Failed to process auto-refund for order {order['id']}")
+                logger.info(f"ℹ️ Order {order['id']} already closed, no auto-refund")
+            return success
                 
         except Exception as e:
             logger.error(f"❌ Error processing auto-refund: {e}")
+            return False
     
     async def send_status_notification(self, order: Dict[str, Any], new_status: str, sn: str = None, note: str = ""):
         """Kirim notifikasi status update ke user"""
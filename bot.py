@@ -32,6 +32,7 @@ from telegram.ext import (
 # Custom Module Imports
 import config
 import database
+from khfypay_client import warm_up_khfypay_client, close_khfypay_client
 
 # ==================== SINGLETON PATTERN UNTUK MENCEGAH MULTIPLE INSTANCE ====================
 class BotSingleton:
@@ -284,7 +285,7 @@ async def show_order_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     try:
         # Get user orders
-        orders = database.get_user_orders(user_id, limit=10)
+        orders = await database.db.get_user_orders(user_id, limit=10)
         
         if not orders:
             await send_modern_message(
@@ -312,13 +313,7 @@ async def show_order_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
             }.get(order['status'], '📦')
             
             # Format date
-            try:
-                if isinstance(order['created_at'], str):
-                    order_date = datetime.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m %H:%M')
-                else:
-                    order_date = order['created_at'].strftime('%d/%m %H:%M')
-            except:
-                order_date = "N/A"
+            order_date = database.format_timestamp(order['created_at'], '%d/%m %H:%M')
             
             orders_text += (
                 f"{status_emoji} **Order #{order['id']}**\n"
@@ -407,7 +402,7 @@ async def show_topup_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
             transactions_text += (
                 f"{status_emoji} **Topup #{transaction.get('id', 'N/A')}**\n"
                 f"💳 Rp {transaction.get('amount', 0):,}\n"
-                f"⏰ {transaction.get('created_at', 'N/A')}\n"
+                f"⏰ {database.format_timestamp(transaction.get('created_at'), '%d/%m/%Y %H:%M')}\n"
                 f"📊 {transaction.get('status', 'pending').upper()}\n"
                 f"━━━━━━━━━━━━━━━━━━━━\n"
             )
@@ -456,7 +451,7 @@ async def show_all_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Get user orders for combined history
-        orders = database.get_user_orders(user_id, limit=15)
+        orders = await database.db.get_user_orders(user_id, limit=15)
         
         if not orders:
             await send_modern_message(
@@ -483,13 +478,7 @@ async def show_all_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'refunded': '💰'
             }.get(order['status'], '📦')
             
-            try:
-                if isinstance(order['created_at'], str):
-                    order_date = datetime.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m %H:%M')
-                else:
-                    order_date = order['created_at'].strftime('%d/%m %H:%M')
-            except:
-                order_date = order['created_at']
+            order_date = database.format_timestamp(order['created_at'], '%d/%m %H:%M')
             
             history_text += (
                 f"{status_emoji} **{order['product_name']}**\n"
@@ -570,8 +559,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Get or create user in database
         saldo = 0
         try:
-            user_data = database.get_or_create_user(str(user.id), user.username, user.full_name)
-            saldo = database.get_user_saldo(str(user.id))
+            user_data = await database.db.get_or_create_user(str(user.id), user.username, user.full_name)
+            saldo = await database.db.get_user_saldo(str(user.id))
         except Exception as e:
             logger.error(f"Error getting user saldo: {e}")
             saldo = 0
@@ -661,7 +650,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     saldo = 0
     try:
-        saldo = database.get_user_saldo(str(user.id))
+        saldo = await database.db.get_user_saldo(str(user.id))
     except Exception as e:
         logger.error(f"Error getting user saldo: {e}")
         saldo = 0
@@ -708,7 +697,7 @@ async def show_saldo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     saldo = 0
     try:
-        saldo = database.get_user_saldo(str(user.id))
+        saldo = await database.db.get_user_saldo(str(user.id))
     except Exception as e:
         logger.error(f"Error getting user saldo: {e}")
         saldo = 0
@@ -754,7 +743,8 @@ async def show_help_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Pilih kategori produk\n" 
         "3. Pilih produk yang diinginkan\n"
         "4. Masukkan nomor tujuan\n"
-        "5. Konfirmasi & bayar dengan saldo\n\n"
+        "5. Konfirmasi & bayar dengan saldo\n"
+        "🔎 Cepat: ketik `/cari <nama produk>`\n\n"
         
         "💳 **Cara Top Up:**\n"
         "1. Pilih → `Top Up Saldo`\n"
@@ -933,12 +923,21 @@ async def post_init(application: Application):
             initialize_stock_sync()
             logger.info("✅ Background stock sync initialized")
         
+        # START DATABASE ROLLUP REFRESH
+        database.initialize_rollup_refresh()
+        
+        # START DATABASE BACKUP SERVICE (bot.json database.backup_interval_hours)
+        database.initialize_backup_service()
+        
+        # WARM UP KHFYPAY CONNECTION POOL (DNS + TLS sebelum order pertama)
+        await warm_up_khfypay_client()
+        
         bot = await application.bot.get_me()
         
         try:
-            total_users = database.get_total_users()
-            total_products = database.get_total_products()
-            pending_topups = database.get_pending_topups_count()
+            total_users = await database.db.get_total_users()
+            total_products = await database.db.get_total_products()
+            pending_topups = await database.db.get_pending_topups_count()
         except:
             total_users = 0
             total_products = 0
@@ -976,7 +975,7 @@ async def post_init(application: Application):
             print("📍 Auto Timeout: 5 minutes + Auto Refund")
             print("📍 Modern UI: Animations & Progress Bars")
         if STOK_AVAILABLE:
-            print("📍 Background Stock Sync: Active (5 minutes interval)")
+            print(f"📍 Background Catalog Sync: Active ({getattr(config, 'STOCK_SYNC_INTERVAL_MINUTES', 5)} minutes interval)")
         print("📍 Bot is now running and waiting for messages...")
         print("📍 Try sending /start to your bot")
         print("=" * 60)
@@ -984,6 +983,13 @@ async def post_init(application: Application):
     except Exception as e:
         logger.error(f"Error in post_init: {e}")
 
+async def post_shutdown(application: Application):
+    """Tutup koneksi provider saat bot berhenti"""
+    try:
+        await close_khfypay_client()
+    except Exception as e:
+        logger.error(f"Error in post_shutdown: {e}")
+
 # ==================== SIGNAL HANDLERS ====================
 def setup_signal_handlers():
     """Setup signal handlers for graceful shutdown"""
@@ -1038,6 +1044,7 @@ def main():
             .token(BOT_TOKEN)\
             .persistence(persistence)\
             .post_init(post_init)\
+            .post_shutdown(post_shutdown)\
             .build()
         
         print("✅ Application built successfully")
@@ -1139,6 +1146,10 @@ def main():
         # Cleanup
         bot_singleton = BotSingleton.get_instance()
         bot_singleton.remove_pid_file()
+        try:
+            database.close_database()
+        except Exception as e:
+            logger.error(f"Error closing database pool: {e}")
         print("🧹 Cleanup completed")
 
 if __name__ == "__main__":
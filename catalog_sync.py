@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Catalog Sync - satu-satunya penulis kolom produk yang berasal dari provider
+
+Katalog diambil lewat catalog cache (khfypay_client.get_catalog_cache) sehingga
+fetch terjadwal, revalidasi menu, dan tombol admin berbagi satu request
+in-flight. Setiap fetch sukses ditulis ke DB (database.sync_provider_products,
+hanya baris yang fingerprint-nya berubah) lalu versi katalog dipublikasikan ke
+tabel settings ('catalog_version'). Payload yang identik dengan run sebelumnya
+tidak menyentuh DB, selama signature tabel products (COUNT, MAX(updated_at),
+SUM(stock)) juga sama dengan setelah apply terakhir. Jika DB berubah di luar
+sync (mis. stock dikurangi order lokal), diff dihitung ulang terhadap isi DB.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import config
+import database
+from khfypay_client import get_catalog_cache
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_CATEGORIES = {
+    'Pulsa': ['pulsa'],
+    'Internet': ['data', 'internet', 'kuota', 'indihome'],
+    'Listrik': ['listrik', 'pln'],
+    'Game': ['game', 'voucher game', 'steam', 'mobile legend'],
+    'E-Money': ['emoney', 'gopay', 'dana', 'ovo', 'shopeepay'],
+    'Entertainment': ['spotify', 'youtube', 'netflix', 'disney+'],
+    'Telepon': ['telkom', 'telepon', 'tsel'],
+    'Paket Bonus': ['akrab', 'bonus']
+}
+
+
+def categorize_product(name: str) -> str:
+    """Smart product categorization"""
+    name_lower = name.lower()
+    for category, keywords in PRODUCT_CATEGORIES.items():
+        if any(keyword in name_lower for keyword in keywords):
+            return category
+    return 'Umum'
+
+
+def _flag(value) -> int:
+    try:
+        return 1 if int(value) else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def normalize_provider_products(data: Any) -> List[Dict[str, Any]]:
+    """Response list_product -> list produk dengan key kolom tabel products.
+
+    Menerima ``{"ok": true, "data": [...]}`` maupun list langsung; field
+    kode_produk/nama_produk/harga_final (api_v2) atau code/name/price/status.
+    Produk tanpa kode, nama atau harga dilewati.
+    """
+    if isinstance(data, dict):
+        if data.get('ok') is False:
+            return []
+        data = data.get('data', [])
+    if not isinstance(data, list):
+        return []
+
+    products = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        code = str(item.get('kode_produk') or item.get('code') or item.get('kode') or '').strip()
+        name = str(item.get('nama_produk') or item.get('name') or item.get('nama') or '').strip()
+        price = database.to_rupiah(item.get('harga_final') or item.get('price') or item.get('harga') or 0)
+        if not code or not name or price <= 0:
+            continue
+
+        gangguan = _flag(item.get('gangguan', 0))
+        kosong = _flag(item.get('kosong', 0))
+        status = str(item.get('status', '')).lower()
+        if status == 'problem':
+            gangguan = 1
+        elif status in ('empty', 'inactive'):
+            kosong = 1
+
+        products.append({
+            'code': code,
+            'name': name,
+            'price': price,
+            'description': str(item.get('deskripsi') or item.get('description') or '').strip() or f"Produk {name}",
+            'category': categorize_product(name),
+            'provider': str(item.get('kode_provider') or item.get('provider') or '').strip(),
+            'gangguan': gangguan,
+            'kosong': kosong,
+            'stock': 0 if gangguan or kosong else 100,
+        })
+    return products
+
+
+class CatalogSyncService:
+    """Sinkronisasi katalog provider terjadwal (config.STOCK_SYNC_INTERVAL_MINUTES)"""
+
+    def __init__(self, interval_minutes: float = None):
+        self.interval_minutes = interval_minutes or getattr(config, 'STOCK_SYNC_INTERVAL_MINUTES', 5)
+        self.cache = get_catalog_cache()
+        self.cache.add_listener(self.apply)
+        self.catalog_version = self._stored_catalog_version()
+        self.runs = 0
+        self.payload_hash: Optional[str] = None
+        self.products_signature: Optional[tuple] = None
+        self.last_synced_at: Optional[datetime] = None
+        self.last_result: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _stored_catalog_version() -> int:
+        """Lanjutkan dari versi yang sudah dipublikasikan agar tidak turun setelah restart"""
+        try:
+            return int(database.get_setting('catalog_version', 0) or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def payload_hash_of(data: Any) -> str:
+        raw = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def apply(self, data: Any) -> Dict[str, int]:
+        """Listener catalog cache (dijalankan di thread): tulis perubahan katalog ke DB + publish versi"""
+        payload_hash = self.payload_hash_of(data)
+        if payload_hash == self.payload_hash and self.last_result:
+            signature = database.get_products_signature()
+            if signature is not None and signature == self.products_signature:
+                stats = dict(self.last_result, new=0, updated=0, deactivated=0,
+                             unchanged=self.last_result.get('total', 0))
+                self._finish_run(stats, changed=False)
+                logger.info("⏭️ Catalog sync: payload and products unchanged, DB not touched")
+                return stats
+
+        products = normalize_provider_products(data)
+        if not products:
+            logger.warning("⚠️ Provider catalog empty / invalid, DB not touched")
+            return {}
+
+        stats = database.sync_provider_products(products)
+        if not stats:
+            return {}
+        signature = stats.pop('signature', None)
+        stats['active'] = sum(1 for p in products if not p['gangguan'] and not p['kosong'])
+        stats['gangguan'] = sum(1 for p in products if p['gangguan'])
+        stats['kosong'] = sum(1 for p in products if p['kosong'] and not p['gangguan'])
+        stats['skipped'] = len(data.get('data', []) if isinstance(data, dict) else data) - len(products)
+
+        self.payload_hash = payload_hash
+        self.products_signature = signature
+        self._finish_run(stats, changed=bool(stats['new'] or stats['updated'] or stats['deactivated']))
+        logger.info(f"✅ Catalog sync v{self.catalog_version}: {stats}")
+        return stats
+
+    def _finish_run(self, stats: Dict[str, int], changed: bool):
+        """Catat hasil run; versi katalog hanya naik (dan dipublikasikan) jika DB berubah"""
+        self.runs += 1
+        self.last_synced_at = datetime.now()
+        self.last_result = stats
+        if changed or not self.catalog_version:
+            self.catalog_version += 1
+            database.update_setting('catalog_version', self.catalog_version, 'Versi katalog provider terakhir')
+
+    async def run_now(self) -> Optional[Dict[str, int]]:
+        """Sync segera (tombol admin / jadwal); ikut fetch yang sedang berjalan. None jika gagal"""
+        runs = self.runs
+        await asyncio.shield(self.cache.refresh())
+        if self.runs == runs:
+            return None
+        return dict(self.last_result)
+
+    def revalidate(self) -> bool:
+        """Non-blocking refresh jika katalog sudah lewat PRODUCT_CACHE_TIMEOUT"""
+        return self.cache.revalidate()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_now()
+                await asyncio.sleep(self.interval_minutes * 60)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Background catalog sync error: {e}")
+                await asyncio.sleep(60)
+
+    def start(self) -> bool:
+        """Mulai loop terjadwal (panggil dari event loop, mis. post_init)"""
+        if self._task is not None and not self._task.done():
+            return True
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        logger.info(f"✅ Background catalog sync initialized ({self.interval_minutes} min interval)")
+        return True
+
+
+_service: Optional[CatalogSyncService] = None
+
+
+def get_catalog_sync_service() -> CatalogSyncService:
+    """Instance service bersama (listener DB terdaftar saat pertama dibuat)"""
+    global _service
+    if _service is None:
+        _service = CatalogSyncService()
+    return _service
+
+
+def initialize_catalog_sync():
+    """Start background catalog sync jika AUTO_STOCK_SYNC"""
+    if not getattr(config, 'AUTO_STOCK_SYNC', True):
+        return
+    try:
+        get_catalog_sync_service().start()
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize catalog sync: {e}")
@@ -117,19 +117,38 @@ LOG_CHANNEL_ID = "-1001234567890"
 AUTO_BACKUP = True
 BACKUP_INTERVAL_HOURS = 24
 MAX_BACKUP_FILES = 7
+BACKUP_COMPRESS = True          # simpan backup sebagai .db.gz
+BACKUP_PAGES_PER_STEP = 1024    # halaman per step sqlite backup API
+BACKUP_STEP_PAUSE = 0.01        # detik jeda antar step backup
 
 DB_POOL_SIZE = 5
 DB_MAX_OVERFLOW = 10
 DB_POOL_RECYCLE = 3600
+DB_WRITE_TIMEOUT = 60  # detik, batas tunggu operasi tulis di write queue
 
 # Cache untuk produk dan stok
 CACHE_TIMEOUT = 300  # 5 minutes
 PRODUCT_CACHE_TIMEOUT = 60  # 1 minute untuk data produk
+SETTINGS_REFRESH_INTERVAL = 5  # detik, cek perubahan tabel settings / bot.json
+CATALOG_REFRESH_INTERVAL = 5   # detik, cek perubahan tabel products dari proses lain
+USER_CACHE_SIZE = 1000         # jumlah user maksimal di LRU cache
+USER_CACHE_TTL = 30            # detik, batas umur cache (perubahan dari proses lain)
+ROLLUP_REFRESH_MINUTES = 5     # interval refresh tabel rollup harian/per jam
 
 # ==================== EXTERNAL API SETTINGS ====================
 API_TIMEOUT = 30
 MAX_RETRIES = 3
 KHFYPAY_TIMEOUT = 60  # Timeout khusus KhfyPay
+KHFYPAY_ENDPOINT_TIMEOUTS = {     # Timeout per endpoint (detik), default = KHFYPAY_TIMEOUT
+    'list_product': 30,
+    'trx': 60,
+    'history': 20,
+    'cek_stock_akrab': 15,
+}
+KHFYPAY_STOCK_URL = "https://panel.khfy-store.com/api_v3/cek_stock_akrab"
+KHFYPAY_POOL_SIZE = 20             # koneksi keep-alive maksimal ke provider
+KHFYPAY_KEEPALIVE_SECONDS = 60     # koneksi idle dibiarkan terbuka selama ini
+KHFYPAY_DNS_CACHE_SECONDS = 300    # cache hasil DNS panel.khfy-store.com
 
 # ==================== ORDER SPECIFIC SETTINGS ====================
 # Validasi nomor telepon
@@ -171,8 +190,22 @@ DEBUG = True
 
 # Auto Cleanup
 CLEANUP_INTERVAL_HOURS = 24
+RETENTION_BATCH_SIZE = 500       # baris per transaksi saat cleanup data lama
+RETENTION_USER_BATCH_SIZE = 50   # user per transaksi (delete cascade ke orders dll)
+RETENTION_BATCH_PAUSE = 0.05     # detik jeda antar batch agar order tidak tertahan
+RETENTION_VACUUM_PAGES = 500     # halaman per langkah PRAGMA incremental_vacuum
+ARCHIVE_OLD_DATA = True          # cleanup memindah orders/transactions lama ke archive_YYYY.db
+ARCHIVE_AFTER_DAYS = 90          # umur minimal (hari) data yang dipindah oleh archive_old_data
+ARCHIVE_DIR = ""                 # kosong = folder yang sama dengan DB_PATH
 MAX_LOGFILE_AGE_DAYS = 7
 
+# Buffered log sink (system_logs / admin_logs)
+LOG_BUFFER_ENABLED = True
+LOG_BUFFER_SIZE = 10000           # maksimal baris di antrian memori
+LOG_FLUSH_ROWS = 100              # flush setiap N baris
+LOG_FLUSH_INTERVAL_MS = 500       # atau setiap T milidetik
+LOG_OVERFLOW_POLICY = "drop_oldest"  # drop_oldest / drop_new saat antrian penuh
+
 # File Paths
 PROOF_UPLOAD_DIR = "proofs"
 LOG_FILE = "bot.log"
@@ -8,16 +8,825 @@ FIXED FOR ORDER_HANDLER COMPATIBILITY - COMPLETE VERSION
 import sqlite3
 import logging
 import os
+import re
 import json
 import time
 import random
+import base64
+import hashlib
+import gzip
+import shutil
 from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from contextlib import contextmanager
 from typing import Dict, List, Optional, Any, Union
+from types import MappingProxyType
+from enum import Enum
+from collections import OrderedDict
 import threading
+import asyncio
+import functools
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import queue
+
+import config
+from config_loader import json_config
 
 logger = logging.getLogger(__name__)
 
+# ==================== CONNECTION POOL ====================
+class ConnectionPool:
+    """Pool koneksi SQLite yang persisten (size + overflow, health check, recycle)"""
+
+    # PRAGMA per-koneksi, dijalankan sekali saat koneksi dibuat
+    CONNECTION_PRAGMAS = [
+        # auto_vacuum harus diset sebelum journal_mode menulis header database baru
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        "PRAGMA foreign_keys = ON",
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA cache_size = -100000",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA busy_timeout = 10000",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 268435456",
+    ]
+
+    def __init__(self, db_path: str, pool_size: int = 5, max_overflow: int = 10,
+                 recycle: int = 3600, checkout_timeout: float = 30.0):
+        self.db_path = db_path
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.recycle = recycle
+        self.checkout_timeout = checkout_timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._created_at: Dict[int, float] = {}
+        self._checked_out = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._closed = False
+        self._recycle_before = 0.0
+
+    def create_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=30.0,
+            detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        created = self._created_at.get(id(conn))
+        if created is None or created < self._recycle_before or (self.recycle and time.monotonic() - created > self.recycle):
+            return False
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.OperationalError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._checked_out += 1
+                    break
+                if self._checked_out < self.pool_size + self.max_overflow:
+                    conn = None
+                    self._checked_out += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Connection pool exhausted ({self.pool_size}+{self.max_overflow} in use)"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self.create_connection()
+            return conn
+        except Exception:
+            with self._cond:
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            conn = None
+
+        with self._cond:
+            self._checked_out -= 1
+            if conn is not None:
+                if not self._closed and len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                else:
+                    self._discard(conn)
+            self._cond.notify()
+
+    def current_connection(self) -> Optional[sqlite3.Connection]:
+        """Koneksi yang sedang dipinjam thread ini (jika ada)"""
+        return getattr(self._local, 'conn', None)
+
+    def after_commit(self, callback):
+        """Jalankan callback setelah transaksi terluar thread ini selesai"""
+        if getattr(self._local, 'conn', None) is None:
+            callback()
+        else:
+            self._local.callbacks.append(callback)
+
+    @staticmethod
+    def _run_callbacks(callbacks: list):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {e}")
+
+    @contextmanager
+    def connection(self):
+        """Pinjam koneksi; pemanggilan bersarang di thread yang sama memakai koneksi yang sama"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # Nested call: transaksi dikelola oleh pemanggil terluar
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        self._local.callbacks = []
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+        finally:
+            callbacks = self._local.callbacks
+            self._local.conn = None
+            self._local.depth = 0
+            self._local.callbacks = []
+            self._checkin(conn)
+            self._run_callbacks(callbacks)
+
+    def status(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out
+            }
+
+    def recycle_all(self):
+        """Buang koneksi idle; koneksi yang sedang dipinjam dibuang saat checkout berikutnya (mis. setelah migrasi schema)"""
+        with self._cond:
+            self._recycle_before = time.monotonic()
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def close(self):
+        """Tutup semua koneksi idle (dipanggil saat shutdown)"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+# ==================== SINGLE-WRITER QUEUE ====================
+class WriteQueue:
+    """Thread writer tunggal: operasi tulis diantrikan lalu di-commit berkelompok (group commit).
+
+    Setiap operasi adalah ``op(conn, *args, **kwargs)`` dan dijalankan di dalam
+    SAVEPOINT sendiri, sehingga kegagalan satu operasi tidak membatalkan operasi
+    lain di batch yang sama. Future baru diselesaikan setelah COMMIT berhasil.
+    """
+
+    _STOP = object()
+
+    def __init__(self, connection_factory, max_batch: int = 200):
+        self._connection_factory = connection_factory
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        self._callbacks: list = []
+        self.stats = {'batches': 0, 'operations': 0, 'failed': 0}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._stopped:
+                raise sqlite3.OperationalError("Write queue is stopped")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def in_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def after_commit(self, callback):
+        """Daftarkan callback (dari dalam op) yang dijalankan setelah batch di-commit"""
+        self._callbacks.append(callback)
+
+    def submit(self, op, *args, **kwargs) -> Future:
+        """Antrikan operasi tulis; hasilnya (row id / return value) lewat Future"""
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((op, args, kwargs, future))
+        return future
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        batch = []
+        conn = None
+        error: Exception = sqlite3.OperationalError("Write queue is stopped")
+        try:
+            conn = self._connection_factory()
+            # Transaksi dikelola manual: BEGIN IMMEDIATE ... COMMIT per batch
+            conn.isolation_level = None
+            while True:
+                batch = self._next_batch()
+                stop = any(item is self._STOP for item in batch)
+                batch = [item for item in batch if item is not self._STOP]
+                if batch:
+                    self._commit_batch(conn, batch)
+                batch = []
+                if stop:
+                    break
+        except Exception as e:
+            logger.error(f"❌ DB writer thread died: {e}", exc_info=True)
+            error = sqlite3.OperationalError(f"DB writer thread died: {e}")
+        finally:
+            # Jangan biarkan pemanggil menunggu selamanya: gagalkan future yang belum selesai
+            self._fail_pending(batch, error)
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _fail_pending(self, batch: list, error: Exception):
+        pending = list(batch)
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            if item is self._STOP:
+                continue
+            future = item[3]
+            if not future.done():
+                try:
+                    future.set_exception(error)
+                except Exception:
+                    pass
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        # Klaim future dulu; future yang sudah di-cancel pemanggil tidak dijalankan
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            self._finish_batch([(future, None, e) for _, _, _, future in batch])
+            return
+
+        results = []
+        try:
+            for op, args, kwargs, future in batch:
+                callback_mark = len(self._callbacks)
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = op(conn, *args, **kwargs)
+                except Exception as e:
+                    # Callback dari op yang dibatalkan tidak boleh ikut jalan
+                    del self._callbacks[callback_mark:]
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    results.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_op")
+                    results.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # SAVEPOINT / ROLLBACK TO / COMMIT gagal: seluruh batch dibatalkan
+            logger.error(f"Group commit failed ({len(batch)} ops): {e}")
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            self._callbacks = []
+            errors = {id(future): error for future, _, error in results}
+            self._finish_batch([(future, None, errors.get(id(future)) or e) for _, _, _, future in batch])
+            return
+
+        callbacks, self._callbacks = self._callbacks, []
+        ConnectionPool._run_callbacks(callbacks)
+        self._finish_batch(results)
+
+    def _finish_batch(self, results: list):
+        self.stats['batches'] += 1
+        for future, result, error in results:
+            self.stats['operations'] += 1
+            if error is not None:
+                self.stats['failed'] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stop(self, timeout: float = 10.0):
+        """Hentikan writer setelah semua operasi yang sudah diantrikan selesai"""
+        with self._start_lock:
+            self._stopped = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+# ==================== BUFFERED LOG SINK ====================
+class LogSink:
+    """Buffer baris log (system_logs / admin_logs) di memori, di-flush per batch.
+
+    ``add(table, row)`` tidak menunggu database: baris masuk ke antrian terbatas
+    dan thread flusher menulisnya dengan ``executemany`` lewat ``flush_op`` setiap
+    ``flush_rows`` baris atau ``flush_interval`` detik. Saat antrian penuh,
+    ``overflow`` menentukan apakah baris terlama (``drop_oldest``) atau baris baru
+    (``drop_new``) yang dibuang.
+    """
+
+    def __init__(self, flush_op, max_size: int = 10000, flush_rows: int = 100,
+                 flush_interval: float = 0.5, overflow: str = 'drop_oldest'):
+        self._flush_op = flush_op
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_size)))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'failed': 0}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-log-sink", daemon=True)
+                self._thread.start()
+
+    def add(self, table: str, row: tuple) -> bool:
+        """Antrikan satu baris log; False jika dibuang karena antrian penuh"""
+        if self._stopped:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            if self.overflow != 'drop_oldest':
+                self.stats['dropped'] += 1
+                return False
+            try:
+                self._queue.get_nowait()
+                self.stats['dropped'] += 1
+                self._queue.put_nowait((table, row))
+            except (queue.Empty, queue.Full):
+                self.stats['dropped'] += 1
+                return False
+        self.stats['queued'] += 1
+        if self._queue.qsize() >= self.flush_rows:
+            self._wakeup.set()
+        return True
+
+    def _drain(self) -> Dict[str, list]:
+        rows: Dict[str, list] = {}
+        while True:
+            try:
+                table, row = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            rows.setdefault(table, []).append(row)
+
+    def flush(self) -> int:
+        """Tulis semua baris yang ada di antrian; return jumlah baris"""
+        with self._flush_lock:
+            rows = self._drain()
+            count = sum(len(batch) for batch in rows.values())
+            if not count:
+                return 0
+            try:
+                self._flush_op(rows)
+                self.stats['written'] += count
+                self.stats['flushes'] += 1
+            except Exception as e:
+                self.stats['failed'] += count
+                logger.error(f"Log sink flush failed ({count} rows dropped): {e}")
+            return count
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush sisa antrian lalu hentikan thread flusher"""
+        self._stopped = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+
+
+# ==================== SETTINGS CACHE ====================
+class SettingsCache:
+    """Snapshot settings di memori (tabel settings + bot.json), reload otomatis jika berubah"""
+
+    def __init__(self, loader, json_config=None, refresh_interval: float = 5.0):
+        # loader() -> (signature, {key: raw_value}) dibaca dari tabel settings
+        self._loader = loader
+        self._json_config = json_config
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._values: Dict[str, Any] = {}
+        self._signature = None
+        self._json_mtime = None
+        self._checked_at = 0.0
+        self._loaded = False
+
+    @staticmethod
+    def parse_value(value: Any) -> Any:
+        """Konversi nilai TEXT dari tabel settings ke tipe yang sesuai"""
+        if not isinstance(value, str):
+            return value
+        if value.isdigit():
+            return int(value)
+        elif value.replace('.', '').isdigit():
+            return float(value)
+        elif value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        return value
+
+    def _json_file_mtime(self):
+        if self._json_config is None:
+            return None
+        try:
+            return os.path.getmtime(self._json_config.config_path)
+        except OSError:
+            return None
+
+    def reload(self):
+        """Muat ulang snapshot dari database (dan bot.json jika file berubah)"""
+        signature, rows = self._loader()
+        values = {key: self.parse_value(value) for key, value in rows.items()}
+        json_mtime = self._json_file_mtime()
+        with self._lock:
+            if self._json_config is not None and json_mtime != self._json_mtime:
+                if self._loaded:
+                    self._json_config.load_config()
+                self._json_mtime = json_mtime
+            self._values = values
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self._loaded = True
+        logger.debug(f"⚙️ Settings snapshot loaded ({len(values)} keys)")
+
+    def _maybe_refresh(self):
+        if not self._loaded:
+            self.reload()
+            return
+        if time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        try:
+            signature, _ = self._loader(signature_only=True)
+            if signature != self._signature or self._json_file_mtime() != self._json_mtime:
+                self.reload()
+            else:
+                self._checked_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Settings refresh check failed: {e}")
+            self._checked_at = time.monotonic()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Baca setting tanpa query; fallback ke bot.json (dot notation)"""
+        self._maybe_refresh()
+        values = self._values
+        if key in values:
+            return values[key]
+        if self._json_config is not None:
+            return self._json_config.get(key, default)
+        return default
+
+    def set(self, key: str, value: Any):
+        """Write-through setelah update_setting berhasil"""
+        with self._lock:
+            self._values = {**self._values, key: self.parse_value(str(value))}
+
+    def invalidate(self):
+        """Paksa reload pada pembacaan berikutnya"""
+        with self._lock:
+            self._loaded = False
+
+# ==================== USER CACHE ====================
+class UserCache:
+    """LRU cache baris users (dibatasi ukuran + TTL), di-invalidate setelah commit mutasi"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 30.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Naik setiap invalidasi; load yang dimulai sebelum invalidasi tidak disimpan
+        self._epoch = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[user_id]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, user_id: str, user: Dict[str, Any], epoch: int):
+        """Simpan hasil load, kecuali ada invalidasi sejak load dimulai"""
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[user_id] = (dict(user), time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, user_id: str = None):
+        """Hapus satu user (atau semua jika user_id None)"""
+        with self._lock:
+            self._epoch += 1
+            self.stats['invalidations'] += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': round(self.stats['hits'] / lookups * 100, 2) if lookups else 0.0
+            }
+
+# ==================== MONEY ====================
+# Semua nominal uang disimpan sebagai INTEGER rupiah (lihat migrasi 9). Nilai dari
+# luar (input user, JSON provider, float lama) dibulatkan di sini sebelum ke SQL.
+def to_rupiah(value) -> int:
+    """Nominal -> int rupiah (pembulatan half-up, None/kosong -> 0)"""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, int):
+        return value
+    try:
+        return int(Decimal(str(value).strip()).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Invalid money amount: {value!r}")
+
+
+class DebitResult(str, Enum):
+    """Hasil debit_user_balance; truthy hanya jika saldo benar-benar terpotong"""
+    OK = 'ok'
+    INSUFFICIENT = 'insufficient'
+    BANNED = 'banned'
+    NOT_FOUND = 'not_found'
+    INVALID_AMOUNT = 'invalid_amount'
+    ERROR = 'error'
+
+    def __bool__(self) -> bool:
+        return self is DebitResult.OK
+
+
+# ==================== PROVIDER FINGERPRINT ====================
+# Hash field provider per produk (kolom products.provider_fingerprint, migrasi 11);
+# sync hanya menulis baris yang fingerprint-nya berubah.
+PROVIDER_FINGERPRINT_FIELDS = ('name', 'price', 'description', 'provider', 'gangguan', 'kosong')
+
+
+def provider_fingerprint(product: Dict[str, Any]) -> str:
+    values = [product.get(field) for field in PROVIDER_FINGERPRINT_FIELDS]
+    values[1] = to_rupiah(values[1])
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+# ==================== TIMESTAMPS ====================
+# Waktu disimpan sebagai INTEGER unix epoch (detik) di kolom bertipe EPOCH (migrasi 10).
+# Adapter di bawah mengubah parameter datetime jadi epoch, converter EPOCH membaca
+# kolomnya kembali sebagai datetime lokal (naive) - konversi hanya di sini.
+def to_epoch(value) -> Optional[int]:
+    """datetime / epoch / string waktu lama -> int epoch (None/kosong -> None)"""
+    if value is None or value == '' or value == b'':
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, bytes):
+        value = value.decode()
+    text = str(value).strip()
+    if text.lstrip('-').isdigit():
+        return int(text)
+    # Format lama: 'YYYY-MM-DD HH:MM:SS[.ffffff]', ISO dengan 'T' / 'Z'
+    return int(datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp())
+
+
+def from_epoch(value) -> Optional[datetime]:
+    """Epoch (atau string waktu lama) -> datetime lokal naive"""
+    epoch = to_epoch(value)
+    return datetime.fromtimestamp(epoch) if epoch is not None else None
+
+
+def format_timestamp(value, fmt: str = '%d/%m/%Y %H:%M', default: str = 'N/A') -> str:
+    """Format waktu dari database untuk ditampilkan (nilai tidak valid -> default)"""
+    try:
+        moment = from_epoch(value)
+    except (ValueError, TypeError, OverflowError, OSError):
+        return default
+    return moment.strftime(fmt) if moment else default
+
+
+def epoch_day_sql(column: str) -> str:
+    """Ekspresi SQL: kolom epoch -> 'YYYY-MM-DD' (waktu lokal)"""
+    return f"date({column}, 'unixepoch', 'localtime')"
+
+
+def epoch_hour_sql(column: str) -> str:
+    """Ekspresi SQL: kolom epoch -> 'YYYY-MM-DD HH:00' (waktu lokal)"""
+    return f"strftime('%Y-%m-%d %H:00', {column}, 'unixepoch', 'localtime')"
+
+
+sqlite3.register_adapter(datetime, to_epoch)
+sqlite3.register_converter('EPOCH', from_epoch)
+
+
+# ==================== KEYSET CURSOR ====================
+# Cursor opaque berisi arah ('n' = halaman berikut, 'p' = sebelumnya) dan primary key
+# baris anchor. Key sort lengkap dibaca ulang dari baris anchor saat seek, jadi
+# cursor tetap pendek. Panjangnya mengikuti primary key: tombol Telegram memakai
+# cursor_callback_data agar callback_data tidak melewati batas 64 byte.
+CALLBACK_DATA_LIMIT = 64
+def encode_cursor(direction: str, anchor) -> str:
+    raw = json.dumps([direction, anchor], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]):
+    """Return (arah, anchor) atau (None, None) untuk cursor kosong / rusak"""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, anchor = json.loads(raw)
+        if direction in ('n', 'p'):
+            return direction, anchor
+    except (ValueError, TypeError):
+        pass
+    return None, None
+
+
+def cursor_callback_data(prefix: str, direction: str, cursor: str, store: dict) -> str:
+    """callback_data tombol halaman: ``prefix + cursor``, atau ``prefix + arah`` jika
+    melebihi CALLBACK_DATA_LIMIT (cursor lalu disimpan di ``store[arah]``, mis. user_data)"""
+    callback_data = f"{prefix}{cursor}"
+    if len(callback_data.encode()) <= CALLBACK_DATA_LIMIT:
+        return callback_data
+    store[direction] = cursor
+    return f"{prefix}{direction}"
+
+
+def callback_cursor(payload: str, store: dict) -> Optional[str]:
+    """Kebalikan cursor_callback_data: bagian callback_data setelah prefix -> cursor"""
+    if payload in ('n', 'p'):
+        return store.get(payload)
+    return payload
+
+
+# ==================== PRODUCT CATALOG SNAPSHOT ====================
+class CatalogSnapshot:
+    """Snapshot katalog produk immutable: rows tuple + index code dan kategori"""
+
+    __slots__ = ('version', 'columns', 'rows', 'code_index', 'by_status',
+                 'by_category', '_col', '_views', 'built_at')
+
+    def __init__(self, version: int, columns: tuple, rows: tuple):
+        self.version = version
+        self.columns = columns
+        self.rows = rows
+        self.built_at = time.time()
+        self._col = {name: i for i, name in enumerate(columns)}
+        self._views = [None] * len(rows)
+
+        code_col = self._col['code']
+        status_col = self._col['status']
+        category_col = self._col['category']
+        self.code_index = {row[code_col]: i for i, row in enumerate(rows)}
+
+        by_status: Dict[Any, list] = {}
+        by_category: Dict[tuple, list] = {}
+        for i, row in enumerate(rows):
+            by_status.setdefault(row[status_col], []).append(i)
+            by_category.setdefault((row[category_col], row[status_col]), []).append(i)
+            by_category.setdefault((row[category_col], None), []).append(i)
+        by_status[None] = list(range(len(rows)))
+        self.by_status = {key: tuple(idx) for key, idx in by_status.items()}
+        self.by_category = {key: tuple(idx) for key, idx in by_category.items()}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _view(self, i: int):
+        view = self._views[i]
+        if view is None:
+            view = MappingProxyType(dict(zip(self.columns, self.rows[i])))
+            self._views[i] = view
+        return view
+
+    def get(self, code: str):
+        """Produk berdasarkan code (read-only mapping) atau None"""
+        i = self.code_index.get(code)
+        return self._view(i) if i is not None else None
+
+    def products(self, category: str = None, status: str = 'active', featured: bool = False) -> list:
+        """Produk terfilter, urutan sort_order, name"""
+        if category:
+            indexes = self.by_category.get((category, status or None), ())
+        else:
+            indexes = self.by_status.get(status or None, ())
+        if featured:
+            featured_col = self._col['is_featured']
+            indexes = [i for i in indexes if self.rows[i][featured_col] == 1]
+        return [self._view(i) for i in indexes]
+
+    def categories(self, status: str = 'active') -> list:
+        """Daftar kategori yang punya produk dengan status tsb"""
+        wanted = status or None
+        return sorted({category for category, st in self.by_category if st == wanted and category is not None})
+
 class DatabaseManager:
     _instance = None
     _lock = threading.Lock()
@@ -32,380 +841,1234 @@ class DatabaseManager:
         if not hasattr(self, '_initialized'):
             self.db_path = db_path
             self._initialized = True
+            self.pool = ConnectionPool(
+                db_path,
+                pool_size=getattr(config, 'DB_POOL_SIZE', 5),
+                max_overflow=getattr(config, 'DB_MAX_OVERFLOW', 10),
+                recycle=getattr(config, 'DB_POOL_RECYCLE', 3600)
+            )
+            self.writer = WriteQueue(self.pool.create_connection)
+            self.log_sink = LogSink(
+                self._flush_logs,
+                max_size=getattr(config, 'LOG_BUFFER_SIZE', 10000),
+                flush_rows=getattr(config, 'LOG_FLUSH_ROWS', 100),
+                flush_interval=getattr(config, 'LOG_FLUSH_INTERVAL_MS', 500) / 1000,
+                overflow=getattr(config, 'LOG_OVERFLOW_POLICY', 'drop_oldest')
+            )
+            self.settings = SettingsCache(
+                self._load_settings,
+                json_config=json_config,
+                refresh_interval=getattr(config, 'SETTINGS_REFRESH_INTERVAL', 5)
+            )
+            self.user_cache = UserCache(
+                max_size=getattr(config, 'USER_CACHE_SIZE', 1000),
+                ttl=getattr(config, 'USER_CACHE_TTL', 30)
+            )
+            self._catalog = None
+            self._catalog_version = 0
+            self._catalog_lock = threading.Lock()
+            self._catalog_signature = None
+            self._catalog_checked_at = 0.0
             self.init_database()
 
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections - PRODUCTION READY"""
-        max_retries = 5
-        retry_delay = 0.1
-        conn = None
-        
-        for attempt in range(max_retries):
-            try:
-                conn = sqlite3.connect(
-                    self.db_path, 
-                    check_same_thread=False,
-                    timeout=30.0
-                )
-                conn.row_factory = sqlite3.Row
-                # Production-optimized PRAGMA settings
-                conn.execute("PRAGMA foreign_keys = ON")
-                conn.execute("PRAGMA journal_mode = WAL")
-                conn.execute("PRAGMA cache_size = -100000")
-                conn.execute("PRAGMA synchronous = NORMAL")
-                conn.execute("PRAGMA busy_timeout = 10000")
-                conn.execute("PRAGMA temp_store = MEMORY")
-                conn.execute("PRAGMA mmap_size = 268435456")
-                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
-                
+        """Context manager for database connections - dari connection pool"""
+        try:
+            with self.pool.connection() as conn:
                 yield conn
-                
-                if conn:
-                    conn.commit()
-                break
-                
-            except sqlite3.OperationalError as e:
-                if conn:
-                    try:
-                        conn.rollback()
-                    except:
-                        pass
-                    finally:
-                        conn.close()
-                        conn = None
-                
-                if "locked" in str(e).lower() and attempt < max_retries - 1:
-                    wait_time = retry_delay * (2 ** attempt) + random.uniform(0, 0.1)
-                    logger.warning(f"Database locked, retry {attempt + 1}/{max_retries} in {wait_time:.2f}s")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error(f"Database operational error after {attempt + 1} attempts: {e}")
-                    raise
-                    
-            except Exception as e:
-                if conn:
-                    try:
-                        conn.rollback()
-                    except:
-                        pass
-                    finally:
-                        conn.close()
-                        conn = None
-                logger.error(f"Unexpected database error: {e}")
-                raise
-                
-        if conn:
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower():
+                logger.warning(f"Database locked: {e}")
+            else:
+                logger.error(f"Database operational error: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected database error: {e}")
+            raise
+
+    # Operasi tulis yang bisa diantrikan by name lewat submit_write()
+    QUEUED_WRITES = {
+        'update_user_balance': '_update_user_balance_tx',
+        'debit_user_balance': '_debit_user_balance_tx',
+        'credit_user_balance': '_credit_user_balance_tx',
+        'save_order': '_save_order_tx',
+        'update_order_status': '_update_order_status_tx',
+        'fail_order_with_refund': '_fail_order_with_refund_tx',
+        'update_product': '_update_product_tx',
+        'add_system_log': '_insert_system_log_tx',
+        'add_admin_log': '_insert_admin_log_tx',
+    }
+
+    def _after_commit(self, callback):
+        """Jalankan callback setelah transaksi yang sedang berjalan di-commit"""
+        if self.writer.in_writer_thread():
+            self.writer.after_commit(callback)
+        else:
+            self.pool.after_commit(callback)
+
+    def _invalidate_user(self, user_id: str = None):
+        """Invalidate user cache setelah commit (None = semua user)"""
+        self._after_commit(functools.partial(self.user_cache.invalidate, str(user_id) if user_id is not None else None))
+
+    def submit_write(self, op, *args, **kwargs) -> Future:
+        """Antrikan operasi tulis ke writer thread; Future berisi row id / hasil op.
+
+        ``op`` bisa berupa nama di QUEUED_WRITES (mis. ``'save_order'``) atau
+        callable ``op(conn, *args, **kwargs)``.
+        """
+        if isinstance(op, str):
+            if op not in self.QUEUED_WRITES:
+                raise ValueError(f"Unknown queued write: {op}")
+            op = getattr(self, self.QUEUED_WRITES[op])
+        return self.writer.submit(op, *args, **kwargs)
+
+    def _write(self, op, *args, **kwargs):
+        """Jalankan operasi tulis lewat writer dan tunggu hasilnya.
+
+        Jika thread ini sudah memegang koneksi (nested di dalam get_connection)
+        atau sedang berada di writer thread, op dijalankan langsung pada koneksi
+        tersebut agar tidak deadlock menunggu write lock milik sendiri.
+
+        Timeout (DB_WRITE_TIMEOUT) hanya berlaku selama op masih mengantre: op
+        dibatalkan dan OperationalError pasti berarti tidak ada yang ditulis. Op
+        yang sudah dijalankan writer tetap ditunggu sampai batch-nya selesai,
+        supaya pemanggil tidak me-retry (mis. debit saldo) operasi yang ternyata
+        ter-commit.
+        """
+        held = self.pool.current_connection()
+        if held is not None:
+            return op(held, *args, **kwargs)
+        if self.writer.in_writer_thread():
+            raise RuntimeError("Nested write inside writer thread must use the given connection")
+        future = self.writer.submit(op, *args, **kwargs)
+        try:
+            return future.result(timeout=getattr(config, 'DB_WRITE_TIMEOUT', 60))
+        except FutureTimeoutError:
+            # Belum mulai dijalankan: batalkan agar tidak ter-commit setelah pemanggil menyerah
+            if future.cancel():
+                raise sqlite3.OperationalError(f"Write operation timed out ({getattr(op, '__name__', op)})")
+        # Sudah dijalankan writer: hasilnya (commit / rollback) ditunggu
+        logger.warning(f"⏳ Write operation {getattr(op, '__name__', op)} exceeded DB_WRITE_TIMEOUT while running, waiting for commit")
+        return future.result()
+
+    def close(self):
+        """Flush buffered logs, stop the writer and close pooled connections"""
+        self.log_sink.stop()
+        self.writer.stop()
+        self.pool.close()
+
+    # ==================== SCHEMA MIGRATIONS ====================
+    # (versi, deskripsi, method) - urut, masing-masing dijalankan sekali dalam satu transaksi.
+    # Versi yang sudah diterapkan disimpan di PRAGMA user_version.
+    SCHEMA_MIGRATIONS = [
+        (1, 'base schema', '_migration_base_schema'),
+        (2, 'stats counters', '_migration_stats_counters'),
+        (3, 'daily/hourly rollups', '_migration_rollups'),
+        (4, 'composite/partial query indexes', '_migration_query_indexes'),
+        (5, 'legacy admin topups table', '_migration_legacy_topups'),
+        (6, 'keyset pagination indexes', '_migration_pagination_indexes'),
+        (7, 'products FTS5 search index', '_migration_product_search'),
+        (8, 'per-user aggregates', '_migration_user_stats'),
+        (9, 'integer rupiah money columns', '_migration_integer_money'),
+        (10, 'unix epoch timestamps', '_migration_epoch_timestamps'),
+        (11, 'provider catalog fingerprints', '_migration_provider_fingerprint'),
+        (12, 'per-column stats update triggers', '_migration_stats_update_triggers'),
+        (13, 'rollup delete triggers skip archive/retention', '_migration_rollup_delete_triggers'),
+    ]
+
+    # Kolom products yang mungkin belum ada di database lama (dibuat script updateproduk)
+    PRODUCT_COLUMNS = [
+        ('description', 'TEXT'),
+        ('category', "TEXT DEFAULT 'Umum'"),
+        ('provider', 'TEXT'),
+        ('gangguan', 'INTEGER DEFAULT 0'),
+        ('kosong', 'INTEGER DEFAULT 0'),
+        ('stock', 'INTEGER DEFAULT 0'),
+        ('min_stock', 'INTEGER DEFAULT 0'),
+        ('max_stock', 'INTEGER DEFAULT 1000'),
+        ('profit_margin', 'REAL DEFAULT 0'),
+        ('cost_price', 'INTEGER DEFAULT 0'),
+        ('is_featured', 'INTEGER DEFAULT 0'),
+        ('sort_order', 'INTEGER DEFAULT 0'),
+        ('updated_at', 'EPOCH'),
+        ('created_at', 'EPOCH'),
+        ('provider_fingerprint', 'TEXT'),
+    ]
+
+    def get_schema_version(self) -> int:
+        """Versi schema saat ini (PRAGMA user_version)"""
+        with self.get_connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def init_database(self) -> bool:
+        """Jalankan migrasi schema yang belum diterapkan (database up-to-date: satu PRAGMA read)"""
+        try:
+            current_version = self.get_schema_version()
+            latest_version = self.SCHEMA_MIGRATIONS[-1][0]
+            if current_version >= latest_version:
+                return True
+            
+            conn = self.pool.create_connection()
+            # Transaksi manual: DDL ikut di dalam BEGIN ... COMMIT
+            conn.isolation_level = None
+            # Rebuild tabel (DROP + RENAME) tidak boleh memicu cascade FK
+            conn.execute('PRAGMA foreign_keys = OFF')
             try:
+                for version, description, method in self.SCHEMA_MIGRATIONS:
+                    if version <= current_version:
+                        continue
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        getattr(self, method)(conn.cursor())
+                        conn.execute(f'PRAGMA user_version = {int(version)}')
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                    logger.info(f"🧱 Migration {version} applied: {description}")
+            finally:
                 conn.close()
-            except:
-                pass
+            
+            # Koneksi pool yang dibuka sebelum migrasi masih menyimpan schema lama
+            self.pool.recycle_all()
+            self.invalidate_product_catalog()
+            self.settings.invalidate()
+            self.check_query_plans()
+            logger.info(f"✅ Database schema migrated {current_version} -> {latest_version}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Database initialization failed: {e}", exc_info=True)
+            raise
+
+    def _ensure_product_columns(self, cursor):
+        """Tambah kolom products yang hilang (pengganti fix_products_table.py)"""
+        cursor.execute('PRAGMA table_info(products)')
+        existing = {row[1] for row in cursor.fetchall()}
+        for column, definition in self.PRODUCT_COLUMNS:
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE products ADD COLUMN {column} {definition}')
+                logger.info(f"🧱 Added missing column products.{column}")
+
+    def _migration_base_schema(self, cursor):
+        """Schema dasar: semua tabel, index dan data default"""
+        # ==================== USERS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                username TEXT,
+                full_name TEXT NOT NULL,
+                balance REAL DEFAULT 0 CHECK(balance >= 0),
+                total_spent REAL DEFAULT 0 CHECK(total_spent >= 0),
+                total_orders INTEGER DEFAULT 0 CHECK(total_orders >= 0),
+                total_topups INTEGER DEFAULT 0 CHECK(total_topups >= 0),
+                registered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_active DATETIME DEFAULT CURRENT_TIMESTAMP,
+                is_banned INTEGER DEFAULT 0 CHECK(is_banned IN (0,1)),
+                ban_reason TEXT,
+                language TEXT DEFAULT 'id',
+                level INTEGER DEFAULT 1 CHECK(level >= 1),
+                referral_code TEXT UNIQUE,
+                referred_by TEXT,
+                total_referred INTEGER DEFAULT 0,
+                bonus_balance REAL DEFAULT 0
+            )
+        ''')
+        
+        # ==================== PRODUCTS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                code TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                price REAL NOT NULL CHECK(price >= 0),
+                status TEXT DEFAULT 'active' CHECK(status IN ('active','inactive','empty','disturb')),
+                description TEXT,
+                category TEXT DEFAULT 'Umum',
+                provider TEXT,
+                gangguan INTEGER DEFAULT 0 CHECK(gangguan IN (0,1)),
+                kosong INTEGER DEFAULT 0 CHECK(kosong IN (0,1)),
+                stock INTEGER DEFAULT 0 CHECK(stock >= 0),
+                min_stock INTEGER DEFAULT 0 CHECK(min_stock >= 0),
+                max_stock INTEGER DEFAULT 1000 CHECK(max_stock >= 0),
+                profit_margin REAL DEFAULT 0,
+                cost_price REAL DEFAULT 0,
+                is_featured INTEGER DEFAULT 0 CHECK(is_featured IN (0,1)),
+                sort_order INTEGER DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # ==================== TRANSACTIONS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                type TEXT NOT NULL CHECK(type IN ('topup','withdraw','refund','bonus','order','commission','adjustment')),
+                amount REAL NOT NULL CHECK(amount != 0),
+                status TEXT DEFAULT 'pending' CHECK(status IN ('pending','completed','rejected','cancelled','failed')),
+                details TEXT,
+                unique_code INTEGER DEFAULT 0,
+                payment_method TEXT,
+                admin_notes TEXT,
+                reference_id TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # ==================== ORDERS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                product_code TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                price REAL NOT NULL CHECK(price >= 0),
+                status TEXT DEFAULT 'pending' CHECK(status IN ('pending','processing','completed','failed','partial','refunded','cancelled')),
+                provider_order_id TEXT,
+                customer_input TEXT,
+                response_data TEXT,
+                sn TEXT,
+                note TEXT,
+                profit REAL DEFAULT 0,
+                cost REAL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                processed_at DATETIME,
+                completed_at DATETIME,
+                refunded_at DATETIME,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY (product_code) REFERENCES products (code)
+            )
+        ''')
+        
+        # ==================== TOPUP REQUESTS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS topup_requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                username TEXT,
+                full_name TEXT,
+                amount REAL NOT NULL CHECK(amount > 0),
+                status TEXT DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected','expired')),
+                proof_image TEXT,
+                unique_code INTEGER DEFAULT 0,
+                payment_method TEXT,
+                total_amount REAL DEFAULT 0,
+                admin_notes TEXT,
+                expires_at DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # ==================== ADMIN LOGS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS admin_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                target_type TEXT,
+                target_id TEXT,
+                details TEXT,
+                ip_address TEXT,
+                user_agent TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # ==================== SYSTEM LOGS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS system_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                level TEXT NOT NULL CHECK(level IN ('INFO','WARNING','ERROR','DEBUG','CRITICAL')),
+                module TEXT NOT NULL,
+                message TEXT NOT NULL,
+                details TEXT,
+                user_id TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # ==================== SETTINGS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                description TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # ==================== NOTIFICATIONS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                message TEXT NOT NULL,
+                type TEXT DEFAULT 'info' CHECK(type IN ('info','success','warning','error','system')),
+                is_read INTEGER DEFAULT 0 CHECK(is_read IN (0,1)),
+                action_url TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # ==================== CATEGORIES TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                description TEXT,
+                sort_order INTEGER DEFAULT 0,
+                is_active INTEGER DEFAULT 1 CHECK(is_active IN (0,1)),
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # ==================== REFERRALS TABLE ====================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS referrals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                referrer_id TEXT NOT NULL,
+                referred_id TEXT NOT NULL UNIQUE,
+                commission_amount REAL DEFAULT 0,
+                status TEXT DEFAULT 'pending' CHECK(status IN ('pending','completed','cancelled')),
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME,
+                FOREIGN KEY (referrer_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY (referred_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        ''')
+        
+        self._ensure_product_columns(cursor)
+        
+        # ==================== CREATE INDEXES ====================
+        indexes = [
+            # Users indexes
+            'CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance)',
+            'CREATE INDEX IF NOT EXISTS idx_users_active ON users(last_active)',
+            'CREATE INDEX IF NOT EXISTS idx_users_level ON users(level)',
+            'CREATE INDEX IF NOT EXISTS idx_users_referral ON users(referral_code)',
+            
+            # Products indexes
+            'CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)',
+            'CREATE INDEX IF NOT EXISTS idx_products_price ON products(price)',
+            'CREATE INDEX IF NOT EXISTS idx_products_featured ON products(is_featured)',
+            'CREATE INDEX IF NOT EXISTS idx_products_sort ON products(sort_order)',
+            
+            # Transactions indexes
+            'CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions(status)',
+            'CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(type)',
+            'CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at)',
+            
+            # Orders indexes
+            'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_code)',
+            'CREATE INDEX IF NOT EXISTS idx_orders_updated ON orders(updated_at)',
+            
+            # Topup indexes
+            'CREATE INDEX IF NOT EXISTS idx_topup_requests_user ON topup_requests(user_id)',
+            'CREATE INDEX IF NOT EXISTS idx_topup_requests_created ON topup_requests(created_at)',
+            
+            # Logs indexes
+            'CREATE INDEX IF NOT EXISTS idx_admin_logs_admin ON admin_logs(admin_id)',
+            'CREATE INDEX IF NOT EXISTS idx_admin_logs_time ON admin_logs(timestamp)',
+            'CREATE INDEX IF NOT EXISTS idx_system_logs_level ON system_logs(level)',
+            'CREATE INDEX IF NOT EXISTS idx_system_logs_time ON system_logs(timestamp)',
+            
+            # Referrals indexes
+            'CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)',
+            'CREATE INDEX IF NOT EXISTS idx_referrals_referred ON referrals(referred_id)'
+        ]
+        
+        for index in indexes:
+            try:
+                cursor.execute(index)
+            except Exception as e:
+                logger.warning(f"Could not create index {index}: {e}")
+        
+        # ==================== DEFAULT DATA ====================
+        default_settings = [
+            ('system_name', 'Bot System', 'Nama sistem bot'),
+            ('maintenance_mode', '0', 'Mode maintenance (1=aktif, 0=nonaktif)'),
+            ('min_topup', '10000', 'Minimum topup'),
+            ('max_topup', '1000000', 'Maksimum topup'),
+            ('admin_contact', '@admin', 'Kontak admin'),
+            ('auto_sync_products', '1', 'Auto sync products (1=aktif, 0=nonaktif)'),
+            ('profit_margin', '10', 'Margin profit default (%)'),
+            ('referral_bonus', '5000', 'Bonus referral untuk referrer'),
+            ('welcome_bonus', '0', 'Bonus saldo untuk user baru'),
+            ('order_timeout', '30', 'Timeout order dalam menit'),
+            ('topup_expiry', '24', 'Expiry topup dalam jam'),
+            ('currency', 'Rp', 'Simbol mata uang'),
+            ('language', 'id', 'Bahasa default'),
+            ('max_retry', '3', 'Max retry untuk order'),
+            ('backup_interval', '24', 'Interval backup dalam jam')
+        ]
+        
+        cursor.executemany('''
+            INSERT OR IGNORE INTO settings (key, value, description) 
+            VALUES (?, ?, ?)
+        ''', default_settings)
+        
+        # Default categories
+        default_categories = [
+            ('Pulsa', 'Produk pulsa semua operator', 1),
+            ('Data', 'Paket internet dan kuota', 2),
+            ('E-Money', 'E-money dan dompet digital', 3),
+            ('Voucher', 'Voucher game dan entertainment', 4),
+            ('PLN', 'Token dan tagihan listrik', 5),
+            ('BPJS', 'Pembayaran BPJS', 6),
+            ('PDAM', 'Tagihan air PDAM', 7)
+        ]
+        
+        cursor.executemany('''
+            INSERT OR IGNORE INTO categories (name, description, sort_order) 
+            VALUES (?, ?, ?)
+        ''', default_categories)
+
+    def _migration_stats_counters(self, cursor):
+        """Tabel stats_counters + trigger, diisi dari data yang ada"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        self._create_stats_triggers(cursor)
+        self._rebuild_stats_counters(cursor)
 
-    def init_database(self):
-        """Initialize semua tabel database dengan schema lengkap dan optimasi"""
+    def _migration_rollups(self, cursor):
+        """Tabel rollup harian/per jam + log perubahan"""
+        for rollup_table, bucket in (('stats_daily', 'day'), ('stats_hourly', 'hour')):
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {rollup_table} (
+                    {bucket} TEXT PRIMARY KEY,
+                    orders INTEGER DEFAULT 0,
+                    completed_orders INTEGER DEFAULT 0,
+                    revenue REAL DEFAULT 0,
+                    profit REAL DEFAULT 0,
+                    active_users INTEGER DEFAULT 0,
+                    topups REAL DEFAULT 0,
+                    topup_count INTEGER DEFAULT 0
+                )
+            ''')
+        # Log perubahan (hari yang perlu dihitung ulang), diproses mulai dari watermark
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day TEXT NOT NULL
+            )
+        ''')
+        self._create_rollup_triggers(cursor)
+        # Backfill: semua hari yang sudah ada dihitung pada refresh pertama
+        cursor.execute('''
+            INSERT INTO rollup_changes (day)
+            SELECT DISTINCT date(created_at) FROM orders WHERE created_at IS NOT NULL
+            UNION
+            SELECT DISTINCT date(created_at) FROM transactions WHERE type = 'topup' AND created_at IS NOT NULL
+        ''')
+
+    def _migration_query_indexes(self, cursor):
+        """Index komposit/partial sesuai query yang sering dipakai"""
+        indexes = [
+            'CREATE INDEX IF NOT EXISTS idx_users_active_unbanned ON users(last_active) WHERE is_banned = 0',
+            'CREATE INDEX IF NOT EXISTS idx_products_status_category ON products(status, category, sort_order, name)',
+            'CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at DESC)',
+            "CREATE INDEX IF NOT EXISTS idx_orders_open ON orders(created_at) WHERE status IN ('pending', 'processing')",
+            "CREATE INDEX IF NOT EXISTS idx_topup_requests_pending ON topup_requests(created_at, expires_at) WHERE status = 'pending'",
+            "CREATE INDEX IF NOT EXISTS idx_topup_requests_expiry ON topup_requests(expires_at) WHERE status = 'pending'",
+            'CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, created_at DESC) WHERE is_read = 0'
+        ]
+        for index in indexes:
+            cursor.execute(index)
+        
+        # Lookup order berdasarkan reffid provider (webhook / status checker)
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # ==================== USERS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id TEXT PRIMARY KEY,
-                        username TEXT,
-                        full_name TEXT NOT NULL,
-                        balance REAL DEFAULT 0 CHECK(balance >= 0),
-                        total_spent REAL DEFAULT 0 CHECK(total_spent >= 0),
-                        total_orders INTEGER DEFAULT 0 CHECK(total_orders >= 0),
-                        total_topups INTEGER DEFAULT 0 CHECK(total_topups >= 0),
-                        registered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        last_active DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        is_banned INTEGER DEFAULT 0 CHECK(is_banned IN (0,1)),
-                        ban_reason TEXT,
-                        language TEXT DEFAULT 'id',
-                        level INTEGER DEFAULT 1 CHECK(level >= 1),
-                        referral_code TEXT UNIQUE,
-                        referred_by TEXT,
-                        total_referred INTEGER DEFAULT 0,
-                        bonus_balance REAL DEFAULT 0
-                    )
-                ''')
-                
-                # ==================== PRODUCTS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS products (
-                        code TEXT PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        price REAL NOT NULL CHECK(price >= 0),
-                        status TEXT DEFAULT 'active' CHECK(status IN ('active','inactive','empty','disturb')),
-                        description TEXT,
-                        category TEXT DEFAULT 'Umum',
-                        provider TEXT,
-                        gangguan INTEGER DEFAULT 0 CHECK(gangguan IN (0,1)),
-                        kosong INTEGER DEFAULT 0 CHECK(kosong IN (0,1)),
-                        stock INTEGER DEFAULT 0 CHECK(stock >= 0),
-                        min_stock INTEGER DEFAULT 0 CHECK(min_stock >= 0),
-                        max_stock INTEGER DEFAULT 1000 CHECK(max_stock >= 0),
-                        profit_margin REAL DEFAULT 0,
-                        cost_price REAL DEFAULT 0,
-                        is_featured INTEGER DEFAULT 0 CHECK(is_featured IN (0,1)),
-                        sort_order INTEGER DEFAULT 0,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # ==================== TRANSACTIONS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS transactions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT NOT NULL,
-                        type TEXT NOT NULL CHECK(type IN ('topup','withdraw','refund','bonus','order','commission','adjustment')),
-                        amount REAL NOT NULL CHECK(amount != 0),
-                        status TEXT DEFAULT 'pending' CHECK(status IN ('pending','completed','rejected','cancelled','failed')),
-                        details TEXT,
-                        unique_code INTEGER DEFAULT 0,
-                        payment_method TEXT,
-                        admin_notes TEXT,
-                        reference_id TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        completed_at DATETIME,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-                    )
-                ''')
-                
-                # ==================== ORDERS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT NOT NULL,
-                        product_code TEXT NOT NULL,
-                        product_name TEXT NOT NULL,
-                        price REAL NOT NULL CHECK(price >= 0),
-                        status TEXT DEFAULT 'pending' CHECK(status IN ('pending','processing','completed','failed','partial','refunded','cancelled')),
-                        provider_order_id TEXT,
-                        customer_input TEXT,
-                        response_data TEXT,
-                        sn TEXT,
-                        note TEXT,
-                        profit REAL DEFAULT 0,
-                        cost REAL DEFAULT 0,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        processed_at DATETIME,
-                        completed_at DATETIME,
-                        refunded_at DATETIME,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
-                        FOREIGN KEY (product_code) REFERENCES products (code)
-                    )
-                ''')
-                
-                # ==================== TOPUP REQUESTS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS topup_requests (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT NOT NULL,
-                        username TEXT,
-                        full_name TEXT,
-                        amount REAL NOT NULL CHECK(amount > 0),
-                        status TEXT DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected','expired')),
-                        proof_image TEXT,
-                        unique_code INTEGER DEFAULT 0,
-                        payment_method TEXT,
-                        total_amount REAL DEFAULT 0,
-                        admin_notes TEXT,
-                        expires_at DATETIME,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-                    )
-                ''')
-                
-                # ==================== ADMIN LOGS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS admin_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        admin_id TEXT NOT NULL,
-                        action TEXT NOT NULL,
-                        target_type TEXT,
-                        target_id TEXT,
-                        details TEXT,
-                        ip_address TEXT,
-                        user_agent TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # ==================== SYSTEM LOGS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS system_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        level TEXT NOT NULL CHECK(level IN ('INFO','WARNING','ERROR','DEBUG','CRITICAL')),
-                        module TEXT NOT NULL,
-                        message TEXT NOT NULL,
-                        details TEXT,
-                        user_id TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # ==================== SETTINGS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS settings (
-                        key TEXT PRIMARY KEY,
-                        value TEXT NOT NULL,
-                        description TEXT,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # ==================== NOTIFICATIONS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS notifications (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT NOT NULL,
-                        title TEXT NOT NULL,
-                        message TEXT NOT NULL,
-                        type TEXT DEFAULT 'info' CHECK(type IN ('info','success','warning','error','system')),
-                        is_read INTEGER DEFAULT 0 CHECK(is_read IN (0,1)),
-                        action_url TEXT,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-                    )
-                ''')
-                
-                # ==================== CATEGORIES TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS categories (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        description TEXT,
-                        sort_order INTEGER DEFAULT 0,
-                        is_active INTEGER DEFAULT 1 CHECK(is_active IN (0,1)),
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_provider_ref ON orders(provider_order_id)
+                WHERE provider_order_id IS NOT NULL AND provider_order_id != ''
+            ''')
+        except sqlite3.IntegrityError as e:
+            logger.warning(f"Duplicate provider_order_id found, using non-unique index: {e}")
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_orders_provider_ref_dup ON orders(provider_order_id)
+                WHERE provider_order_id IS NOT NULL AND provider_order_id != ''
+            ''')
+        
+        # Index lama yang sudah tercakup index komposit/partial di atas
+        for old_index in ('idx_orders_user', 'idx_products_status', 'idx_transactions_user',
+                          'idx_notifications_user', 'idx_notifications_read', 'idx_users_banned',
+                          'idx_orders_status', 'idx_topup_requests_status'):
+            cursor.execute(f'DROP INDEX IF EXISTS {old_index}')
+
+    def _migration_legacy_topups(self, cursor):
+        """Tabel topups yang dipakai admin_handler (sebelumnya dibuat ensure_database_tables)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS topups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                amount REAL NOT NULL,
+                status TEXT DEFAULT 'pending',
+                payment_method TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                approved_at TEXT,
+                approved_by TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_topups_status ON topups(status)')
+
+
+    # ==================== QUERY PLAN CHECK ====================
+    # (nama, query, params, index yang diharapkan) - query publik yang sering dipanggil
+    QUERY_PLAN_CHECKS = [
+        ('get_user', 'SELECT * FROM users WHERE user_id = ?', ('0',), 'sqlite_autoindex_users_1'),
+        ('get_user_orders', 'SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC LIMIT ?',
+         ('0', 10), 'idx_orders_user_created'),
+        ('get_user_order_history', 'SELECT * FROM orders WHERE user_id = ? AND created_at >= ? ORDER BY created_at DESC',
+         ('0', '2000-01-01'), 'idx_orders_user_created'),
+        ('get_order_by_provider_id',
+         "SELECT * FROM orders WHERE provider_order_id = ? AND provider_order_id IS NOT NULL AND provider_order_id != ''",
+         ('x',), 'idx_orders_provider_ref'),
+        ('get_pending_orders', "SELECT * FROM orders WHERE status IN ('pending', 'processing') ORDER BY created_at ASC",
+         (), 'idx_orders_open'),
+        ('get_all_processing_orders',
+         "SELECT * FROM orders WHERE status IN ('pending', 'processing') AND created_at >= ? ORDER BY created_at ASC",
+         ('2000-01-01',), 'idx_orders_open'),
+        ('get_pending_topups',
+         "SELECT * FROM topup_requests WHERE status = 'pending' AND (expires_at IS NULL OR expires_at > ?) ORDER BY created_at ASC",
+         ('2000-01-01',), 'idx_topup_requests_pending'),
+        ('expire_pending_topups',
+         "UPDATE topup_requests SET status = 'expired' WHERE status = 'pending' AND expires_at < ?",
+         ('2000-01-01',), 'idx_topup_requests_expiry'),
+        ('get_unread_notifications',
+         'SELECT * FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC LIMIT ?',
+         ('0', 10), 'idx_notifications_unread'),
+        ('get_recent_users',
+         'SELECT user_id FROM users WHERE is_banned = 0 ORDER BY last_active DESC LIMIT ?',
+         (20,), 'idx_users_active_unbanned'),
+        ('get_active_users', 'SELECT user_id FROM users WHERE last_active >= ? AND is_banned = 0 ORDER BY last_active DESC',
+         ('2000-01-01',), 'idx_users_active_unbanned'),
+        ('products_by_category',
+         'SELECT * FROM products WHERE status = ? AND category = ? ORDER BY sort_order ASC, name ASC',
+         ('active', 'Data'), 'idx_products_status_page'),
+        ('get_products_page',
+         'SELECT * FROM products WHERE status = ? AND (category, sort_order, name, code) > (?, ?, ?, ?) '
+         'ORDER BY category, sort_order, name, code LIMIT ?',
+         ('active', 'Data', 0, '', '', 21), 'idx_products_status_page'),
+        ('get_orders_page',
+         'SELECT * FROM orders WHERE user_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+         ('0', '2100-01-01', 0, 21), 'idx_orders_user_created'),
+        ('get_users_page',
+         'SELECT * FROM users WHERE (registered_at, user_id) < (?, ?) ORDER BY registered_at DESC, user_id DESC LIMIT ?',
+         ('2100-01-01', '', 21), 'idx_users_registered'),
+        ('get_daily_stats', "SELECT * FROM stats_daily WHERE day >= date('now', 'localtime', ?) ORDER BY day ASC",
+         ('-7 days',), 'sqlite_autoindex_stats_daily_1'),
+    ]
+
+    def check_query_plans(self) -> List[Dict[str, Any]]:
+        """EXPLAIN QUERY PLAN untuk setiap query publik; warning jika index yang diharapkan tidak dipakai"""
+        results = []
+        # Koneksi baru: EXPLAIN tidak memuat ulang schema yang di-cache koneksi pool lama
+        conn = self.pool.create_connection()
+        try:
+            for name, query, params, expected_index in self.QUERY_PLAN_CHECKS:
+                try:
+                    plan = [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()]
+                except sqlite3.Error as e:
+                    plan = [f'error: {e}']
+                uses_index = any(expected_index in step for step in plan)
+                full_scan = any(step.startswith('SCAN ') and 'INDEX' not in step for step in plan)
+                temp_sort = any('TEMP B-TREE' in step for step in plan)
+                ok = uses_index and not full_scan
+                results.append({
+                    'name': name, 'index': expected_index, 'ok': ok,
+                    'temp_sort': temp_sort, 'plan': plan
+                })
+                if not ok:
+                    logger.warning(f"⚠️ Query plan {name} does not use {expected_index}: {' | '.join(plan)}")
+        finally:
+            self.pool._discard(conn)
+        return results
+
+    # ==================== STATS COUNTERS ====================
+    # Kontribusi satu baris ke stats_counters: (key, delta); R = NEW / OLD.
+    # Trigger UPDATE dibuat per kelompok kolom yang dibaca kontribusi (R.kolom),
+    # jadi update saldo hanya menyentuh users:balance, bukan semua counter users.
+    STATS_CONTRIBUTIONS = {
+        'users': [
+            ("'users:total'", "1"),
+            ("'users:active'", "CASE WHEN R.is_banned = 0 THEN 1 ELSE 0 END"),
+            ("'users:balance'", "CASE WHEN R.is_banned = 0 THEN R.balance ELSE 0 END"),
+            ("'users:spent'", "R.total_spent"),
+            ("'users:day:' || " + epoch_day_sql('R.registered_at'), "1"),
+        ],
+        'orders': [
+            ("'orders:total'", "1"),
+            ("'orders:status:' || R.status", "1"),
+            ("'orders:revenue'", "CASE WHEN R.status = 'completed' THEN R.price ELSE 0 END"),
+            ("'orders:profit'", "CASE WHEN R.status = 'completed' THEN R.profit ELSE 0 END"),
+            ("'orders:day:' || " + epoch_day_sql('R.created_at'), "1"),
+            ("'revenue:day:' || " + epoch_day_sql('R.created_at'), "CASE WHEN R.status = 'completed' THEN R.price ELSE 0 END"),
+        ],
+        'transactions': [
+            ("'topup:day:' || " + epoch_day_sql('R.created_at'),
+             "CASE WHEN R.type = 'topup' AND R.status = 'completed' THEN R.amount ELSE 0 END"),
+        ],
+        'topup_requests': [
+            ("'topups:status:' || R.status", "1"),
+        ],
+    }
+
+    @staticmethod
+    def _stats_bump_sql(key_expr: str, delta_expr: str, row: str, sign: str = '') -> str:
+        key_expr = key_expr.replace('R.', f'{row}.')
+        delta_expr = f"{sign}({delta_expr.replace('R.', f'{row}.')})"
+        return (
+            f"INSERT INTO stats_counters (key, value) SELECT {key_expr}, {delta_expr} "
+            f"WHERE {delta_expr} != 0 "
+            f"ON CONFLICT(key) DO UPDATE SET value = value + excluded.value;"
+        )
+
+    @staticmethod
+    def _stats_update_groups(contributions: list) -> Dict[tuple, list]:
+        """{(kolom yang dibaca, ...): [kontribusi]}; kontribusi konstan tidak perlu trigger UPDATE"""
+        groups: Dict[tuple, list] = {}
+        for key_expr, delta_expr in contributions:
+            columns = tuple(sorted(set(re.findall(r'\bR\.(\w+)', key_expr + ' ' + delta_expr))))
+            if columns:
+                groups.setdefault(columns, []).append((key_expr, delta_expr))
+        return groups
+
+    def _create_stats_triggers(self, cursor):
+        """Trigger yang menjaga stats_counters tetap up to date"""
+        for table, contributions in self.STATS_CONTRIBUTIONS.items():
+            add_new = "\n".join(self._stats_bump_sql(k, d, 'NEW') for k, d in contributions)
+            sub_old = "\n".join(self._stats_bump_sql(k, d, 'OLD', '-') for k, d in contributions)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_insert AFTER INSERT ON {table}
+                BEGIN
+                {add_new}
+                END
+            ''')
+            for columns, group in self._stats_update_groups(contributions).items():
+                group_sub = "\n".join(self._stats_bump_sql(k, d, 'OLD', '-') for k, d in group)
+                group_add = "\n".join(self._stats_bump_sql(k, d, 'NEW') for k, d in group)
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_update_{'_'.join(columns)}
+                    AFTER UPDATE OF {', '.join(columns)} ON {table}
+                    BEGIN
+                    {group_sub}
+                    {group_add}
+                    END
                 ''')
-                
-                # ==================== REFERRALS TABLE ====================
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS referrals (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        referrer_id TEXT NOT NULL,
-                        referred_id TEXT NOT NULL UNIQUE,
-                        commission_amount REAL DEFAULT 0,
-                        status TEXT DEFAULT 'pending' CHECK(status IN ('pending','completed','cancelled')),
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        completed_at DATETIME,
-                        FOREIGN KEY (referrer_id) REFERENCES users (user_id) ON DELETE CASCADE,
-                        FOREIGN KEY (referred_id) REFERENCES users (user_id) ON DELETE CASCADE
-                    )
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_delete AFTER DELETE ON {table}
+                BEGIN
+                {sub_old}
+                END
+            ''')
+
+    def _rebuild_stats_counters(self, cursor):
+        """Hitung ulang stats_counters dari data yang ada (sekali saat tabel dibuat)"""
+        cursor.execute('DELETE FROM stats_counters')
+        for table, contributions in self.STATS_CONTRIBUTIONS.items():
+            for key_expr, delta_expr in contributions:
+                key_expr = key_expr.replace('R.', '')
+                delta_expr = delta_expr.replace('R.', '')
+                cursor.execute(f'''
+                    INSERT INTO stats_counters (key, value)
+                    SELECT {key_expr} AS k, SUM({delta_expr}) FROM {table} WHERE true
+                    GROUP BY k HAVING SUM({delta_expr}) != 0
+                    ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
                 ''')
-                
-                # ==================== CREATE INDEXES ====================
-                indexes = [
-                    # Users indexes
-                    'CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance)',
-                    'CREATE INDEX IF NOT EXISTS idx_users_banned ON users(is_banned)',
-                    'CREATE INDEX IF NOT EXISTS idx_users_active ON users(last_active)',
-                    'CREATE INDEX IF NOT EXISTS idx_users_level ON users(level)',
-                    'CREATE INDEX IF NOT EXISTS idx_users_referral ON users(referral_code)',
-                    
-                    # Products indexes
-                    'CREATE INDEX IF NOT EXISTS idx_products_status ON products(status)',
-                    'CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)',
-                    'CREATE INDEX IF NOT EXISTS idx_products_price ON products(price)',
-                    'CREATE INDEX IF NOT EXISTS idx_products_featured ON products(is_featured)',
-                    'CREATE INDEX IF NOT EXISTS idx_products_sort ON products(sort_order)',
-                    
-                    # Transactions indexes
-                    'CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions(status)',
-                    'CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(type)',
-                    'CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at)',
-                    
-                    # Orders indexes
-                    'CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)',
-                    'CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)',
-                    'CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_code)',
-                    'CREATE INDEX IF NOT EXISTS idx_orders_updated ON orders(updated_at)',
-                    
-                    # Topup indexes
-                    'CREATE INDEX IF NOT EXISTS idx_topup_requests_status ON topup_requests(status)',
-                    'CREATE INDEX IF NOT EXISTS idx_topup_requests_user ON topup_requests(user_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_topup_requests_created ON topup_requests(created_at)',
-                    
-                    # Logs indexes
-                    'CREATE INDEX IF NOT EXISTS idx_admin_logs_admin ON admin_logs(admin_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_admin_logs_time ON admin_logs(timestamp)',
-                    'CREATE INDEX IF NOT EXISTS idx_system_logs_level ON system_logs(level)',
-                    'CREATE INDEX IF NOT EXISTS idx_system_logs_time ON system_logs(timestamp)',
-                    
-                    # Notifications indexes
-                    'CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_notifications_read ON notifications(is_read)',
-                    
-                    # Referrals indexes
-                    'CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)',
-                    'CREATE INDEX IF NOT EXISTS idx_referrals_referred ON referrals(referred_id)'
-                ]
-                
-                for index in indexes:
-                    try:
-                        cursor.execute(index)
-                    except Exception as e:
-                        logger.warning(f"Could not create index {index}: {e}")
-                
-                # ==================== DEFAULT DATA ====================
-                default_settings = [
-                    ('system_name', 'Bot System', 'Nama sistem bot'),
-                    ('maintenance_mode', '0', 'Mode maintenance (1=aktif, 0=nonaktif)'),
-                    ('min_topup', '10000', 'Minimum topup'),
-                    ('max_topup', '1000000', 'Maksimum topup'),
-                    ('admin_contact', '@admin', 'Kontak admin'),
-                    ('auto_sync_products', '1', 'Auto sync products (1=aktif, 0=nonaktif)'),
-                    ('profit_margin', '10', 'Margin profit default (%)'),
-                    ('referral_bonus', '5000', 'Bonus referral untuk referrer'),
-                    ('welcome_bonus', '0', 'Bonus saldo untuk user baru'),
-                    ('order_timeout', '30', 'Timeout order dalam menit'),
-                    ('topup_expiry', '24', 'Expiry topup dalam jam'),
-                    ('currency', 'Rp', 'Simbol mata uang'),
-                    ('language', 'id', 'Bahasa default'),
-                    ('max_retry', '3', 'Max retry untuk order'),
-                    ('backup_interval', '24', 'Interval backup dalam jam')
-                ]
-                
-                cursor.executemany('''
-                    INSERT OR IGNORE INTO settings (key, value, description) 
-                    VALUES (?, ?, ?)
-                ''', default_settings)
-                
-                # Default categories
-                default_categories = [
-                    ('Pulsa', 'Produk pulsa semua operator', 1),
-                    ('Data', 'Paket internet dan kuota', 2),
-                    ('E-Money', 'E-money dan dompet digital', 3),
-                    ('Voucher', 'Voucher game dan entertainment', 4),
-                    ('PLN', 'Token dan tagihan listrik', 5),
-                    ('BPJS', 'Pembayaran BPJS', 6),
-                    ('PDAM', 'Tagihan air PDAM', 7)
-                ]
-                
-                cursor.executemany('''
-                    INSERT OR IGNORE INTO categories (name, description, sort_order) 
-                    VALUES (?, ?, ?)
-                ''', default_categories)
-                
-                logger.info("✅ Database initialized successfully with ALL features")
-                
+        logger.info("📊 Stats counters rebuilt")
+
+    # ==================== PER-USER AGGREGATES ====================
+    # Kolom user_stats per tabel sumber: (kolom user, kolom yang memicu update, [(kolom, delta)])
+    USER_STATS_CONTRIBUTIONS = {
+        'orders': ('user_id', ['user_id', 'status', 'price'], [
+            ('successful_orders', "CASE WHEN R.status = 'completed' THEN 1 ELSE 0 END"),
+            ('success_spent', "CASE WHEN R.status = 'completed' THEN R.price ELSE 0 END"),
+        ]),
+        'transactions': ('user_id', ['user_id', 'type', 'status'], [
+            ('successful_topups', "CASE WHEN R.type = 'topup' AND R.status = 'completed' THEN 1 ELSE 0 END"),
+        ]),
+        'referrals': ('referrer_id', ['referrer_id', 'status'], [
+            ('active_referrals', "CASE WHEN R.status = 'completed' THEN 1 ELSE 0 END"),
+        ]),
+    }
+
+    @staticmethod
+    def _user_stats_bump_sql(user_column: str, contributions: list, row: str, sign: str = '') -> str:
+        columns = [column for column, _ in contributions]
+        deltas = [f"{sign}({delta.replace('R.', f'{row}.')})" for _, delta in contributions]
+        return (
+            f"INSERT INTO user_stats (user_id, {', '.join(columns)}) "
+            f"SELECT {row}.{user_column}, {', '.join(deltas)} "
+            f"WHERE {' OR '.join(f'{delta} != 0' for delta in deltas)} "
+            f"ON CONFLICT(user_id) DO UPDATE SET "
+            f"{', '.join(f'{column} = {column} + excluded.{column}' for column in columns)};"
+        )
+
+    def _create_user_stats_triggers(self, cursor):
+        """Trigger yang menjaga user_stats di transaksi yang sama dengan perubahan baris"""
+        for table, (user_column, columns, contributions) in self.USER_STATS_CONTRIBUTIONS.items():
+            add_new = self._user_stats_bump_sql(user_column, contributions, 'NEW')
+            sub_old = self._user_stats_bump_sql(user_column, contributions, 'OLD', '-')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_{table}_insert AFTER INSERT ON {table}
+                BEGIN
+                {add_new}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_{table}_update
+                AFTER UPDATE OF {', '.join(columns)} ON {table}
+                BEGIN
+                {sub_old}
+                {add_new}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_{table}_delete AFTER DELETE ON {table}
+                BEGIN
+                {sub_old}
+                END
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_users_delete AFTER DELETE ON users
+            BEGIN
+                DELETE FROM user_stats WHERE user_id = OLD.user_id;
+            END
+        ''')
+
+    def _rebuild_user_stats(self, cursor):
+        """Hitung ulang user_stats dari orders/transactions/referrals"""
+        cursor.execute('DELETE FROM user_stats')
+        for table, (user_column, _, contributions) in self.USER_STATS_CONTRIBUTIONS.items():
+            columns = [column for column, _ in contributions]
+            sums = [f"SUM({delta.replace('R.', '')})" for _, delta in contributions]
+            cursor.execute(f'''
+                INSERT INTO user_stats (user_id, {', '.join(columns)})
+                SELECT {user_column}, {', '.join(sums)} FROM {table}
+                WHERE {user_column} IN (SELECT user_id FROM users)
+                GROUP BY {user_column} HAVING {' OR '.join(f'{s} != 0' for s in sums)}
+                ON CONFLICT(user_id) DO UPDATE SET
+                {', '.join(f'{column} = {column} + excluded.{column}' for column in columns)}
+            ''')
+        logger.info("📊 User stats rebuilt")
+
+    # Flag di stats_counters selama DELETE archive/retensi: trigger DELETE rollup
+    # tidak mengantre hari lama (rollup-nya harus tetap ada setelah baris pindah)
+    ROLLUP_PAUSE_KEY = 'rollup:paused'
+
+    def _create_rollup_triggers(self, cursor):
+        """Trigger yang mencatat hari yang berubah ke rollup_changes"""
+        sources = {
+            'orders': ('status, price, profit, user_id, created_at', None),
+            'transactions': ('type, status, amount, created_at', "R.type = 'topup'"),
+        }
+        new_day, old_day = epoch_day_sql('NEW.created_at'), epoch_day_sql('OLD.created_at')
+        for table, (columns, condition) in sources.items():
+            when_new = f"WHEN {condition.replace('R.', 'NEW.')}" if condition else ""
+            not_paused = f"NOT EXISTS (SELECT 1 FROM stats_counters WHERE key = '{self.ROLLUP_PAUSE_KEY}')"
+            when_old = f"WHEN {condition.replace('R.', 'OLD.') + ' AND ' if condition else ''}{not_paused}"
+            when_any = (f"WHEN {condition.replace('R.', 'NEW.')} OR {condition.replace('R.', 'OLD.')}"
+                        if condition else "")
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_rollup_{table}_insert AFTER INSERT ON {table}
+                {when_new}
+                BEGIN
+                    INSERT INTO rollup_changes (day) VALUES ({new_day});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_rollup_{table}_update AFTER UPDATE OF {columns} ON {table}
+                {when_any}
+                BEGIN
+                    INSERT INTO rollup_changes (day) VALUES ({new_day});
+                    INSERT INTO rollup_changes (day) SELECT {old_day}
+                    WHERE {old_day} IS NOT {new_day};
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_rollup_{table}_delete AFTER DELETE ON {table}
+                {when_old}
+                BEGIN
+                    INSERT INTO rollup_changes (day) VALUES ({old_day});
+                END
+            ''')
+
+    def _recompute_rollup_day(self, conn, day: str):
+        """Hitung ulang stats_daily + stats_hourly untuk satu hari (range scan idx created_at)"""
+        start = datetime.strptime(day, '%Y-%m-%d')
+        bounds = {'day': day, 'start': start, 'end': start + timedelta(days=1)}
+        day_range = "created_at >= :start AND created_at < :end"
+        conn.execute('DELETE FROM stats_daily WHERE day = :day', bounds)
+        conn.execute("DELETE FROM stats_hourly WHERE hour >= :day AND hour < date(:day, '+1 day')", bounds)
+        for rollup_table, bucket, bucket_expr in (
+            ('stats_daily', 'day', epoch_day_sql('created_at')),
+            ('stats_hourly', 'hour', epoch_hour_sql('created_at')),
+        ):
+            conn.execute(f'''
+                INSERT INTO {rollup_table} ({bucket}, orders, completed_orders, revenue, profit, active_users)
+                SELECT {bucket_expr} AS bucket, COUNT(*),
+                       SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN status = 'completed' THEN price ELSE 0 END),
+                       SUM(CASE WHEN status = 'completed' THEN profit ELSE 0 END),
+                       COUNT(DISTINCT user_id)
+                FROM orders WHERE {day_range}
+                GROUP BY bucket
+            ''', bounds)
+            conn.execute(f'''
+                INSERT INTO {rollup_table} ({bucket}, topups, topup_count)
+                SELECT {bucket_expr} AS bucket, SUM(amount), COUNT(*)
+                FROM transactions
+                WHERE type = 'topup' AND status = 'completed' AND {day_range}
+                GROUP BY bucket
+                ON CONFLICT({bucket}) DO UPDATE SET topups = excluded.topups, topup_count = excluded.topup_count
+            ''', bounds)
+
+    def _pause_rollups(self, conn, paused: bool):
+        """Set/hapus flag ROLLUP_PAUSE_KEY; dipakai di dalam satu transaksi DELETE"""
+        if paused:
+            conn.execute('INSERT OR IGNORE INTO stats_counters (key, value) VALUES (?, 1)',
+                         (self.ROLLUP_PAUSE_KEY,))
+        else:
+            conn.execute('DELETE FROM stats_counters WHERE key = ?', (self.ROLLUP_PAUSE_KEY,))
+
+    def _refresh_rollups_tx(self, conn) -> int:
+        row = conn.execute("SELECT value FROM stats_counters WHERE key = 'rollup:watermark'").fetchone()
+        watermark = int(row['value']) if row else 0
+        latest = conn.execute('SELECT MAX(id) FROM rollup_changes').fetchone()[0]
+        if not latest or latest <= watermark:
+            return 0
+        
+        days = [r[0] for r in conn.execute(
+            'SELECT DISTINCT day FROM rollup_changes WHERE id > ? AND id <= ? AND day IS NOT NULL',
+            (watermark, latest)
+        ).fetchall()]
+        for day in days:
+            self._recompute_rollup_day(conn, day)
+        
+        conn.execute('DELETE FROM rollup_changes WHERE id <= ?', (latest,))
+        conn.execute('''
+            INSERT INTO stats_counters (key, value) VALUES ('rollup:watermark', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (latest,))
+        return len(days)
+
+    def refresh_rollups(self) -> int:
+        """Proses perubahan sejak watermark ke stats_daily/stats_hourly; return jumlah hari"""
+        try:
+            refreshed = self._write(self._refresh_rollups_tx)
+            if refreshed:
+                logger.info(f"📈 Rollups refreshed for {refreshed} day(s)")
+            return refreshed
         except Exception as e:
-            logger.error(f"❌ Database initialization failed: {e}", exc_info=True)
-            raise
+            logger.error(f"Error refreshing rollups: {e}")
+            return 0
+
+    def rebuild_stats_counters(self) -> bool:
+        """Rebuild manual stats_counters (mis. setelah edit data langsung di DB)"""
+        try:
+            with self.get_connection() as conn:
+                self._rebuild_stats_counters(conn.cursor())
+                self._rebuild_user_stats(conn.cursor())
+                return True
+        except Exception as e:
+            logger.error(f"Error rebuilding stats counters: {e}")
+            return False
+
+    def get_stats_counters(self, *keys: str) -> Dict[str, float]:
+        """Ambil beberapa counter sekaligus (default 0)"""
+        with self.get_connection() as conn:
+            placeholders = ','.join('?' * len(keys))
+            cursor = conn.execute(
+                f'SELECT key, value FROM stats_counters WHERE key IN ({placeholders})', keys
+            )
+            values = {key: 0 for key in keys}
+            values.update({row['key']: row['value'] for row in cursor.fetchall()})
+            return values
+
+    def _migration_pagination_indexes(self, cursor):
+        """Index yang mencakup key seek lengkap untuk get_*_page"""
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_status_page ON products(status, category, sort_order, name, code)')
+        cursor.execute('DROP INDEX IF EXISTS idx_products_status_category')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registered ON users(registered_at, user_id)')
+
+    def _migration_product_search(self, cursor):
+        """products_fts (FTS5, external content = products) + trigger sinkronisasi"""
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    code, name, description, category,
+                    content='products', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            # SQLite tanpa FTS5: search_products fallback ke scan katalog
+            logger.warning(f"⚠️ FTS5 not available, product search uses catalog scan: {e}")
+            return
+        
+        columns = 'code, name, description, category'
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, {columns})
+                VALUES (NEW.rowid, NEW.code, NEW.name, NEW.description, NEW.category);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, {columns})
+                VALUES ('delete', OLD.rowid, OLD.code, OLD.name, OLD.description, OLD.category);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+            AFTER UPDATE OF {columns} ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, {columns})
+                VALUES ('delete', OLD.rowid, OLD.code, OLD.name, OLD.description, OLD.category);
+                INSERT INTO products_fts (rowid, {columns})
+                VALUES (NEW.rowid, NEW.code, NEW.name, NEW.description, NEW.category);
+            END
+        ''')
+        cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+    def _migration_user_stats(self, cursor):
+        """Tabel user_stats (agregat per user) + trigger, diisi dari data yang ada"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY,
+                successful_orders INTEGER NOT NULL DEFAULT 0,
+                successful_topups INTEGER NOT NULL DEFAULT 0,
+                success_spent REAL NOT NULL DEFAULT 0,
+                active_referrals INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._create_user_stats_triggers(cursor)
+        self._rebuild_user_stats(cursor)
+
+    # Kolom uang per tabel yang dikonversi REAL -> INTEGER rupiah oleh migrasi 9
+    MONEY_COLUMNS = {
+        'users': ('balance', 'total_spent', 'bonus_balance'),
+        'products': ('price', 'cost_price'),
+        'orders': ('price', 'profit', 'cost'),
+        'transactions': ('amount',),
+        'topup_requests': ('amount', 'total_amount'),
+        'topups': ('amount',),
+        'referrals': ('commission_amount',),
+        'user_stats': ('success_spent',),
+        'stats_counters': ('value',),
+        'stats_daily': ('revenue', 'profit', 'topups'),
+        'stats_hourly': ('revenue', 'profit', 'topups'),
+    }
+    # Kolom waktu per tabel yang dikonversi DATETIME/TEXT -> EPOCH (unix epoch) oleh migrasi 10
+    TIMESTAMP_COLUMNS = {
+        'users': ('registered_at', 'last_active'),
+        'products': ('updated_at', 'created_at'),
+        'transactions': ('created_at', 'completed_at'),
+        'orders': ('created_at', 'processed_at', 'completed_at', 'refunded_at', 'updated_at'),
+        'topup_requests': ('expires_at', 'created_at', 'updated_at'),
+        'admin_logs': ('timestamp',),
+        'system_logs': ('timestamp',),
+        'settings': ('updated_at',),
+        'notifications': ('created_at',),
+        'categories': ('created_at',),
+        'referrals': ('created_at', 'completed_at'),
+        'topups': ('created_at', 'approved_at'),
+    }
+    # Kolom yang nilai polos 'YYYY-MM-DD HH:MM:SS'-nya ditulis kode lama sebagai waktu lokal
+    # (datetime.now().strftime di admin_handler / script updateproduk), bukan CURRENT_TIMESTAMP (UTC)
+    LOCAL_PLAIN_TIMESTAMP_COLUMNS = {
+        ('products', 'updated_at'),
+        ('topups', 'approved_at'),
+    }
+    EPOCH_DEFAULT = "DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))"
+    REBUILD_COPY_BATCH = 5000
+
+    def _migration_integer_money(self, cursor):
+        """Kolom uang REAL -> INTEGER rupiah (rebuild tabel, data disalin per batch rowid)"""
+        for table, columns in self.MONEY_COLUMNS.items():
+            self._rebuild_table(cursor, table, {
+                column: (r'REAL\b', lambda match: 'INTEGER', f'CAST(ROUND({column}) AS INTEGER)')
+                for column in columns
+            })
+        # Agregat dihitung ulang dari nominal yang sudah dibulatkan (jumlah jadi exact)
+        self._rebuild_stats_counters(cursor)
+        self._rebuild_user_stats(cursor)
+        cursor.execute('''
+            INSERT INTO rollup_changes (day)
+            SELECT DISTINCT day FROM stats_daily
+        ''')
+
+    @staticmethod
+    def _epoch_backfill_sql(column: str, plain_is_local: bool = False) -> str:
+        """Nilai waktu lama -> epoch.
+
+        String dengan offset eksplisit ('Z' / '+07:00') dikonversi apa adanya;
+        string dengan pecahan detik / 'T' tanpa offset berasal dari datetime di
+        Python (waktu lokal). 'YYYY-MM-DD HH:MM:SS' polos berasal dari
+        CURRENT_TIMESTAMP (UTC), kecuali ``plain_is_local`` (kolom yang ditulis
+        dengan datetime.now().strftime, lihat LOCAL_PLAIN_TIMESTAMP_COLUMNS).
+        """
+        plain_modifier = ", 'utc'" if plain_is_local else ''
+        return f'''CASE
+            WHEN {column} IS NULL OR {column} = '' THEN NULL
+            WHEN typeof({column}) IN ('integer', 'real') THEN CAST({column} AS INTEGER)
+            WHEN upper({column}) LIKE '%Z'
+                OR substr({column}, 20) GLOB '*[+-][0-9][0-9]:[0-9][0-9]'
+                THEN CAST(strftime('%s', {column}) AS INTEGER)
+            WHEN length({column}) > 19 OR instr({column}, 'T') > 0
+                THEN CAST(strftime('%s', {column}, 'utc') AS INTEGER)
+            ELSE CAST(strftime('%s', {column}{plain_modifier}) AS INTEGER)
+        END'''
+
+    def _migration_epoch_timestamps(self, cursor):
+        """Kolom waktu -> INTEGER unix epoch (rebuild tabel + backfill per batch rowid)"""
+        def epoch_type(match):
+            return f'EPOCH {self.EPOCH_DEFAULT}' if 'DEFAULT' in match.group(0).upper() else 'EPOCH'
+        
+        for table, columns in self.TIMESTAMP_COLUMNS.items():
+            self._rebuild_table(cursor, table, {
+                column: (r'(?:DATETIME|TEXT)\b(?:\s+DEFAULT\s+CURRENT_TIMESTAMP)?', epoch_type,
+                         self._epoch_backfill_sql(column, (table, column) in self.LOCAL_PLAIN_TIMESTAMP_COLUMNS))
+                for column in columns
+            })
+        
+        # Trigger statistik memakai bucket hari dari epoch; dibuat ulang lalu agregat dihitung ulang
+        for (name,) in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND (name LIKE 'trg_stats_%' OR name LIKE 'trg_rollup_%')"
+        ).fetchall():
+            cursor.execute(f'DROP TRIGGER {name}')
+        self._create_stats_triggers(cursor)
+        self._create_rollup_triggers(cursor)
+        self._rebuild_stats_counters(cursor)
+        cursor.execute('DELETE FROM stats_daily')
+        cursor.execute('DELETE FROM stats_hourly')
+        cursor.execute('DELETE FROM rollup_changes')
+        cursor.execute(f'''
+            INSERT INTO rollup_changes (day)
+            SELECT DISTINCT {epoch_day_sql('created_at')} FROM orders WHERE created_at IS NOT NULL
+            UNION
+            SELECT DISTINCT {epoch_day_sql('created_at')} FROM transactions WHERE type = 'topup' AND created_at IS NOT NULL
+        ''')
+
+    def _migration_provider_fingerprint(self, cursor):
+        """products.provider_fingerprint; NULL = belum pernah disync, ditulis pada sync berikutnya"""
+        self._ensure_product_columns(cursor)
+
+    def _migration_stats_update_triggers(self, cursor):
+        """Ganti trigger UPDATE stats per tabel dengan trigger per kelompok kolom (counter tetap valid)"""
+        for (name,) in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_stats_%' AND name LIKE '%_update%'"
+        ).fetchall():
+            cursor.execute(f'DROP TRIGGER {name}')
+        self._create_stats_triggers(cursor)
+
+    def _migration_rollup_delete_triggers(self, cursor):
+        """Trigger DELETE rollup dibuat ulang dengan cek ROLLUP_PAUSE_KEY"""
+        for (name,) in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rollup_%_delete'"
+        ).fetchall():
+            cursor.execute(f'DROP TRIGGER {name}')
+        self._create_rollup_triggers(cursor)
+
+    def _rebuild_table(self, cursor, table: str, conversions: Dict[str, tuple]):
+        """Rebuild satu tabel dengan tipe kolom baru.
+
+        ``conversions``: {kolom: (pola tipe lama, fungsi tipe baru, ekspresi SELECT)}.
+        SQLite tidak bisa ALTER COLUMN: buat ``{table}_new`` dari SQL CREATE yang
+        ada (tipe kolom diganti), salin baris per batch rowid lewat ekspresi
+        konversi, drop tabel lama, rename, lalu buat ulang index dan trigger-nya.
+        rowid dipertahankan (products_fts memakai rowid). Harus dijalankan dengan
+        foreign_keys = OFF (lihat init_database).
+        """
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not row:
+            return
+        create_sql = row[0]
+        for column, (pattern, new_type, _) in conversions.items():
+            create_sql = re.sub(rf'(\b{column}\s+){pattern}',
+                                lambda match: match.group(1) + new_type(match), create_sql)
+        if create_sql == row[0]:
+            return  # sudah dikonversi
+        
+        new_table = f'{table}_new'
+        cursor.execute(f'DROP TABLE IF EXISTS {new_table}')
+        cursor.execute(re.sub(rf'^(\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?)["`]?{table}\b["`]?',
+                              rf'\1{new_table}', create_sql, count=1, flags=re.IGNORECASE))
+        
+        names = [name for name, _ in self._table_columns(cursor.connection, table)]
+        fk_violations = len(cursor.execute('PRAGMA foreign_key_check').fetchall())
+        select_list = ', '.join(
+            conversions[name][2] if name in conversions else name for name in names
+        )
+        column_list = ', '.join(names)
+        last_rowid, copied = None, 0
+        while True:
+            where = 'WHERE rowid > ?' if last_rowid is not None else ''
+            params = (last_rowid,) if last_rowid is not None else ()
+            bounds = cursor.execute(f'''
+                SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM (
+                    SELECT rowid FROM {table} {where} ORDER BY rowid LIMIT {self.REBUILD_COPY_BATCH}
+                )
+            ''', params).fetchone()
+            if not bounds[2]:
+                break
+            cursor.execute(f'''
+                INSERT INTO {new_table} (rowid, {column_list})
+                SELECT rowid, {select_list} FROM {table} WHERE rowid BETWEEN ? AND ?
+            ''', (bounds[0], bounds[1]))
+            last_rowid = bounds[1]
+            copied += bounds[2]
+        
+        # Index/trigger ikut terhapus bersama tabel lama; dibuat ulang setelah rename
+        dependents = [r[0] for r in cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()]
+        sequence = None
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            seq_row = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+            sequence = seq_row[0] if seq_row else None
+        
+        cursor.execute(f'DROP TABLE {table}')
+        # legacy_alter_table: jangan tulis ulang trigger tabel lain yang merujuk tabel ini
+        cursor.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            cursor.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+        finally:
+            cursor.execute('PRAGMA legacy_alter_table = OFF')
+        for sql in dependents:
+            cursor.execute(sql)
+        if sequence is not None:
+            # AUTOINCREMENT: id yang pernah dipakai (lalu dihapus) tidak boleh dipakai ulang
+            cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (sequence, table))
+        if len(cursor.execute('PRAGMA foreign_key_check').fetchall()) > fk_violations:
+            raise sqlite3.IntegrityError(f"Rebuilding {table} introduced foreign key violations")
+        logger.info(f"🧱 {table}: {copied} rows rebuilt ({', '.join(conversions)})")
 
     # ==================== USER MANAGEMENT ====================
     def get_or_create_user(self, user_id: str, username: str = "", full_name: str = "", **kwargs) -> Dict[str, Any]:
         """Get existing user or create new one dengan semua field opsional"""
         try:
+            cached = self.user_cache.get(str(user_id))
+            if (cached is not None and not cached['is_banned'] and not kwargs
+                    and (not username or username == cached['username'])
+                    and (not full_name or full_name == cached['full_name'])):
+                return cached
+            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
@@ -443,6 +2106,7 @@ class DatabaseManager:
                         
                         update_query = f"UPDATE users SET {', '.join(update_fields)} WHERE user_id = ?"
                         cursor.execute(update_query, params)
+                        self._invalidate_user(user_id)
                         logger.info(f"📝 User updated: {user_id}")
                 else:
                     # Generate referral code untuk user baru
@@ -457,14 +2121,15 @@ class DatabaseManager:
                     )
                     
                     # Apply welcome bonus jika ada
-                    welcome_bonus = self.get_setting('welcome_bonus', 0)
-                    if float(welcome_bonus) > 0:
+                    welcome_bonus = to_rupiah(self.get_setting('welcome_bonus', 0))
+                    if welcome_bonus > 0:
                         cursor.execute(
                             'UPDATE users SET balance = balance + ? WHERE user_id = ?',
-                            (float(welcome_bonus), str(user_id))
+                            (welcome_bonus, str(user_id))
                         )
                         logger.info(f"🎁 Welcome bonus {welcome_bonus} given to new user: {user_id}")
                     
+                    self._invalidate_user(user_id)
                     logger.info(f"👤 New user created: {user_id} - {full_name}")
                 
                 # Return user data
@@ -477,96 +2142,192 @@ class DatabaseManager:
             raise
 
     def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get user data by ID"""
+        """Get user data by ID - lewat LRU user cache"""
         try:
+            user_id = str(user_id)
+            user = self.user_cache.get(user_id)
+            if user is not None:
+                return user
+            epoch = self.user_cache.epoch()
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE user_id = ?', (str(user_id),))
+                cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
                 result = cursor.fetchone()
-                return dict(result) if result else None
+                if not result:
+                    return None
+                user = dict(result)
+                # Jangan cache dari dalam transaksi yang belum di-commit
+                if not conn.in_transaction:
+                    self.user_cache.put(user_id, user, epoch)
+                return user
         except Exception as e:
             logger.error(f"Error getting user {user_id}: {e}")
             return None
 
-    def get_user_balance(self, user_id: str) -> float:
-        """Get user balance"""
+    def get_user_balance(self, user_id: str) -> int:
+        """Get user balance (rupiah)"""
         try:
             user = self.get_user(user_id)
-            return user['balance'] if user else 0.0
+            return user['balance'] if user else 0
         except Exception as e:
             logger.error(f"Error getting balance for {user_id}: {e}")
-            return 0.0
+            return 0
 
-    def update_user_balance(self, user_id: str, amount: float, note: str = "", transaction_type: str = "adjustment") -> bool:
-        """Update user balance dengan transaction logging"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Check if user exists and not banned
-                cursor.execute(
-                    'SELECT balance, is_banned FROM users WHERE user_id = ?', 
-                    (str(user_id),)
-                )
-                user = cursor.fetchone()
-                
-                if not user:
-                    raise ValueError(f"User {user_id} not found")
-                
-                if user['is_banned']:
-                    raise PermissionError(f"User {user_id} is banned")
-                
-                new_balance = user['balance'] + amount
-                if new_balance < 0:
-                    raise ValueError("Insufficient balance")
-                
-                # Update balance
-                cursor.execute(
-                    'UPDATE users SET balance = ?, last_active = ? WHERE user_id = ?',
-                    (new_balance, datetime.now(), str(user_id))
-                )
-                
-                # Log transaction - FIXED: menggunakan type yang valid
-                if amount != 0:
-                    status = 'completed' if amount > 0 else 'pending'
-                    valid_types = ['topup', 'withdraw', 'refund', 'bonus', 'order', 'commission', 'adjustment']
-                    
-                    # Pastikan transaction_type valid
-                    if transaction_type not in valid_types:
-                        transaction_type = 'adjustment'
-                    
-                    cursor.execute('''
-                        INSERT INTO transactions (user_id, type, amount, status, details, completed_at)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (str(user_id), transaction_type, amount, status, note, 
-                          datetime.now() if amount > 0 else None))
-                
-                logger.info(f"💰 Balance updated: {user_id} -> {amount:,.0f} | New: {new_balance:,.0f} | Note: {note}")
-                return True
-                    
+    def update_user_balance(self, user_id: str, amount: int, note: str = "", transaction_type: str = "adjustment") -> bool:
+        """Update user balance dengan transaction logging"""
+        try:
+            amount = to_rupiah(amount)
+            new_balance = self._write(self._update_user_balance_tx, user_id, amount, note, transaction_type)
+            logger.info(f"💰 Balance updated: {user_id} -> {amount:,.0f} | New: {new_balance:,.0f} | Note: {note}")
+            return True
         except Exception as e:
             logger.error(f"Error updating balance for {user_id}: {e}")
             return False
 
+    def _update_user_balance_tx(self, conn, user_id: str, amount: int, note: str = "", transaction_type: str = "adjustment") -> int:
+        cursor = conn.cursor()
+        
+        # Check if user exists and not banned
+        cursor.execute(
+            'SELECT is_banned FROM users WHERE user_id = ?', 
+            (str(user_id),)
+        )
+        user = cursor.fetchone()
+        
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        
+        if user['is_banned']:
+            raise PermissionError(f"User {user_id} is banned")
+        
+        # Update balance secara atomik di SQL (bukan read-modify-write di Python)
+        cursor.execute(
+            'UPDATE users SET balance = balance + ?, last_active = ? WHERE user_id = ? AND balance + ? >= 0',
+            (amount, datetime.now(), str(user_id), amount)
+        )
+        if cursor.rowcount == 0:
+            raise ValueError("Insufficient balance")
+        self._invalidate_user(user_id)
+        
+        # Log transaction - FIXED: menggunakan type yang valid
+        if amount != 0:
+            status = 'completed' if amount > 0 else 'pending'
+            valid_types = ['topup', 'withdraw', 'refund', 'bonus', 'order', 'commission', 'adjustment']
+            
+            # Pastikan transaction_type valid
+            if transaction_type not in valid_types:
+                transaction_type = 'adjustment'
+            
+            cursor.execute('''
+                INSERT INTO transactions (user_id, type, amount, status, details, completed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (str(user_id), transaction_type, amount, status, note, 
+                  datetime.now() if amount > 0 else None))
+        
+        cursor.execute('SELECT balance FROM users WHERE user_id = ?', (str(user_id),))
+        return cursor.fetchone()['balance']
+
+    # ==================== LEDGER ====================
+    def debit_user_balance(self, user_id: str, amount: int, note: str = "",
+                           transaction_type: str = "order", reference_id: str = None) -> DebitResult:
+        """Potong saldo secara atomik; hasil DebitResult (truthy hanya jika berhasil).
+
+        Satu ``UPDATE ... WHERE balance >= ?`` plus insert transaksi dalam satu
+        transaksi, sehingga aman dipanggil bersamaan tanpa lock global. Jika
+        ditolak, alasannya (saldo kurang / dibanned / user tidak ada) dibaca di
+        transaksi yang sama.
+        """
+        try:
+            amount = to_rupiah(amount)
+        except ValueError:
+            amount = 0
+        if amount <= 0:
+            logger.warning(f"⛔ Debit rejected for {user_id}: invalid amount {amount}")
+            return DebitResult.INVALID_AMOUNT
+        try:
+            result = self._write(self._debit_user_balance_tx, user_id, amount, note, transaction_type, reference_id)
+            if result:
+                logger.info(f"💸 Balance debited: {user_id} -> {amount:,.0f} | Note: {note}")
+            else:
+                logger.info(f"⛔ Debit rejected for {user_id}: {amount:,.0f} ({result.value})")
+            return result
+        except Exception as e:
+            logger.error(f"Error debiting balance for {user_id}: {e}")
+            return DebitResult.ERROR
+
+    def _debit_user_balance_tx(self, conn, user_id: str, amount: int, note: str = "",
+                               transaction_type: str = "order", reference_id: str = None) -> DebitResult:
+        now = datetime.now()
+        cursor = conn.execute('''
+            UPDATE users SET balance = balance - ?, last_active = ?
+            WHERE user_id = ? AND balance >= ? AND is_banned = 0
+        ''', (amount, now, str(user_id), amount))
+        if cursor.rowcount == 0:
+            row = conn.execute('SELECT is_banned FROM users WHERE user_id = ?', (str(user_id),)).fetchone()
+            if row is None:
+                return DebitResult.NOT_FOUND
+            return DebitResult.BANNED if row[0] else DebitResult.INSUFFICIENT
+        self._invalidate_user(user_id)
+        
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, details, reference_id, completed_at)
+            VALUES (?, ?, ?, 'completed', ?, ?, ?)
+        ''', (str(user_id), transaction_type, -amount, note, reference_id, now))
+        return DebitResult.OK
+
+    def credit_user_balance(self, user_id: str, amount: int, note: str = "",
+                            transaction_type: str = "refund", reference_id: str = None) -> bool:
+        """Tambah saldo secara atomik (refund/bonus) beserta catatan transaksinya"""
+        try:
+            amount = to_rupiah(amount)
+        except ValueError:
+            amount = 0
+        if amount <= 0:
+            logger.warning(f"⛔ Credit rejected for {user_id}: invalid amount {amount}")
+            return False
+        try:
+            credited = self._write(self._credit_user_balance_tx, user_id, amount, note, transaction_type, reference_id)
+            if credited:
+                logger.info(f"💰 Balance credited: {user_id} -> {amount:,.0f} | Note: {note}")
+            return credited
+        except Exception as e:
+            logger.error(f"Error crediting balance for {user_id}: {e}")
+            return False
+
+    def _credit_user_balance_tx(self, conn, user_id: str, amount: int, note: str = "",
+                                transaction_type: str = "refund", reference_id: str = None) -> bool:
+        now = datetime.now()
+        cursor = conn.execute(
+            'UPDATE users SET balance = balance + ?, last_active = ? WHERE user_id = ?',
+            (amount, now, str(user_id))
+        )
+        if cursor.rowcount == 0:
+            return False
+        self._invalidate_user(user_id)
+        
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, details, reference_id, completed_at)
+            VALUES (?, ?, ?, 'completed', ?, ?, ?)
+        ''', (str(user_id), transaction_type, amount, note, reference_id, now))
+        return True
+
     def get_user_stats(self, user_id: str) -> Dict[str, Any]:
         """Get comprehensive user statistics"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
+                # user_stats dijaga trigger: cukup dua lookup primary key
                 cursor.execute('''
                     SELECT 
                         u.*,
-                        COUNT(DISTINCT o.id) as successful_orders,
-                        COUNT(DISTINCT t.id) as successful_topups,
-                        SUM(CASE WHEN o.status = 'completed' THEN o.price ELSE 0 END) as total_success_spent,
-                        COUNT(DISTINCT r.referred_id) as active_referrals
+                        s.successful_orders,
+                        s.successful_topups,
+                        s.success_spent AS total_success_spent,
+                        s.active_referrals
                     FROM users u
-                    LEFT JOIN orders o ON u.user_id = o.user_id AND o.status = 'completed'
-                    LEFT JOIN transactions t ON u.user_id = t.user_id AND t.status = 'completed' AND t.type = 'topup'
-                    LEFT JOIN referrals r ON u.user_id = r.referrer_id AND r.status = 'completed'
+                    LEFT JOIN user_stats s ON s.user_id = u.user_id
                     WHERE u.user_id = ?
-                    GROUP BY u.user_id
                 ''', (str(user_id),))
                 
                 result = cursor.fetchone()
@@ -586,7 +2347,7 @@ class DatabaseManager:
                         'total_spent': result['total_spent'],
                         'total_topups': result['total_topups'],
                         'successful_orders': success_orders,
-                        'successful_topups': result['successful_topups'],
+                        'successful_topups': result['successful_topups'] or 0,
                         'total_success_spent': result['total_success_spent'] or 0,
                         'success_rate': round(success_rate, 2),
                         'total_referred': result['total_referred'],
@@ -602,107 +2363,317 @@ class DatabaseManager:
             return {}
 
     # ==================== PRODUCT MANAGEMENT ====================
+    def invalidate_product_catalog(self) -> int:
+        """Naikkan versi katalog; snapshot dibangun ulang saat dibaca berikutnya"""
+        with self._catalog_lock:
+            self._catalog_version += 1
+            return self._catalog_version
+
+    def _catalog_signature_changed(self, conn) -> bool:
+        """Deteksi perubahan products dari proses lain (webhook, script)"""
+        row = conn.execute('SELECT COUNT(*), MAX(updated_at) FROM products').fetchone()
+        signature = (row[0], str(row[1]))
+        changed = self._catalog_signature is not None and signature != self._catalog_signature
+        self._catalog_signature = signature
+        return changed
+
+    def get_product_catalog(self) -> CatalogSnapshot:
+        """Snapshot katalog produk terbaru (dibangun ulang hanya jika versi berubah)"""
+        snapshot = self._catalog
+        refresh_interval = getattr(config, 'CATALOG_REFRESH_INTERVAL', 5)
+        if snapshot is not None and snapshot.version == self._catalog_version:
+            if time.monotonic() - self._catalog_checked_at < refresh_interval:
+                return snapshot
+            with self.get_connection() as conn:
+                self._catalog_checked_at = time.monotonic()
+                if not self._catalog_signature_changed(conn):
+                    return snapshot
+            self.invalidate_product_catalog()
+
+        with self._catalog_lock:
+            version = self._catalog_version
+            snapshot = self._catalog
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+            with self.get_connection() as conn:
+                cursor = conn.execute('SELECT * FROM products ORDER BY sort_order ASC, name ASC')
+                columns = tuple(col[0] for col in cursor.description)
+                rows = tuple(tuple(row) for row in cursor.fetchall())
+                self._catalog_signature_changed(conn)
+            snapshot = CatalogSnapshot(version, columns, rows)
+            self._catalog = snapshot
+            self._catalog_checked_at = time.monotonic()
+            logger.debug(f"📦 Product catalog snapshot v{version}: {len(rows)} products")
+            return snapshot
+
     def get_products_by_category(self, category: str = None, status: str = 'active', featured: bool = False) -> List[Dict[str, Any]]:
-        """Get products dengan berbagai filter"""
+        """Get products dengan berbagai filter - dari snapshot katalog (read-only)"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                query = 'SELECT * FROM products WHERE 1=1'
-                params = []
-                
-                if category:
-                    query += ' AND category = ?'
-                    params.append(category)
-                
-                if status:
-                    query += ' AND status = ?'
-                    params.append(status)
-                
-                if featured:
-                    query += ' AND is_featured = 1'
-                
-                query += ' ORDER BY sort_order ASC, name ASC'
-                
-                cursor.execute(query, params)
-                return [dict(row) for row in cursor.fetchall()]
+            return self.get_product_catalog().products(category, status, featured)
         except Exception as e:
             logger.error(f"Error getting products: {e}")
             return []
 
     def get_product(self, product_code: str) -> Optional[Dict[str, Any]]:
-        """Get product by code"""
+        """Get product by code - dari snapshot katalog (read-only)"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM products WHERE code = ?', (product_code,))
-                result = cursor.fetchone()
-                return dict(result) if result else None
+            return self.get_product_catalog().get(product_code)
         except Exception as e:
             logger.error(f"Error getting product {product_code}: {e}")
             return None
 
+    # ==================== PRODUCT SEARCH ====================
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Teks bebas -> query FTS5: setiap kata jadi prefix term ("kata"*), digabung AND"""
+        terms = []
+        for word in text.replace('"', ' ').split():
+            word = word.strip()
+            if word:
+                terms.append(f'"{word}"*')
+        return ' '.join(terms)
+
+    def search_products(self, text: str, limit: int = 10, in_stock_only: bool = True) -> List[Dict[str, Any]]:
+        """Cari produk aktif lewat products_fts (ranking bm25: code > name > category > description)"""
+        match = self._fts_query(text or '')
+        if not match:
+            return []
+        stock_filter = 'AND p.stock > 0 AND p.gangguan = 0 AND p.kosong = 0' if in_stock_only else ''
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(f'''
+                    SELECT p.*, bm25(products_fts, 10.0, 5.0, 1.0, 2.0) AS rank
+                    FROM products_fts
+                    JOIN products p ON p.rowid = products_fts.rowid
+                    WHERE products_fts MATCH ? AND p.status = 'active' {stock_filter}
+                    ORDER BY rank
+                    LIMIT ?
+                ''', (match, limit))
+                return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.OperationalError as e:
+            # FTS5 tidak tersedia / query tidak valid: fallback LIKE di snapshot katalog
+            logger.warning(f"⚠️ FTS product search unavailable ({e}), using catalog scan")
+            words = [word.lower() for word in text.split()]
+            results = []
+            for product in self.get_product_catalog().products(status='active'):
+                haystack = ' '.join(str(product.get(column) or '') for column in
+                                    ('code', 'name', 'description', 'category')).lower()
+                if all(word in haystack for word in words):
+                    if in_stock_only and not ((product.get('stock') or 0) > 0 and not product.get('gangguan') and not product.get('kosong')):
+                        continue
+                    results.append(dict(product))
+                    if len(results) >= limit:
+                        break
+            return results
+        except Exception as e:
+            logger.error(f"Error searching products for '{text}': {e}")
+            return []
+
+    def rebuild_product_search(self) -> bool:
+        """Bangun ulang products_fts dari tabel products (mis. setelah edit langsung di DB)"""
+        try:
+            self._write(lambda conn: conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+            logger.info("🔎 Product search index rebuilt")
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding product search index: {e}")
+            return False
+
     def update_product(self, product_code: str, **kwargs) -> bool:
         """Update product data"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                valid_fields = ['name', 'price', 'status', 'description', 'category', 
-                              'provider', 'gangguan', 'kosong', 'stock', 'min_stock',
-                              'max_stock', 'profit_margin', 'cost_price', 'is_featured', 'sort_order']
-                update_fields = []
-                params = []
-                
-                for field, value in kwargs.items():
-                    if field in valid_fields:
-                        update_fields.append(f"{field} = ?")
-                        params.append(value)
-                
-                if not update_fields:
-                    return False
-                
-                update_fields.append("updated_at = ?")
-                params.extend([datetime.now(), product_code])
-                
-                query = f"UPDATE products SET {', '.join(update_fields)} WHERE code = ?"
-                cursor.execute(query, params)
-                
-                logger.info(f"📦 Product updated: {product_code}")
-                return True
-                    
+            if not self._write(self._update_product_tx, product_code, **kwargs):
+                return False
+            self.invalidate_product_catalog()
+            logger.info(f"📦 Product updated: {product_code}")
+            return True
         except Exception as e:
             logger.error(f"Error updating product {product_code}: {e}")
             return False
 
+    def _update_product_tx(self, conn, product_code: str, **kwargs) -> bool:
+        valid_fields = ['name', 'price', 'status', 'description', 'category', 
+                      'provider', 'gangguan', 'kosong', 'stock', 'min_stock',
+                      'max_stock', 'profit_margin', 'cost_price', 'is_featured', 'sort_order']
+        update_fields = []
+        params = []
+        
+        for field, value in kwargs.items():
+            if field in valid_fields:
+                update_fields.append(f"{field} = ?")
+                params.append(to_rupiah(value) if field in ('price', 'cost_price') else value)
+        
+        if not update_fields:
+            return False
+        
+        update_fields.append("updated_at = ?")
+        params.extend([datetime.now(), product_code])
+        
+        query = f"UPDATE products SET {', '.join(update_fields)} WHERE code = ?"
+        conn.execute(query, params)
+        return True
+
     def bulk_update_products(self, products_data: List[Dict]) -> int:
-        """Bulk update products"""
-        updated_count = 0
+        """Bulk upsert products lewat staging table; kolom yang tidak dikirim tetap.
+
+        Produk lama boleh dikirim sebagian (mis. hanya code + price); produk baru
+        wajib menyertakan name dan price.
+        """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                for product in products_data:
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO products 
-                        (code, name, price, status, description, category, provider, stock, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        product['code'], product['name'], product['price'],
-                        product.get('status', 'active'), product.get('description', ''),
-                        product.get('category', 'Umum'), product.get('provider', ''),
-                        product.get('stock', 0), datetime.now()
-                    ))
-                    updated_count += 1
-                
-                logger.info(f"🔄 Bulk updated {updated_count} products")
-                return updated_count
+            stats = self._write(self._bulk_update_products_tx, products_data)
+            self.invalidate_product_catalog()
+            logger.info(f"🔄 Bulk updated {stats['total']} products ({stats['new']} new)")
+            return stats['total']
         except Exception as e:
             logger.error(f"Error in bulk update products: {e}")
             return 0
 
+    def _bulk_update_products_tx(self, conn, products_data: List[Dict]) -> Dict[str, int]:
+        self._stage_products(conn, products_data)
+        return self._upsert_staged_products(conn)
+
+    # ==================== PROVIDER CATALOG SYNC ====================
+    # Kolom products yang diturunkan dari katalog provider; hanya ditulis lewat
+    # sync_provider_products (catalog_sync). Kolom lain (category, sort_order,
+    # is_featured, cost_price, ...) milik admin.
+    PROVIDER_PRODUCT_FIELDS = ('name', 'price', 'description', 'provider', 'gangguan', 'kosong', 'stock')
+
+    # Kolom temp table products_staging -> default untuk produk baru (None = wajib diisi)
+    STAGED_PRODUCT_COLUMNS = OrderedDict([
+        ('name', None), ('price', None), ('status', 'active'), ('description', ''),
+        ('category', 'Umum'), ('provider', ''), ('gangguan', 0), ('kosong', 0), ('stock', 0),
+        ('provider_fingerprint', None),
+    ])
+
+    def _stage_products(self, conn, products: List[Dict[str, Any]]):
+        """executemany ke temp table products_staging (milik koneksi writer).
+
+        Key yang tidak ada di dict produk disimpan NULL: produk lama mempertahankan
+        nilai kolomnya, produk baru mendapat default STAGED_PRODUCT_COLUMNS.
+        """
+        columns = list(self.STAGED_PRODUCT_COLUMNS)
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS products_staging (
+                code TEXT PRIMARY KEY, name TEXT, price INTEGER, status TEXT, description TEXT,
+                category TEXT, provider TEXT, gangguan INTEGER, kosong INTEGER, stock INTEGER,
+                provider_fingerprint TEXT
+            )
+        ''')
+        conn.execute('DELETE FROM products_staging')
+        rows = []
+        for product in products:
+            values = [product.get(column) for column in columns]
+            if values[1] is not None:
+                values[1] = to_rupiah(values[1])
+            rows.append((product['code'], *values))
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO products_staging (code, {', '.join(columns)})
+            VALUES ({', '.join('?' * (len(columns) + 1))})
+        ''', rows)
+
+        defaults = [(column, default) for column, default in self.STAGED_PRODUCT_COLUMNS.items() if default is not None]
+        conn.execute(f'''
+            UPDATE products_staging SET {', '.join(f'{column} = COALESCE({column}, ?)' for column, _ in defaults)}
+            WHERE code NOT IN (SELECT code FROM products)
+        ''', [default for _, default in defaults])
+
+    def _upsert_staged_products(self, conn, skip_unchanged: bool = False,
+                                deactivate_missing: bool = False) -> Dict[str, int]:
+        """Satu INSERT ... ON CONFLICT DO UPDATE dari products_staging + hitungan set-based.
+
+        ``skip_unchanged``: baris dengan provider_fingerprint, status dan stock yang
+        sama tidak ditulis (stock ikut dibandingkan karena order menguranginya
+        secara lokal tanpa mengubah fingerprint). ``deactivate_missing``: produk aktif yang tidak ada di
+        staging dinonaktifkan. Kolom NULL di staging diisi dari baris products
+        yang ada di dalam SELECT (constraint NOT NULL dicek sebelum ON CONFLICT),
+        kecuali provider_fingerprint yang selalu ditimpa: NULL dari
+        bulk_update_products membuat sync katalog berikutnya menulis ulang baris itu.
+        """
+        columns = list(self.STAGED_PRODUCT_COLUMNS)
+        now = datetime.now()
+        unchanged_sql = ('p.provider_fingerprint IS s.provider_fingerprint AND p.status IS s.status '
+                         'AND p.stock IS s.stock' if skip_unchanged else '0')
+        total, new, unchanged = conn.execute(f'''
+            SELECT COUNT(*), COUNT(*) - COUNT(p.code), COALESCE(SUM(p.code IS NOT NULL AND {unchanged_sql}), 0)
+            FROM products_staging s LEFT JOIN products p ON p.code = s.code
+        ''').fetchone()
+
+        selected = ', '.join(
+            f's.{column}' if column == 'provider_fingerprint' else f'COALESCE(s.{column}, p.{column})'
+            for column in columns
+        )
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in columns)
+        changed_only = ('WHERE products.provider_fingerprint IS NOT excluded.provider_fingerprint '
+                        'OR products.status IS NOT excluded.status '
+                        'OR products.stock IS NOT excluded.stock') if skip_unchanged else ''
+        conn.execute(f'''
+            INSERT INTO products (code, {', '.join(columns)}, updated_at)
+            SELECT s.code, {selected}, ?
+            FROM products_staging s LEFT JOIN products p ON p.code = s.code WHERE true
+            ON CONFLICT(code) DO UPDATE SET {assignments}, updated_at = excluded.updated_at
+            {changed_only}
+        ''', (now,))
+
+        stats = {'total': total, 'new': new, 'updated': total - new - unchanged, 'unchanged': unchanged,
+                 'deactivated': 0}
+        if deactivate_missing and total:
+            stats['deactivated'] = conn.execute('''
+                UPDATE products SET status = 'inactive', updated_at = ?
+                WHERE status = 'active' AND code NOT IN (SELECT code FROM products_staging)
+            ''', (now,)).rowcount
+        return stats
+
+    @staticmethod
+    def _products_signature(conn) -> tuple:
+        row = conn.execute('SELECT COUNT(*), MAX(updated_at), SUM(stock) FROM products').fetchone()
+        return (row[0], row[1], row[2])
+
+    def get_products_signature(self) -> Optional[tuple]:
+        """(COUNT, MAX(updated_at), SUM(stock)) tabel products; None jika gagal dibaca"""
+        try:
+            with self.get_connection() as conn:
+                return self._products_signature(conn)
+        except Exception as e:
+            logger.error(f"Error reading products signature: {e}")
+            return None
+
+    def sync_provider_products(self, products: List[Dict[str, Any]], deactivate_missing: bool = True) -> Dict[str, int]:
+        """Terapkan katalog provider (sudah dinormalisasi) dalam satu transaksi tulis.
+
+        Produk di-stage lalu di-upsert sekaligus; hanya produk baru atau yang
+        provider_fingerprint / status / stock-nya berbeda dari DB yang ditulis. Produk lama hanya kolom
+        PROVIDER_PRODUCT_FIELDS + status yang di-update (category hanya untuk
+        produk baru). Produk aktif yang tidak ada lagi di katalog dinonaktifkan.
+        ``stats['signature']`` adalah get_products_signature() tepat setelah apply.
+        """
+        try:
+            stats = self._write(self._sync_provider_products_tx, products, deactivate_missing)
+            if stats['new'] or stats['updated'] or stats['deactivated']:
+                self.invalidate_product_catalog()
+            logger.info(f"🔄 Provider catalog applied: {stats}")
+            return stats
+        except Exception as e:
+            logger.error(f"Error syncing provider products: {e}")
+            return {}
+
+    def _sync_provider_products_tx(self, conn, products: List[Dict[str, Any]], deactivate_missing: bool) -> Dict[str, int]:
+        provider_fields = ('code', 'category') + self.PROVIDER_PRODUCT_FIELDS
+        staged = []
+        for product in products:
+            row = {field: product.get(field) for field in provider_fields}
+            row['status'] = 'active'
+            row['provider_fingerprint'] = provider_fingerprint(product)
+            staged.append(row)
+        self._stage_products(conn, staged)
+        # category milik admin setelah insert: jangan timpa produk lama
+        conn.execute('UPDATE products_staging SET category = NULL WHERE code IN (SELECT code FROM products)')
+        stats = self._upsert_staged_products(conn, skip_unchanged=True, deactivate_missing=deactivate_missing)
+        # Dibaca di transaksi yang sama supaya tulisan lain setelah commit tetap terdeteksi
+        stats['signature'] = self._products_signature(conn)
+        return stats
+
     # ==================== TOPUP MANAGEMENT ====================
-    def create_topup_request(self, user_id: str, amount: float, payment_method: str = "", 
+    def create_topup_request(self, user_id: str, amount: int, payment_method: str = "", 
                            proof_image: str = "", unique_code: int = 0, status: str = "pending") -> int:
         """Create new topup request dengan expiry"""
         try:
@@ -716,6 +2687,7 @@ class DatabaseManager:
                 if unique_code == 0:
                     unique_code = random.randint(1, 999)
                 
+                amount = to_rupiah(amount)
                 total_amount = amount + unique_code
                 
                 # Set expiry time
@@ -740,7 +2712,7 @@ class DatabaseManager:
             logger.error(f"Error creating topup request: {e}")
             raise
 
-    def create_topup(self, user_id: str, amount: float, payment_method: str = "", 
+    def create_topup(self, user_id: str, amount: int, payment_method: str = "", 
                     status: str = "pending", unique_code: int = 0, **kwargs) -> int:
         """Compatible create_topup function dengan **kwargs"""
         return self.create_topup_request(
@@ -798,26 +2770,23 @@ class DatabaseManager:
                 user_id = topup['user_id']
                 amount = topup['amount']
                 
-                # Update user balance dalam transaction yang sama
-                cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-                user = cursor.fetchone()
-                
-                if not user:
-                    raise ValueError(f"User {user_id} not found")
-                
-                new_balance = user['balance'] + amount
-                
-                cursor.execute(
-                    'UPDATE users SET balance = ?, last_active = ?, total_topups = total_topups + 1 WHERE user_id = ?',
-                    (new_balance, datetime.now(), user_id)
-                )
-                
-                # Update topup status
+                # Update topup status - hanya jika masih pending (cegah double approve)
                 cursor.execute('''
                     UPDATE topup_requests 
                     SET status = 'approved', updated_at = ?, admin_notes = ?
-                    WHERE id = ?
+                    WHERE id = ? AND status = 'pending'
                 ''', (datetime.now(), f"Approved by admin {admin_id}", topup_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Topup {topup_id} already processed")
+                
+                # Update user balance dalam transaction yang sama
+                cursor.execute(
+                    'UPDATE users SET balance = balance + ?, last_active = ?, total_topups = total_topups + 1 WHERE user_id = ?',
+                    (amount, datetime.now(), user_id)
+                )
+                if cursor.rowcount == 0:
+                    raise ValueError(f"User {user_id} not found")
+                self._invalidate_user(user_id)
                 
                 # Create transaction record
                 cursor.execute('''
@@ -866,24 +2835,18 @@ class DatabaseManager:
                 if product['status'] != 'active':
                     raise ValueError(f"Product {product_code} is not active")
                 
-                # Check user balance
-                user_balance = self.get_user_balance(user_id)
-                if user_balance < product['price']:
-                    raise ValueError("Insufficient balance")
-                
                 # Calculate profit
                 cost_price = product.get('cost_price', 0)
                 profit = product['price'] - cost_price
                 
-                # Deduct balance
-                cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-                user = cursor.fetchone()
-                new_balance = user['balance'] - product['price']
-                
+                # Deduct balance (atomic conditional debit)
                 cursor.execute(
-                    'UPDATE users SET balance = ?, last_active = ? WHERE user_id = ?',
-                    (new_balance, datetime.now(), user_id)
+                    'UPDATE users SET balance = balance - ?, last_active = ? WHERE user_id = ? AND balance >= ?',
+                    (product['price'], datetime.now(), str(user_id), product['price'])
                 )
+                if cursor.rowcount == 0:
+                    raise ValueError("Insufficient balance")
+                self._invalidate_user(user_id)
                 
                 # Create order
                 cursor.execute('''
@@ -912,62 +2875,102 @@ class DatabaseManager:
     def update_order_status(self, order_id: int, status: str, sn: str = "", note: str = "", response_data: str = "") -> bool:
         """Update order status dengan semua field opsional"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                update_fields = ["status = ?", "updated_at = ?"]
-                params = [status, datetime.now()]
-                
-                if sn:
-                    update_fields.append("sn = ?")
-                    params.append(sn)
-                
-                if note:
-                    update_fields.append("note = ?")
-                    params.append(note)
-                
-                if response_data:
-                    update_fields.append("response_data = ?")
-                    params.append(response_data)
-                
-                if status == 'completed':
-                    update_fields.append("completed_at = ?")
-                    params.append(datetime.now())
-                    # Update total spent
-                    cursor.execute('SELECT user_id, price FROM orders WHERE id = ?', (order_id,))
-                    order = cursor.fetchone()
-                    if order:
-                        cursor.execute(
-                            'UPDATE users SET total_spent = total_spent + ? WHERE user_id = ?',
-                            (order['price'], order['user_id'])
-                        )
-                elif status == 'processing':
-                    update_fields.append("processed_at = ?")
-                    params.append(datetime.now())
-                elif status == 'refunded':
-                    update_fields.append("refunded_at = ?")
-                    params.append(datetime.now())
-                    # Refund balance
-                    cursor.execute('SELECT user_id, price FROM orders WHERE id = ?', (order_id,))
-                    order = cursor.fetchone()
-                    if order:
-                        cursor.execute(
-                            'UPDATE users SET balance = balance + ? WHERE user_id = ?',
-                            (order['price'], order['user_id'])
-                        )
-                
-                params.append(order_id)
-                
-                query = f"UPDATE orders SET {', '.join(update_fields)} WHERE id = ?"
-                cursor.execute(query, params)
-                
-                logger.info(f"📦 Order {order_id} status updated to: {status}")
-                return True
-                    
+            self._write(self._update_order_status_tx, order_id, status, sn, note, response_data)
+            logger.info(f"📦 Order {order_id} status updated to: {status}")
+            return True
         except Exception as e:
             logger.error(f"Error updating order {order_id}: {e}")
             return False
 
+    def _update_order_status_tx(self, conn, order_id: int, status: str, sn: str = "", note: str = "", response_data: str = ""):
+        cursor = conn.cursor()
+        
+        update_fields = ["status = ?", "updated_at = ?"]
+        params = [status, datetime.now()]
+        
+        if sn:
+            update_fields.append("sn = ?")
+            params.append(sn)
+        
+        if note:
+            update_fields.append("note = ?")
+            params.append(note)
+        
+        if response_data:
+            update_fields.append("response_data = ?")
+            params.append(response_data)
+        
+        if status == 'completed':
+            update_fields.append("completed_at = ?")
+            params.append(datetime.now())
+            # Update total spent
+            cursor.execute('SELECT user_id, price FROM orders WHERE id = ?', (order_id,))
+            order = cursor.fetchone()
+            if order:
+                cursor.execute(
+                    'UPDATE users SET total_spent = total_spent + ? WHERE user_id = ?',
+                    (order['price'], order['user_id'])
+                )
+                self._invalidate_user(order['user_id'])
+        elif status == 'processing':
+            update_fields.append("processed_at = ?")
+            params.append(datetime.now())
+        elif status == 'refunded':
+            update_fields.append("refunded_at = ?")
+            params.append(datetime.now())
+            # Refund balance
+            cursor.execute('SELECT user_id, price FROM orders WHERE id = ?', (order_id,))
+            order = cursor.fetchone()
+            if order:
+                cursor.execute(
+                    'UPDATE users SET balance = balance + ? WHERE user_id = ?',
+                    (order['price'], order['user_id'])
+                )
+                self._invalidate_user(order['user_id'])
+        
+        params.append(order_id)
+        
+        query = f"UPDATE orders SET {', '.join(update_fields)} WHERE id = ?"
+        cursor.execute(query, params)
+
+    def fail_order_with_refund(self, order_id: int, note: str = "", sn: str = "") -> bool:
+        """Tandai order gagal dan kembalikan saldonya dalam satu transaksi tulis.
+
+        Hanya order yang masih terbuka (pending / processing) yang diproses, jadi
+        handler order, webhook dan status checker tidak bisa me-refund order yang
+        sama dua kali. Return True jika panggilan ini yang melakukan refund.
+        """
+        try:
+            refunded = self._write(self._fail_order_with_refund_tx, order_id, note, sn)
+            if refunded:
+                logger.info(f"💸 Order {order_id} failed and refunded")
+            else:
+                logger.info(f"ℹ️ Order {order_id} not open anymore, no refund")
+            return refunded
+        except Exception as e:
+            logger.error(f"Error failing/refunding order {order_id}: {e}")
+            return False
+
+    def _fail_order_with_refund_tx(self, conn, order_id: int, note: str = "", sn: str = "") -> bool:
+        now = datetime.now()
+        order = conn.execute(
+            "SELECT user_id, price FROM orders WHERE id = ? AND status IN ('pending', 'processing')",
+            (order_id,)
+        ).fetchone()
+        if order is None:
+            return False
+        conn.execute('''
+            UPDATE orders
+            SET status = 'failed', note = COALESCE(NULLIF(?, ''), note), sn = COALESCE(NULLIF(?, ''), sn),
+                updated_at = ?, refunded_at = ?
+            WHERE id = ? AND status IN ('pending', 'processing')
+        ''', (note, sn, now, now, order_id))
+        if not self._credit_user_balance_tx(conn, order['user_id'], order['price'],
+                                            f"Refund: Order #{order_id} gagal", "refund", str(order_id)):
+            # User tidak ada: batalkan perubahan status juga
+            raise ValueError(f"User {order['user_id']} not found for refund of order {order_id}")
+        return True
+
     def get_user_orders(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user's order history"""
         try:
@@ -984,6 +2987,54 @@ class DatabaseManager:
             logger.error(f"Error getting user orders for {user_id}: {e}")
             return []
 
+    def get_order_by_provider_id(self, provider_order_id: str) -> Optional[Dict[str, Any]]:
+        """Get order by reffid provider (idx_orders_provider_ref)"""
+        if not provider_order_id:
+            return None
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM orders
+                    WHERE provider_order_id = ? AND provider_order_id IS NOT NULL AND provider_order_id != ''
+                ''', (str(provider_order_id),))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Error getting order by provider id {provider_order_id}: {e}")
+            return None
+
+    def get_pending_orders(self) -> List[Dict[str, Any]]:
+        """Get order yang masih pending/processing (idx_orders_open)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM orders
+                    WHERE status IN ('pending', 'processing')
+                    ORDER BY created_at ASC
+                ''')
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting pending orders: {e}")
+            return []
+
+    def get_all_processing_orders(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Get order pending/processing dalam N jam terakhir (idx_orders_open)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cutoff_date = datetime.now() - timedelta(hours=hours)
+                cursor.execute('''
+                    SELECT * FROM orders
+                    WHERE status IN ('pending', 'processing') AND created_at >= ?
+                    ORDER BY created_at ASC
+                ''', (cutoff_date,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting processing orders: {e}")
+            return []
+
     # ==================== FIXED: MISSING FUNCTION ====================
     def get_user_recent_orders(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user's recent orders - FIX for missing function"""
@@ -1007,70 +3058,199 @@ class DatabaseManager:
             logger.error(f"Error getting recent orders for {user_id}: {e}")
             return []
 
-    def get_user_order_history(self, user_id: str, days: int = 30) -> List[Dict[str, Any]]:
-        """Get user order history for specific period"""
+    # ==================== KEYSET PAGINATION ====================
+    def _keyset_page(self, table: str, key_columns: tuple, pk: str, where: str = '1', params: tuple = (),
+                     cursor: str = None, limit: int = 20, descending: bool = False,
+                     columns: str = '*') -> Dict[str, Any]:
+        """Satu halaman dengan seek ``(key_columns) > (key baris anchor)``, tanpa OFFSET.
+
+        Return ``{'items', 'next_cursor', 'prev_cursor'}``; cursor None jika tidak
+        ada halaman ke arah tersebut.
+        """
+        direction, anchor = decode_cursor(cursor)
+        backward = direction == 'p'
+        keys = ', '.join(key_columns)
+        # Urutan query dibalik saat mundur, hasilnya di-reverse lagi
+        ascending = descending == backward
+        order = ', '.join(f"{column} {'ASC' if ascending else 'DESC'}" for column in key_columns)
+        conditions = [f'({where})']
+        query_params = list(params)
+        if direction:
+            conditions.append(f"({keys}) {'>' if ascending else '<'} (SELECT {keys} FROM {table} WHERE {pk} = ?)")
+            query_params.append(anchor)
+        query_params.append(limit + 1)
+
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {columns} FROM {table}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order}
+                LIMIT ?
+            ''', query_params).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        more = len(rows) > limit
+        if backward:
+            items.reverse()
+        return {
+            'items': items,
+            'next_cursor': encode_cursor('n', items[-1][pk]) if items and (more or backward) else None,
+            'prev_cursor': encode_cursor('p', items[0][pk]) if items and (more if backward else bool(direction)) else None,
+        }
+
+    def get_products_page(self, category: str = None, status: str = 'active', cursor: str = None,
+                          limit: int = 20, where: str = None, params: tuple = ()) -> Dict[str, Any]:
+        """Produk per halaman, urut (category, sort_order, name, code).
+
+        ``where`` adalah kondisi tambahan dari kode (bukan input user); nilainya lewat ``params``.
+        """
         try:
+            conditions, query_params = ['status = ?'], [status]
+            if category:
+                conditions.append('category = ?')
+                query_params.append(category)
+            if where:
+                conditions.append(f'({where})')
+                query_params.extend(params)
+            where, params = ' AND '.join(conditions), query_params
+            return self._keyset_page('products', ('category', 'sort_order', 'name', 'code'), 'code',
+                                     where, tuple(params), cursor, limit)
+        except Exception as e:
+            logger.error(f"Error getting products page: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+
+    def count_products(self, status: str = 'active', where: str = None, params: tuple = ()) -> Dict[str, int]:
+        """Jumlah produk dan yang tersedia (stock > 0, tidak gangguan/kosong) untuk filter yang sama dengan get_products_page"""
+        try:
+            conditions, query_params = ['status = ?'], [status]
+            if where:
+                conditions.append(f'({where})')
+                query_params.extend(params)
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-                cursor.execute('''
-                    SELECT * FROM orders 
-                    WHERE user_id = ? AND created_at >= ?
-                    ORDER BY created_at DESC
-                ''', (str(user_id), cutoff_date))
-                return [dict(row) for row in cursor.fetchall()]
+                row = conn.execute(f'''
+                    SELECT COUNT(*),
+                           COALESCE(SUM(stock > 0 AND gangguan = 0 AND kosong = 0), 0)
+                    FROM products WHERE {' AND '.join(conditions)}
+                ''', query_params).fetchone()
+            return {'total': row[0], 'available': row[1]}
+        except Exception as e:
+            logger.error(f"Error counting products: {e}")
+            return {'total': 0, 'available': 0}
+
+    def get_orders_page(self, user_id: str = None, status: str = None, cursor: str = None,
+                        limit: int = 20) -> Dict[str, Any]:
+        """Order per halaman, terbaru dulu (created_at, id)"""
+        try:
+            conditions, params = [], []
+            if user_id:
+                conditions.append('user_id = ?')
+                params.append(str(user_id))
+            if status:
+                conditions.append('status = ?')
+                params.append(status)
+            return self._keyset_page('orders', ('created_at', 'id'), 'id', ' AND '.join(conditions) or '1',
+                                     tuple(params), cursor, limit, descending=True)
+        except Exception as e:
+            logger.error(f"Error getting orders page: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+
+    def get_users_page(self, cursor: str = None, limit: int = 20) -> Dict[str, Any]:
+        """User per halaman, terbaru mendaftar dulu (registered_at, user_id)"""
+        try:
+            return self._keyset_page('users', ('registered_at', 'user_id'), 'user_id',
+                                     cursor=cursor, limit=limit, descending=True)
+        except Exception as e:
+            logger.error(f"Error getting users page: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+
+    def get_topups_page(self, status: str = None, cursor: str = None, limit: int = 20) -> Dict[str, Any]:
+        """Topup request per halaman, terbaru dulu (created_at, id)"""
+        try:
+            where, params = ('status = ?', (status,)) if status else ('1', ())
+            return self._keyset_page('topup_requests', ('created_at', 'id'), 'id', where, params,
+                                     cursor, limit, descending=True)
+        except Exception as e:
+            logger.error(f"Error getting topups page: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+
+    def get_user_order_history(self, user_id: str, days: int = 30, include_archive: bool = False) -> List[Dict[str, Any]]:
+        """Get user order history for specific period (opsional termasuk archive)"""
+        try:
+            cutoff = datetime.now() - timedelta(days=days)
+            return self._select_with_archive(
+                'orders', 'user_id = ? AND created_at >= ?',
+                (str(user_id), cutoff), 'created_at DESC',
+                include_archive=include_archive, since_year=cutoff.year
+            )
         except Exception as e:
             logger.error(f"Error getting order history for {user_id}: {e}")
             return []
 
+    def get_user_transactions(self, user_id: str, limit: int = 10, include_archive: bool = False) -> List[Dict[str, Any]]:
+        """Get user's transaction history (opsional termasuk archive)"""
+        try:
+            return self._select_with_archive(
+                'transactions', 'user_id = ?', (str(user_id),), 'created_at DESC',
+                limit=limit, include_archive=include_archive
+            )
+        except Exception as e:
+            logger.error(f"Error getting transactions for {user_id}: {e}")
+            return []
+
     # ==================== ORDER HANDLER COMPATIBILITY FUNCTIONS ====================
     
-    def update_user_saldo(self, user_id: str, amount: float) -> bool:
-        """Compatibility function for order_handler - update user balance"""
-        return self.update_user_balance(user_id, amount, f"Order adjustment: {amount}")
-
-    def get_user_saldo(self, user_id: str) -> float:
-        """Compatibility function for order_handler - get user balance"""
-        return self.get_user_balance(user_id)
-
-    def save_order(self, user_id: str, product_name: str, product_code: str, 
-                   customer_input: str, price: float, status: str = 'pending',
-                   provider_order_id: str = '', sn: str = '', note: str = '') -> int:
-        """Compatibility function for order_handler - save order dengan semua parameter"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Calculate profit
-                product = self.get_product(product_code)
-                cost_price = product.get('cost_price', 0) if product else 0
-                profit = price - cost_price
-                
-                cursor.execute('''
-                    INSERT INTO orders 
-                    (user_id, product_code, product_name, price, customer_input, status, 
-                     provider_order_id, sn, note, cost, profit)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (str(user_id), product_code, product_name, price, customer_input, status,
-                      provider_order_id, sn, note, cost_price, profit))
-                
-                order_id = cursor.lastrowid
-                
-                # Update user order count
-                cursor.execute('''
-                    UPDATE users 
-                    SET total_orders = total_orders + 1, 
-                        last_active = ?
-                    WHERE user_id = ?
-                ''', (datetime.now(), str(user_id)))
-                
-                logger.info(f"💾 Order saved: ID {order_id} for user {user_id}")
-                return order_id
-                    
+    def update_user_saldo(self, user_id: str, amount: int) -> bool:
+        """Compatibility function for order_handler - update user balance"""
+        return self.update_user_balance(user_id, amount, f"Order adjustment: {amount}")
+
+    def get_user_saldo(self, user_id: str) -> int:
+        """Compatibility function for order_handler - get user balance"""
+        return self.get_user_balance(user_id)
+
+    def save_order(self, user_id: str, product_name: str, product_code: str, 
+                   customer_input: str, price: int, status: str = 'pending',
+                   provider_order_id: str = '', sn: str = '', note: str = '') -> int:
+        """Compatibility function for order_handler - save order"""
+        try:
+            order_id = self._write(self._save_order_tx, user_id, product_name, product_code,
+                                   customer_input, to_rupiah(price), status, provider_order_id, sn, note)
+            logger.info(f"💾 Order saved: ID {order_id} for user {user_id}")
+            return order_id
         except Exception as e:
             logger.error(f"Error saving order: {e}")
             return 0
 
+    def _save_order_tx(self, conn, user_id: str, product_name: str, product_code: str,
+                       customer_input: str, price: int, status: str = 'pending',
+                       provider_order_id: str = '', sn: str = '', note: str = '') -> int:
+        cursor = conn.cursor()
+        
+        # Calculate profit
+        cursor.execute('SELECT cost_price FROM products WHERE code = ?', (product_code,))
+        product = cursor.fetchone()
+        cost_price = (product['cost_price'] or 0) if product else 0
+        profit = price - cost_price
+        
+        cursor.execute('''
+            INSERT INTO orders 
+            (user_id, product_code, product_name, price, customer_input, status, 
+             provider_order_id, sn, note, cost, profit)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (str(user_id), product_code, product_name, price, customer_input, status,
+              provider_order_id, sn, note, cost_price, profit))
+        
+        order_id = cursor.lastrowid
+        
+        # Update user order count
+        cursor.execute('''
+            UPDATE users 
+            SET total_orders = total_orders + 1, 
+                last_active = ?
+            WHERE user_id = ?
+        ''', (datetime.now(), str(user_id)))
+        self._invalidate_user(user_id)
+        
+        return order_id
+
     def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
         """Get order by ID"""
         try:
@@ -1085,74 +3265,48 @@ class DatabaseManager:
 
     # ==================== STATISTICS & ANALYTICS ====================
     def get_bot_statistics(self) -> Dict[str, Any]:
-        """Get comprehensive bot statistics"""
+        """Get comprehensive bot statistics - dari stats_counters (tidak tergantung jumlah data)"""
         try:
+            today = datetime.now().strftime('%Y-%m-%d')
+            counters = self.get_stats_counters(
+                'users:active', 'users:balance', 'users:spent',
+                'orders:total', 'orders:status:completed', 'orders:profit',
+                'topups:status:pending',
+                f'users:day:{today}', f'orders:day:{today}',
+                f'revenue:day:{today}', f'topup:day:{today}'
+            )
+            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # Basic counts
-                cursor.execute('SELECT COUNT(*) as total_users FROM users WHERE is_banned = 0')
-                total_users = cursor.fetchone()['total_users']
-                
-                cursor.execute('SELECT COUNT(*) as active_users FROM users WHERE last_active >= datetime("now", "-7 days") AND is_banned = 0')
+                # Satu-satunya query range: memakai idx_users_active_unbanned
+                cursor.execute(
+                    'SELECT COUNT(*) as active_users FROM users WHERE last_active >= ? AND is_banned = 0',
+                    (datetime.now() - timedelta(days=7),)
+                )
                 active_users = cursor.fetchone()['active_users']
-                
-                cursor.execute('SELECT COUNT(*) as active_products FROM products WHERE status = "active"')
-                active_products = cursor.fetchone()['active_products']
-                
-                cursor.execute('SELECT COUNT(*) as pending_topups FROM topup_requests WHERE status = "pending"')
-                pending_topups = cursor.fetchone()['pending_topups']
-                
-                # Financial stats
-                cursor.execute('SELECT SUM(balance) as total_balance FROM users WHERE is_banned = 0')
-                total_balance = cursor.fetchone()['total_balance'] or 0
-                
-                cursor.execute('SELECT SUM(total_spent) as total_revenue FROM users')
-                total_revenue = cursor.fetchone()['total_revenue'] or 0
-                
-                cursor.execute('SELECT SUM(profit) as total_profit FROM orders WHERE status = "completed"')
-                total_profit = cursor.fetchone()['total_profit'] or 0
-                
-                # Today's stats
-                today = datetime.now().strftime('%Y-%m-%d')
-                cursor.execute('SELECT COUNT(*) as new_users_today FROM users WHERE date(registered_at) = ?', (today,))
-                new_users_today = cursor.fetchone()['new_users_today']
-                
-                cursor.execute('SELECT COUNT(*) as orders_today FROM orders WHERE date(created_at) = ?', (today,))
-                orders_today = cursor.fetchone()['orders_today']
-                
-                cursor.execute('SELECT SUM(price) as revenue_today FROM orders WHERE date(created_at) = ? AND status = "completed"', (today,))
-                revenue_today = cursor.fetchone()['revenue_today'] or 0
-                
-                cursor.execute('SELECT SUM(amount) as topup_today FROM transactions WHERE date(created_at) = ? AND type = "topup" AND status = "completed"', (today,))
-                topup_today = cursor.fetchone()['topup_today'] or 0
-                
-                # Order success rate
-                cursor.execute('SELECT COUNT(*) as total_orders FROM orders')
-                total_orders = cursor.fetchone()['total_orders'] or 0
-                
-                cursor.execute('SELECT COUNT(*) as success_orders FROM orders WHERE status = "completed"')
-                success_orders = cursor.fetchone()['success_orders'] or 0
-                
-                success_rate = (success_orders / total_orders * 100) if total_orders > 0 else 0
-                
-                return {
-                    'total_users': total_users,
-                    'active_users': active_users,
-                    'active_products': active_products,
-                    'pending_topups': pending_topups,
-                    'total_balance': total_balance,
-                    'total_revenue': total_revenue,
-                    'total_profit': total_profit,
-                    'new_users_today': new_users_today,
-                    'orders_today': orders_today,
-                    'revenue_today': revenue_today,
-                    'topup_today': topup_today,
-                    'total_orders': total_orders,
-                    'success_orders': success_orders,
-                    'success_rate': round(success_rate, 2),
-                    'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+            
+            active_products = len(self.get_product_catalog().by_status.get('active', ()))
+            total_orders = int(counters['orders:total'])
+            success_orders = int(counters['orders:status:completed'])
+            success_rate = (success_orders / total_orders * 100) if total_orders > 0 else 0
+            
+            return {
+                'total_users': int(counters['users:active']),
+                'active_users': active_users,
+                'active_products': active_products,
+                'pending_topups': int(counters['topups:status:pending']),
+                'total_balance': counters['users:balance'],
+                'total_revenue': counters['users:spent'],
+                'total_profit': counters['orders:profit'],
+                'new_users_today': int(counters[f'users:day:{today}']),
+                'orders_today': int(counters[f'orders:day:{today}']),
+                'revenue_today': counters[f'revenue:day:{today}'],
+                'topup_today': counters[f'topup:day:{today}'],
+                'total_orders': total_orders,
+                'success_orders': success_orders,
+                'success_rate': round(success_rate, 2),
+                'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
         except Exception as e:
             logger.error(f"Error getting bot statistics: {e}")
             return {
@@ -1164,26 +3318,41 @@ class DatabaseManager:
             }
 
     def get_daily_stats(self, days: int = 7) -> List[Dict[str, Any]]:
-        """Get daily statistics untuk chart"""
+        """Get daily statistics untuk chart - dari rollup stats_daily"""
         try:
+            self.refresh_rollups()
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT 
-                        date(created_at) as date,
-                        COUNT(*) as orders,
-                        SUM(CASE WHEN status = 'completed' THEN price ELSE 0 END) as revenue,
-                        COUNT(DISTINCT user_id) as active_users
-                    FROM orders 
-                    WHERE created_at >= date('now', ?)
-                    GROUP BY date(created_at)
-                    ORDER BY date ASC
+                    SELECT day as date, orders, completed_orders, revenue, profit,
+                           active_users, topups, topup_count
+                    FROM stats_daily
+                    WHERE day >= date('now', 'localtime', ?)
+                    ORDER BY day ASC
                 ''', (f'-{days} days',))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error getting daily stats: {e}")
             return []
 
+    def get_hourly_stats(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Get hourly statistics - dari rollup stats_hourly"""
+        try:
+            self.refresh_rollups()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT hour, orders, completed_orders, revenue, profit,
+                           active_users, topups, topup_count
+                    FROM stats_hourly
+                    WHERE hour >= strftime('%Y-%m-%d %H:00', 'now', 'localtime', ?)
+                    ORDER BY hour ASC
+                ''', (f'-{hours} hours',))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting hourly stats: {e}")
+            return []
+
     # ==================== ADMIN MANAGEMENT ====================
     def is_user_admin(self, user_id: str) -> bool:
         """Check if user is admin"""
@@ -1196,6 +3365,7 @@ class DatabaseManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('UPDATE users SET level = 10 WHERE user_id = ?', (str(user_id),))
+                self._invalidate_user(user_id)
                 
                 self.add_admin_log(
                     admin_id='system',
@@ -1217,6 +3387,7 @@ class DatabaseManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('UPDATE users SET level = 1 WHERE user_id = ?', (str(user_id),))
+                self._invalidate_user(user_id)
                 
                 self.add_admin_log(
                     admin_id='system',
@@ -1241,6 +3412,7 @@ class DatabaseManager:
                     'UPDATE users SET is_banned = 1, ban_reason = ? WHERE user_id = ?',
                     (reason, str(user_id))
                 )
+                self._invalidate_user(user_id)
                 
                 self.add_admin_log(
                     admin_id=admin_id,
@@ -1265,6 +3437,7 @@ class DatabaseManager:
                     'UPDATE users SET is_banned = 0, ban_reason = NULL WHERE user_id = ?',
                     (str(user_id),)
                 )
+                self._invalidate_user(user_id)
                 
                 self.add_admin_log(
                     admin_id=admin_id,
@@ -1281,29 +3454,35 @@ class DatabaseManager:
             return False
 
     # ==================== SETTINGS MANAGEMENT ====================
+    def _load_settings(self, signature_only: bool = False):
+        """Loader untuk SettingsCache: (signature, {key: value})"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*), MAX(updated_at) FROM settings')
+            count, last_update = cursor.fetchone()
+            signature = (count, str(last_update))
+            if signature_only:
+                return signature, {}
+            cursor.execute('SELECT key, value FROM settings')
+            return signature, {row['key']: row['value'] for row in cursor.fetchall()}
+
     def get_setting(self, key: str, default: Any = None) -> Any:
-        """Get setting value"""
+        """Get setting value - dari snapshot di memori"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-                result = cursor.fetchone()
-                if result:
-                    # Try to convert to appropriate type
-                    value = result['value']
-                    if value.isdigit():
-                        return int(value)
-                    elif value.replace('.', '').isdigit():
-                        return float(value)
-                    elif value.lower() in ('true', 'false'):
-                        return value.lower() == 'true'
-                    else:
-                        return value
-                return default
+            return self.settings.get(key, default)
         except Exception as e:
             logger.error(f"Error getting setting {key}: {e}")
             return default
 
+    def reload_settings(self) -> bool:
+        """Reload settings snapshot (tabel settings + bot.json)"""
+        try:
+            self.settings.reload()
+            return True
+        except Exception as e:
+            logger.error(f"Error reloading settings: {e}")
+            return False
+
     def update_setting(self, key: str, value: Any, description: str = None) -> bool:
         """Update setting"""
         try:
@@ -1320,8 +3499,12 @@ class DatabaseManager:
                         UPDATE settings SET value = ?, updated_at = ? WHERE key = ?
                     ''', (str(value), datetime.now(), key))
                 
-                logger.info(f"⚙️ Setting updated: {key} = {value}")
-                return True
+                updated = cursor.rowcount > 0
+            
+            if updated:
+                self.settings.set(key, value)
+            logger.info(f"⚙️ Setting updated: {key} = {value}")
+            return True
         except Exception as e:
             logger.error(f"Error updating setting {key}: {e}")
             return False
@@ -1400,6 +3583,7 @@ class DatabaseManager:
                     UPDATE users SET total_referred = total_referred + 1 
                     WHERE user_id = ?
                 ''', (str(referrer_id),))
+                self._invalidate_user(referrer_id)
                 
                 logger.info(f"🤝 Referral created: {referrer_id} -> {referred_id}")
                 return True
@@ -1407,14 +3591,15 @@ class DatabaseManager:
             logger.error(f"Error creating referral: {e}")
             return False
 
-    def complete_referral(self, referred_id: str, commission_amount: float = None) -> bool:
+    def complete_referral(self, referred_id: str, commission_amount: int = None) -> bool:
         """Complete referral and give commission"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
                 if commission_amount is None:
-                    commission_amount = float(self.get_setting('referral_bonus', 5000))
+                    commission_amount = self.get_setting('referral_bonus', 5000)
+                commission_amount = to_rupiah(commission_amount)
                 
                 cursor.execute('''
                     UPDATE referrals 
@@ -1437,6 +3622,7 @@ class DatabaseManager:
                         SET bonus_balance = bonus_balance + ?, balance = balance + ?
                         WHERE user_id = ?
                     ''', (commission_amount, commission_amount, referrer_id))
+                    self._invalidate_user(referrer_id)
                     
                     # Log commission transaction
                     cursor.execute('''
@@ -1452,117 +3638,594 @@ class DatabaseManager:
             return False
 
     # ==================== LOGGING SYSTEM ====================
+    # Kolom yang diisi log sink; timestamp (epoch) diambil saat log dibuat, bukan saat flush
+    LOG_COLUMNS = {
+        'system_logs': ('level', 'module', 'message', 'user_id', 'details', 'timestamp'),
+        'admin_logs': ('admin_id', 'action', 'target_type', 'target_id', 'details', 'timestamp'),
+    }
+
+    def _flush_logs(self, rows: Dict[str, list]):
+        """Flush dari LogSink: satu operasi writer (satu commit) untuk semua baris"""
+        self._write(self._insert_logs_tx, rows)
+
+    def _insert_logs_tx(self, conn, rows: Dict[str, list]) -> int:
+        count = 0
+        for table, batch in rows.items():
+            columns = self.LOG_COLUMNS[table]
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                batch
+            )
+            count += len(batch)
+        return count
+
+    @staticmethod
+    def _log_timestamp() -> int:
+        return int(time.time())
+
     def add_system_log(self, level: str, module: str, message: str, user_id: str = None, details: str = None):
-        """Add system log entry"""
+        """Add system log entry (buffered, ditulis per batch oleh log sink)"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO system_logs (level, module, message, user_id, details)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (level, module, message, user_id, details))
+            if getattr(config, 'LOG_BUFFER_ENABLED', True):
+                self.log_sink.add('system_logs', (level, module, message, user_id, details, self._log_timestamp()))
+            else:
+                self._write(self._insert_system_log_tx, level, module, message, user_id, details)
         except Exception as e:
             # Fallback to print jika database error
             print(f"SYSTEM LOG [{level}] {module}: {message} (User: {user_id}) - {details}")
 
+    def _insert_system_log_tx(self, conn, level: str, module: str, message: str, user_id: str = None, details: str = None) -> int:
+        cursor = conn.execute('''
+            INSERT INTO system_logs (level, module, message, user_id, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (level, module, message, user_id, details))
+        return cursor.lastrowid
+
     def add_admin_log(self, admin_id: str, action: str, target_type: str = None, target_id: str = None, details: str = None):
-        """Add admin action log"""
+        """Add admin action log (buffered, ditulis per batch oleh log sink)"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO admin_logs (admin_id, action, target_type, target_id, details)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (admin_id, action, target_type, target_id, details))
+            if getattr(config, 'LOG_BUFFER_ENABLED', True):
+                self.log_sink.add('admin_logs', (admin_id, action, target_type, target_id, details, self._log_timestamp()))
+            else:
+                self._write(self._insert_admin_log_tx, admin_id, action, target_type, target_id, details)
         except Exception as e:
             print(f"ADMIN LOG: {admin_id} - {action} - {target_type} - {target_id} - {details}")
 
+    def _insert_admin_log_tx(self, conn, admin_id: str, action: str, target_type: str = None, target_id: str = None, details: str = None) -> int:
+        cursor = conn.execute('''
+            INSERT INTO admin_logs (admin_id, action, target_type, target_id, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (admin_id, action, target_type, target_id, details))
+        return cursor.lastrowid
+
+    def flush_logs(self) -> int:
+        """Flush log sink sekarang (mis. sebelum membaca system_logs / admin_logs)"""
+        return self.log_sink.flush()
+
     # ==================== MAINTENANCE & CLEANUP ====================
-    def cleanup_old_data(self, days: int = 30) -> Dict[str, int]:
-        """Cleanup old data"""
+    # ==================== RETENTION ====================
+    # (nama, tabel, kondisi hapus) - dihapus bertahap per rentang rowid
+    RETENTION_RULES = [
+        ('orders', 'orders', "created_at < ? AND status IN ('completed', 'failed', 'cancelled', 'refunded')"),
+        ('topups', 'topup_requests', "created_at < ? AND status IN ('approved', 'rejected', 'expired')"),
+        ('transactions', 'transactions', "created_at < ? AND status IN ('completed', 'rejected', 'cancelled')"),
+        ('notifications', 'notifications', "created_at < ? AND is_read = 1"),
+        ('system_logs', 'system_logs', "timestamp < ?"),
+        ('admin_logs', 'admin_logs', "timestamp < ?"),
+        ('legacy_topups', 'topups', "created_at < ? AND status != 'pending'"),
+    ]
+    INACTIVE_USERS_RULE = ('users', 'users', "last_active < ? AND is_banned = 0 AND balance = 0")
+
+    def _purge_batch_tx(self, conn, name: str, table: str, where: str, params: tuple,
+                        after_rowid: int, max_rowid: int, batch_size: int):
+        """Hapus satu batch (rentang rowid) dan simpan cursor; return (cursor baru, jumlah terhapus)"""
+        upper = conn.execute(f'''
+            SELECT MAX(rowid) FROM (
+                SELECT rowid FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?
+            )
+        ''', (after_rowid, max_rowid, batch_size)).fetchone()[0]
+        if upper is None:
+            conn.execute('DELETE FROM stats_counters WHERE key = ?', (f'retention:{name}:rowid',))
+            return None, 0
+
+        # Retensi bukan perubahan data: rollup hari yang dihapus tetap dipertahankan
+        self._pause_rollups(conn, True)
+        cursor = conn.execute(
+            f'DELETE FROM {table} WHERE rowid > ? AND rowid <= ? AND {where}',
+            (after_rowid, upper) + tuple(params)
+        )
+        self._pause_rollups(conn, False)
+        conn.execute('''
+            INSERT INTO stats_counters (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (f'retention:{name}:rowid', upper))
+        if table == 'users' and cursor.rowcount:
+            self._invalidate_user(None)
+        return upper, cursor.rowcount
+
+    def purge_in_batches(self, name: str, table: str, where: str, params: tuple = (),
+                         batch_size: int = None, progress=None, deadline: float = None) -> Dict[str, Any]:
+        """Hapus baris yang cocok dengan ``where`` per batch rowid.
+
+        Setiap batch adalah transaksi pendek lewat writer, jadi order lain tetap
+        jalan di antaranya. Posisi cursor disimpan di stats_counters
+        (``retention:<nama>:rowid``); run yang terhenti (deadline / restart)
+        dilanjutkan dari posisi itu pada run berikutnya.
+        """
+        batch_size = batch_size or getattr(config, 'RETENTION_BATCH_SIZE', 500)
+        pause = getattr(config, 'RETENTION_BATCH_PAUSE', 0.05)
+
+        with self.get_connection() as conn:
+            max_rowid = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
+            row = conn.execute('SELECT value FROM stats_counters WHERE key = ?',
+                               (f'retention:{name}:rowid',)).fetchone()
+        after_rowid = int(row['value']) if row else 0
+        if after_rowid:
+            logger.info(f"🧹 Resuming cleanup {name} from rowid {after_rowid}")
+
+        deleted = 0
+        batches = 0
+        finished = False
+        while deadline is None or time.monotonic() < deadline:
+            after_rowid, count = self._write(
+                self._purge_batch_tx, name, table, where, params, after_rowid, max_rowid, batch_size
+            )
+            if after_rowid is None:
+                finished = True
+                break
+            deleted += count
+            batches += 1
+            if progress:
+                progress(name, deleted, after_rowid, max_rowid)
+            # Lepas write lock sebentar untuk writer lain
+            time.sleep(pause)
+
+        if deleted or not finished:
+            logger.info(f"🧹 Cleanup {name}: {deleted} rows in {batches} batch(es)"
+                        f"{'' if finished else ' - paused, will resume'}")
+        return {'deleted': deleted, 'batches': batches, 'finished': finished}
+
+    @staticmethod
+    def _incremental_vacuum_tx(conn, pages: int) -> int:
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # sqlite3 hanya melakukan satu step per execute (= satu halaman), jadi diulang
+        for _ in range(min(before, pages)):
+            conn.execute('PRAGMA incremental_vacuum')
+        return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    def incremental_vacuum(self, max_pages: int = None) -> int:
+        """Kembalikan halaman kosong ke filesystem bertahap; return jumlah halaman"""
+        step = max_pages or getattr(config, 'RETENTION_VACUUM_PAGES', 500)
         try:
-            cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Cleanup old orders
-                cursor.execute('''
-                    DELETE FROM orders 
-                    WHERE created_at < ? AND status IN ('completed', 'failed', 'cancelled', 'refunded')
-                ''', (cutoff_date,))
-                orders_deleted = cursor.rowcount
-                
-                # Cleanup old topups
-                cursor.execute('''
-                    DELETE FROM topup_requests 
-                    WHERE created_at < ? AND status IN ('approved', 'rejected', 'expired')
-                ''', (cutoff_date,))
-                topups_deleted = cursor.rowcount
-                
-                # Cleanup old transactions
-                cursor.execute('''
-                    DELETE FROM transactions 
-                    WHERE created_at < ? AND status IN ('completed', 'rejected', 'cancelled')
-                ''', (cutoff_date,))
-                transactions_deleted = cursor.rowcount
-                
-                # Cleanup old notifications
-                cursor.execute('''
-                    DELETE FROM notifications 
-                    WHERE created_at < ? AND is_read = 1
-                ''', (cutoff_date,))
-                notifications_deleted = cursor.rowcount
-                
-                # Cleanup old logs
-                cursor.execute('DELETE FROM system_logs WHERE timestamp < ?', (cutoff_date,))
-                system_logs_deleted = cursor.rowcount
-                
-                cursor.execute('DELETE FROM admin_logs WHERE timestamp < ?', (cutoff_date,))
-                admin_logs_deleted = cursor.rowcount
-                
-                # Expire pending topups
-                cursor.execute('''
-                    UPDATE topup_requests 
-                    SET status = 'expired' 
-                    WHERE status = 'pending' AND expires_at < ?
-                ''', (datetime.now(),))
-                expired_topups = cursor.rowcount
-                
-                logger.info(f"🧹 Cleanup completed: {orders_deleted} orders, {topups_deleted} topups, "
-                           f"{transactions_deleted} transactions, {notifications_deleted} notifications, "
-                           f"{system_logs_deleted} system logs, {admin_logs_deleted} admin logs, "
-                           f"{expired_topups} expired topups")
-                
-                return {
-                    'orders': orders_deleted,
-                    'topups': topups_deleted,
-                    'transactions': transactions_deleted,
-                    'notifications': notifications_deleted,
-                    'system_logs': system_logs_deleted,
-                    'admin_logs': admin_logs_deleted,
-                    'expired_topups': expired_topups
-                }
-        except Exception as e:
-            logger.error(f"Error cleaning up old data: {e}")
-            return {}
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    logger.info("ℹ️ auto_vacuum is not INCREMENTAL yet, run optimize_database() (VACUUM) once")
+                    return 0
+
+            reclaimed = 0
+            while True:
+                freed = self._write(self._incremental_vacuum_tx, step)
+                reclaimed += freed
+                if freed < step:
+                    break
+                time.sleep(getattr(config, 'RETENTION_BATCH_PAUSE', 0.05))
+            if reclaimed:
+                logger.info(f"🧹 Incremental vacuum reclaimed {reclaimed} page(s)")
+            return reclaimed
+        except Exception as e:
+            logger.error(f"Error running incremental vacuum: {e}")
+            return 0
 
-    def backup_database(self, backup_path: str = None) -> bool:
-        """Backup database"""
+    @staticmethod
+    def _expire_pending_topups_tx(conn) -> int:
+        return conn.execute('''
+            UPDATE topup_requests
+            SET status = 'expired'
+            WHERE status = 'pending' AND expires_at < ?
+        ''', (datetime.now(),)).rowcount
+
+    def _cleanup_plan(self, days: int, history_days: int = None) -> List[tuple]:
+        """[(nama, tabel, kondisi, cutoff)] untuk purge_in_batches.
+
+        orders/transactions memakai ``history_days`` (default ARCHIVE_AFTER_DAYS),
+        bukan ``days``; dalam mode ARCHIVE_OLD_DATA keduanya tidak pernah dihapus.
+        """
+        now = datetime.now()
+        history_days = history_days or getattr(config, 'ARCHIVE_AFTER_DAYS', 90)
+        archive_mode = getattr(config, 'ARCHIVE_OLD_DATA', False)
+        plan = []
+        for name, table, where in self.RETENTION_RULES:
+            if table in self.ARCHIVE_TABLES:
+                if archive_mode:
+                    continue
+                plan.append((name, table, where, now - timedelta(days=history_days)))
+            else:
+                plan.append((name, table, where, now - timedelta(days=days)))
+        return plan
+
+    def preview_cleanup(self, days: int = 30, history_days: int = None) -> Dict[str, Any]:
+        """Jumlah baris yang akan dihapus / diarsipkan cleanup_old_data (read-only)"""
+        history_days = history_days or getattr(config, 'ARCHIVE_AFTER_DAYS', 90)
+        result = {'days': days, 'history_days': history_days,
+                  'archive': bool(getattr(config, 'ARCHIVE_OLD_DATA', False)),
+                  'delete': {}, 'archive_counts': {}}
         try:
-            if not backup_path:
-                backup_path = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            
             with self.get_connection() as conn:
-                # SQLite backup mechanism
-                backup_conn = sqlite3.connect(backup_path)
-                conn.backup(backup_conn)
-                backup_conn.close()
-                
-            logger.info(f"💾 Database backed up to: {backup_path}")
-            return True
+                for name, table, where, cutoff in self._cleanup_plan(days, history_days):
+                    result['delete'][name] = conn.execute(
+                        f'SELECT COUNT(*) FROM {table} WHERE {where}', (cutoff,)
+                    ).fetchone()[0]
+                if result['archive']:
+                    cutoff = datetime.now() - timedelta(days=history_days)
+                    for table, finished_where in self.ARCHIVE_TABLES.items():
+                        result['archive_counts'][table] = conn.execute(
+                            f'SELECT COUNT(*) FROM {table} WHERE created_at < ? AND {finished_where}', (cutoff,)
+                        ).fetchone()[0]
+            return result
+        except Exception as e:
+            logger.error(f"Error previewing cleanup: {e}")
+            return {}
+
+    def cleanup_old_data(self, days: int = 30, batch_size: int = None, progress=None,
+                         time_budget: float = None, history_days: int = None) -> Dict[str, int]:
+        """Cleanup old data per batch; jika time_budget habis, sisanya dilanjutkan run berikutnya.
+
+        ``days`` untuk log/notifikasi/topup, ``history_days`` (default
+        ARCHIVE_AFTER_DAYS) untuk orders/transactions. Dengan ARCHIVE_OLD_DATA,
+        orders/transactions hanya dipindah ke archive_YYYY.db (tidak pernah
+        dihapus langsung); jika archive gagal, cleanup dihentikan.
+        """
+        try:
+            history_days = history_days or getattr(config, 'ARCHIVE_AFTER_DAYS', 90)
+            deadline = time.monotonic() + time_budget if time_budget else None
+
+            results = {}
+            if getattr(config, 'ARCHIVE_OLD_DATA', False):
+                # Error archive diteruskan (bukan fallback ke DELETE biasa)
+                archived = self.archive_old_data(history_days, batch_size, progress, time_budget)
+                results.update({f'archived_{table}': count for table, count in archived.items()})
+            for name, table, where, cutoff in self._cleanup_plan(days, history_days):
+                results[name] = self.purge_in_batches(
+                    name, table, where, (cutoff,), batch_size, progress, deadline
+                )['deleted']
+
+            results['expired_topups'] = self._write(self._expire_pending_topups_tx)
+            results['vacuum_pages'] = self.incremental_vacuum()
+
+            logger.info(f"🧹 Cleanup completed: {results}")
+            return results
+        except Exception as e:
+            logger.error(f"❌ Cleanup aborted: {e}")
+            return {}
+
+    # ==================== COLD ARCHIVE ====================
+    # Tabel yang dipindah ke archive_YYYY.db: kondisi baris yang sudah selesai
+    ARCHIVE_TABLES = {
+        'orders': "status IN ('completed', 'failed', 'cancelled', 'refunded')",
+        'transactions': "status IN ('completed', 'rejected', 'cancelled')",
+    }
+    # SQLite default maksimal 10 database ter-ATTACH per koneksi
+    MAX_ATTACHED_ARCHIVES = 9
+
+    def _archive_path(self, year) -> str:
+        archive_dir = getattr(config, 'ARCHIVE_DIR', '') or os.path.dirname(os.path.abspath(self.db_path))
+        return os.path.join(archive_dir, f"archive_{year}.db")
+
+    def get_archive_years(self) -> List[int]:
+        """Tahun yang punya file archive_YYYY.db"""
+        archive_dir = os.path.dirname(self._archive_path(0))
+        years = []
+        for filename in os.listdir(archive_dir):
+            name, ext = os.path.splitext(filename)
+            if ext == '.db' and name.startswith('archive_') and name[8:].isdigit():
+                years.append(int(name[8:]))
+        return sorted(years)
+
+    def _table_columns(self, conn, table: str, schema: str = 'main') -> List[tuple]:
+        return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})').fetchall()]
+
+    def _ensure_archive_table(self, conn, schema: str, table: str):
+        """Buat / lengkapi tabel di archive dengan kolom yang sama seperti tabel utama (tanpa FK)"""
+        columns = self._table_columns(conn, table)
+        existing = {name for name, _ in self._table_columns(conn, table, schema)}
+        if not existing:
+            column_sql = ', '.join(
+                'id INTEGER PRIMARY KEY' if name == 'id' else f'{name} {col_type}'
+                for name, col_type in columns
+            )
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {schema}.{table} ({column_sql})')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_user_created ON {table}(user_id, created_at)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_created ON {table}(created_at)')
+            return
+        for name, col_type in columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {name} {col_type}')
+
+    def _attach_archive(self, conn, year, create: bool = False) -> Optional[str]:
+        """ATTACH archive_YYYY.db sebagai schema archive_YYYY (harus di luar transaksi)"""
+        path = self._archive_path(year)
+        if not create and not os.path.exists(path):
+            return None
+        schema = f'archive_{int(year)}'
+        conn.execute('ATTACH DATABASE ? AS ' + schema, (path,))
+        for table in self.ARCHIVE_TABLES:
+            self._ensure_archive_table(conn, schema, table)
+        return schema
+
+    def archive_old_data(self, days: int = None, batch_size: int = None, progress=None,
+                         time_budget: float = None) -> Dict[str, int]:
+        """Pindahkan orders/transactions selesai yang lebih tua dari N hari ke archive_YYYY.db.
+
+        Per batch rowid, dua transaksi terpisah: (1) INSERT OR IGNORE ... SELECT ke
+        archive tahun ``created_at`` lalu COMMIT, (2) DELETE dari tabel utama hanya
+        untuk baris yang id-nya sudah ada di archive. Main DB (WAL) + database
+        ATTACH tidak atomik lintas file, jadi urutan ini yang menjamin crash tidak
+        pernah menghilangkan baris: paling buruk baris ada di kedua file sampai
+        run berikutnya menghapusnya. Error diteruskan ke pemanggil.
+        """
+        days = days or getattr(config, 'ARCHIVE_AFTER_DAYS', 90)
+        batch_size = batch_size or getattr(config, 'RETENTION_BATCH_SIZE', 500)
+        pause = getattr(config, 'RETENTION_BATCH_PAUSE', 0.05)
+        cutoff_date = datetime.now() - timedelta(days=days)
+        deadline = time.monotonic() + time_budget if time_budget else None
+        results = {}
+
+        conn = self.pool.create_connection()
+        # ATTACH tidak boleh di dalam transaksi: transaksi dikelola manual
+        conn.isolation_level = None
+        attached = {}
+        try:
+            for table, finished_where in self.ARCHIVE_TABLES.items():
+                where = f"created_at < ? AND {finished_where}"
+                year_sql = "strftime('%Y', created_at, 'unixepoch', 'localtime')"
+                column_list = ', '.join(name for name, _ in self._table_columns(conn, table))
+                max_rowid = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
+                after_rowid = 0
+                moved = 0
+                while deadline is None or time.monotonic() < deadline:
+                    upper = conn.execute(f'''
+                        SELECT MAX(rowid) FROM (
+                            SELECT rowid FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?
+                        )
+                    ''', (after_rowid, max_rowid, batch_size)).fetchone()[0]
+                    if upper is None:
+                        break
+                    params = (after_rowid, upper, cutoff_date)
+                    years = [row[0] for row in conn.execute(f'''
+                        SELECT DISTINCT {year_sql} FROM {table}
+                        WHERE rowid > ? AND rowid <= ? AND {where}
+                    ''', params).fetchall()]
+                    if len(years) > self.MAX_ATTACHED_ARCHIVES:
+                        raise sqlite3.OperationalError(
+                            f"Archive batch spans {len(years)} years (max {self.MAX_ATTACHED_ARCHIVES}), lower RETENTION_BATCH_SIZE"
+                        )
+                    if len(set(attached) | set(years)) > self.MAX_ATTACHED_ARCHIVES:
+                        # Batas ATTACH per koneksi: lepas archive tahun lain dulu
+                        for year in [y for y in attached if y not in years]:
+                            conn.execute(f'DETACH DATABASE {attached.pop(year)}')
+                    for year in years:
+                        if year not in attached:
+                            attached[year] = self._attach_archive(conn, year, create=True)
+
+                    # (1) Salin ke archive dan commit lebih dulu
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        for year in years:
+                            conn.execute(f'''
+                                INSERT OR IGNORE INTO {attached[year]}.{table} ({column_list})
+                                SELECT {column_list} FROM main.{table}
+                                WHERE rowid > ? AND rowid <= ? AND {where} AND {year_sql} = ?
+                            ''', params + (year,))
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+
+                    # (2) Hapus dari tabel utama hanya baris yang sudah ada di archive
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        # Baris pindah ke archive: rollup hari lama jangan dihitung ulang
+                        self._pause_rollups(conn, True)
+                        count = 0
+                        for year in years:
+                            count += conn.execute(f'''
+                                DELETE FROM main.{table}
+                                WHERE rowid > ? AND rowid <= ? AND {where} AND {year_sql} = ?
+                                  AND id IN (SELECT id FROM {attached[year]}.{table})
+                            ''', params + (year,)).rowcount
+                        self._pause_rollups(conn, False)
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+
+                    after_rowid = upper
+                    moved += count
+                    if progress:
+                        progress(f'archive:{table}', moved, after_rowid, max_rowid)
+                    time.sleep(pause)
+                results[table] = moved
+                if moved:
+                    logger.info(f"🗄️ Archived {moved} {table} older than {days} days")
+            return results
+        except Exception as e:
+            logger.error(f"❌ Error archiving old data (moved so far: {results}): {e}")
+            raise
+        finally:
+            for schema in attached.values():
+                try:
+                    conn.execute(f'DETACH DATABASE {schema}')
+                except Exception:
+                    pass
+            conn.close()
+
+    def _select_with_archive(self, table: str, where: str, params: tuple, order_by: str,
+                             limit: int = None, include_archive: bool = False,
+                             since_year: int = None) -> List[Dict[str, Any]]:
+        """SELECT dari tabel utama, UNION ALL dengan archive_YYYY.db jika include_archive"""
+        with self.get_connection() as conn:
+            schemas = ['main']
+            if include_archive and not conn.in_transaction:
+                years = [y for y in self.get_archive_years() if since_year is None or y >= since_year]
+                for year in years[-self.MAX_ATTACHED_ARCHIVES:]:
+                    schema = self._attach_archive(conn, year)
+                    if schema:
+                        schemas.append(schema)
+            try:
+                column_list = ', '.join(name for name, _ in self._table_columns(conn, table))
+                query = ' UNION ALL '.join(
+                    f'SELECT {column_list} FROM {schema}.{table} WHERE {where}' for schema in schemas
+                ) + f' ORDER BY {order_by}'
+                query_params = tuple(params) * len(schemas)
+                if limit:
+                    query += ' LIMIT ?'
+                    query_params += (limit,)
+                return [dict(row) for row in conn.execute(query, query_params).fetchall()]
+            finally:
+                for schema in schemas[1:]:
+                    conn.execute(f'DETACH DATABASE {schema}')
+
+    @staticmethod
+    def _created_range(start_date: str = None, end_date: str = None):
+        """Filter created_at untuk tanggal 'YYYY-MM-DD' (end eksklusif) -> (where, params)"""
+        conditions, params = [], []
+        if start_date:
+            conditions.append('created_at >= ?')
+            params.append(datetime.strptime(start_date, '%Y-%m-%d'))
+        if end_date:
+            conditions.append('created_at < ?')
+            params.append(datetime.strptime(end_date, '%Y-%m-%d'))
+        return ' AND '.join(conditions) or '1', tuple(params)
+
+    def export_orders(self, start_date: str = None, end_date: str = None,
+                      include_archive: bool = True) -> List[Dict[str, Any]]:
+        """Export orders dalam rentang tanggal (termasuk archive)"""
+        try:
+            where, params = self._created_range(start_date, end_date)
+            return self._select_with_archive(
+                'orders', where, params, 'created_at ASC', include_archive=include_archive,
+                since_year=int(start_date[:4]) if start_date else None
+            )
+        except Exception as e:
+            logger.error(f"Error exporting orders: {e}")
+            return []
+
+    def export_transactions(self, start_date: str = None, end_date: str = None,
+                            include_archive: bool = True) -> List[Dict[str, Any]]:
+        """Export transactions dalam rentang tanggal (termasuk archive)"""
+        try:
+            where, params = self._created_range(start_date, end_date)
+            return self._select_with_archive(
+                'transactions', where, params, 'created_at ASC', include_archive=include_archive,
+                since_year=int(start_date[:4]) if start_date else None
+            )
+        except Exception as e:
+            logger.error(f"Error exporting transactions: {e}")
+            return []
+
+    # ==================== BACKUP ====================
+    def _backup_settings(self):
+        """(folder backup, interval jam) dari bot.json database.*, fallback config.py"""
+        backup_dir = json_config.get('database.backup_path') or getattr(config, 'BACKUP_DIR', 'backups')
+        interval = json_config.get('database.backup_interval_hours') or getattr(config, 'BACKUP_INTERVAL_HOURS', 24)
+        return backup_dir, float(interval)
+
+    def list_backups(self, backup_dir: str = None) -> List[str]:
+        """File backup_*.db / backup_*.db.gz, terbaru dulu"""
+        backup_dir = backup_dir or self._backup_settings()[0]
+        if not os.path.isdir(backup_dir):
+            return []
+        files = [
+            os.path.join(backup_dir, name) for name in os.listdir(backup_dir)
+            if name.startswith('backup_') and (name.endswith('.db') or name.endswith('.db.gz'))
+        ]
+        return sorted(files, key=os.path.getmtime, reverse=True)
+
+    def rotate_backups(self, backup_dir: str = None, keep: int = None) -> int:
+        """Hapus backup lama, sisakan ``keep`` (MAX_BACKUP_FILES) terbaru"""
+        keep = keep or getattr(config, 'MAX_BACKUP_FILES', 7)
+        removed = 0
+        for path in self.list_backups(backup_dir)[keep:]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"⚠️ Could not remove old backup {path}: {e}")
+        if removed:
+            logger.info(f"🗑️ Rotated {removed} old backup(s)")
+        return removed
+
+    def backup_database(self, backup_path: str = None, compress: bool = None, progress=None) -> Optional[str]:
+        """Online backup bertahap lewat sqlite backup API; return path file backup (None jika gagal).
+
+        Backup berjalan pada koneksi sendiri (bukan dari pool), ``pages`` per step
+        dengan jeda antar step sehingga writer lain tetap jalan. Koneksi sumber
+        memegang satu read transaction selama backup: di WAL, tanpa snapshot
+        tetap, commit dari koneksi lain di antara step membuat backup mulai ulang
+        dari halaman 0 (bisa tidak pernah selesai saat bot sibuk). Snapshot ini
+        tidak memblokir writer; checkpoint hanya tertahan sampai backup selesai.
+        Hasilnya di-gzip jika BACKUP_COMPRESS.
+        """
+        if compress is None:
+            compress = getattr(config, 'BACKUP_COMPRESS', True)
+        pages = getattr(config, 'BACKUP_PAGES_PER_STEP', 1024)
+        pause = getattr(config, 'BACKUP_STEP_PAUSE', 0.01)
+        if not backup_path:
+            backup_dir = self._backup_settings()[0]
+            os.makedirs(backup_dir, exist_ok=True)
+            backup_path = os.path.join(backup_dir, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        raw_path = backup_path[:-3] if backup_path.endswith('.gz') else backup_path
+        final_path = raw_path + '.gz' if compress else raw_path
+        temp_path = raw_path + '.part'
+
+        def on_progress(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            time.sleep(pause)
+
+        try:
+            started = time.monotonic()
+            source = self.pool.create_connection()
+            source.isolation_level = None
+            target = sqlite3.connect(temp_path)
+            try:
+                # Kunci snapshot: BEGIN saja belum membuka read transaction
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                source.backup(target, pages=pages, progress=on_progress)
+                source.execute('COMMIT')
+                # File backup tunggal, tanpa -wal/-shm
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+
+            if compress:
+                with open(temp_path, 'rb') as src_file, gzip.open(final_path, 'wb', compresslevel=6) as gz_file:
+                    shutil.copyfileobj(src_file, gz_file, 1024 * 1024)
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, final_path)
+
+            size_mb = os.path.getsize(final_path) / (1024 * 1024)
+            logger.info(f"💾 Database backed up to: {final_path} ({size_mb:.1f} MB, {time.monotonic() - started:.1f}s)")
+            return final_path
         except Exception as e:
             logger.error(f"Error backing up database: {e}")
-            return False
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+    def run_scheduled_backup(self) -> Optional[str]:
+        """Backup + rotasi jika backup terakhir sudah lebih tua dari backup_interval_hours"""
+        backup_dir, interval_hours = self._backup_settings()
+        backups = self.list_backups(backup_dir)
+        if backups and time.time() - os.path.getmtime(backups[0]) < interval_hours * 3600:
+            return None
+        path = self.backup_database()
+        if path:
+            self.rotate_backups(backup_dir)
+        return path
 
     def optimize_database(self) -> bool:
         """Optimize database performance"""
@@ -1579,26 +4242,26 @@ class DatabaseManager:
 
     # ==================== COMPATIBILITY FUNCTIONS ====================
     def get_pending_topups_count(self) -> int:
-        return len(self.get_pending_topups())
+        try:
+            return int(self.get_stats_counters('topups:status:pending')['topups:status:pending'])
+        except Exception as e:
+            logger.error(f"Error getting pending topups count: {e}")
+            return 0
 
     def get_total_users_count(self) -> int:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_banned = 0')
+                cursor.execute("SELECT value FROM stats_counters WHERE key = 'users:active'")
                 result = cursor.fetchone()
-                return result['count'] if result else 0
+                return int(result['value']) if result else 0
         except Exception as e:
             logger.error(f"Error getting total users count: {e}")
             return 0
 
     def get_total_products_count(self) -> int:
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) as count FROM products WHERE status = "active"')
-                result = cursor.fetchone()
-                return result['count'] if result else 0
+            return len(self.get_product_catalog().by_status.get('active', ()))
         except Exception as e:
             logger.error(f"Error getting total products count: {e}")
             return 0
@@ -1607,9 +4270,9 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) as count FROM orders')
+                cursor.execute("SELECT value FROM stats_counters WHERE key = 'orders:total'")
                 result = cursor.fetchone()
-                return result['count'] if result else 0
+                return int(result['value']) if result else 0
         except Exception as e:
             logger.error(f"Error getting total orders count: {e}")
             return 0
@@ -1618,18 +4281,18 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT SUM(price) as total FROM orders WHERE status = "completed"')
+                cursor.execute("SELECT value FROM stats_counters WHERE key = 'orders:revenue'")
                 result = cursor.fetchone()
-                return result['total'] or 0
+                return result['value'] if result else 0
         except Exception as e:
             logger.error(f"Error getting total revenue: {e}")
             return 0
 
-    def add_user_balance(self, user_id: str, amount: float) -> bool:
+    def add_user_balance(self, user_id: str, amount: int) -> bool:
         return self.update_user_balance(user_id, amount, "Admin manual adjustment", "bonus")
 
-    def subtract_user_balance(self, user_id: str, amount: float) -> bool:
-        return self.update_user_balance(user_id, -amount, "Admin manual adjustment", "withdraw")
+    def subtract_user_balance(self, user_id: str, amount: int) -> bool:
+        return self.update_user_balance(user_id, -to_rupiah(amount), "Admin manual adjustment", "withdraw")
 
     def get_recent_users(self, limit: int = 20) -> List[Dict[str, Any]]:
         try:
@@ -1651,7 +4314,7 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+                cutoff_date = datetime.now() - timedelta(days=days)
                 cursor.execute('''
                     SELECT user_id, username, full_name, balance, last_active
                     FROM users 
@@ -1667,7 +4330,7 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+                cutoff_date = datetime.now() - timedelta(days=days)
                 cursor.execute('''
                     SELECT COUNT(*) as count
                     FROM users 
@@ -1679,21 +4342,16 @@ class DatabaseManager:
             logger.error(f"Error counting inactive users: {e}")
             return 0
 
-    def delete_inactive_users(self, days: int = 30) -> int:
-        """Delete inactive users (HATI-HATI - hanya untuk cleanup)"""
+    def delete_inactive_users(self, days: int = 30, batch_size: int = None, progress=None) -> int:
+        """Delete inactive users (HATI-HATI - hanya untuk cleanup); batch kecil karena cascade ke orders dll"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-                
-                cursor.execute('''
-                    DELETE FROM users 
-                    WHERE last_active < ? AND is_banned = 0 AND balance = 0
-                ''', (cutoff_date,))
-                
-                deleted_count = cursor.rowcount
-                logger.info(f"🧹 Deleted {deleted_count} inactive users")
-                return deleted_count
+            cutoff_date = datetime.now() - timedelta(days=days)
+            name, table, where = self.INACTIVE_USERS_RULE
+            batch_size = batch_size or getattr(config, 'RETENTION_USER_BATCH_SIZE', 50)
+
+            deleted_count = self.purge_in_batches(name, table, where, (cutoff_date,), batch_size, progress)['deleted']
+            logger.info(f"🧹 Deleted {deleted_count} inactive users")
+            return deleted_count
         except Exception as e:
             logger.error(f"Error deleting inactive users: {e}")
             return 0
@@ -1705,6 +4363,9 @@ _db_manager = DatabaseManager()
 def init_database():
     return _db_manager.init_database()
 
+def get_schema_version():
+    return _db_manager.get_schema_version()
+
 def get_or_create_user(user_id: str, username: str = "", full_name: str = "", **kwargs):
     return _db_manager.get_or_create_user(user_id, username, full_name, **kwargs)
 
@@ -1714,13 +4375,19 @@ def get_user(user_id: str):
 def get_user_balance(user_id: str):
     return _db_manager.get_user_balance(user_id)
 
-def update_user_balance(user_id: str, amount: float, note: str = ""):
+def update_user_balance(user_id: str, amount: int, note: str = ""):
     return _db_manager.update_user_balance(user_id, amount, note)
 
-def add_user_balance(user_id: str, amount: float):
+def debit_user_balance(user_id: str, amount: int, note: str = "", transaction_type: str = "order", reference_id: str = None) -> DebitResult:
+    return _db_manager.debit_user_balance(user_id, amount, note, transaction_type, reference_id)
+
+def credit_user_balance(user_id: str, amount: int, note: str = "", transaction_type: str = "refund", reference_id: str = None):
+    return _db_manager.credit_user_balance(user_id, amount, note, transaction_type, reference_id)
+
+def add_user_balance(user_id: str, amount: int):
     return _db_manager.add_user_balance(user_id, amount)
 
-def subtract_user_balance(user_id: str, amount: float):
+def subtract_user_balance(user_id: str, amount: int):
     return _db_manager.subtract_user_balance(user_id, amount)
 
 def get_user_stats(user_id: str):
@@ -1732,10 +4399,34 @@ def get_products_by_category(category: str = None, status: str = 'active'):
 def get_product(product_code: str):
     return _db_manager.get_product(product_code)
 
+def search_products(text: str, limit: int = 10, in_stock_only: bool = True):
+    return _db_manager.search_products(text, limit, in_stock_only)
+
+def rebuild_product_search():
+    return _db_manager.rebuild_product_search()
+
+def get_product_catalog():
+    return _db_manager.get_product_catalog()
+
+def invalidate_user_cache(user_id: str = None):
+    return _db_manager.user_cache.invalidate(str(user_id) if user_id is not None else None)
+
+def get_user_cache_stats():
+    return _db_manager.user_cache.info()
+
+def invalidate_product_catalog():
+    return _db_manager.invalidate_product_catalog()
+
+def get_products_signature():
+    return _db_manager.get_products_signature()
+
+def sync_provider_products(products: List[Dict[str, Any]], deactivate_missing: bool = True):
+    return _db_manager.sync_provider_products(products, deactivate_missing)
+
 def update_product(product_code: str, **kwargs):
     return _db_manager.update_product(product_code, **kwargs)
 
-def create_topup(user_id: str, amount: float, payment_method: str = "", status: str = "pending", unique_code: int = 0, **kwargs):
+def create_topup(user_id: str, amount: int, payment_method: str = "", status: str = "pending", unique_code: int = 0, **kwargs):
     return _db_manager.create_topup(user_id, amount, payment_method, status, unique_code, **kwargs)
 
 def get_pending_topups():
@@ -1756,6 +4447,9 @@ def create_order(user_id: str, product_code: str, customer_input: str, **kwargs)
 def update_order_status(order_id: int, status: str, sn: str = "", note: str = ""):
     return _db_manager.update_order_status(order_id, status, sn, note)
 
+def fail_order_with_refund(order_id: int, note: str = "", sn: str = ""):
+    return _db_manager.fail_order_with_refund(order_id, note, sn)
+
 def get_user_orders(user_id: str, limit: int = 10):
     return _db_manager.get_user_orders(user_id, limit)
 
@@ -1764,8 +4458,27 @@ def get_user_recent_orders(user_id: str, limit: int = 10):
     """Compatibility function - FIX MISSING FUNCTION"""
     return _db_manager.get_user_recent_orders(user_id, limit)
 
-def get_user_order_history(user_id: str, days: int = 30):
-    return _db_manager.get_user_order_history(user_id, days)
+def get_products_page(category: str = None, status: str = 'active', cursor: str = None, limit: int = 20,
+                      where: str = None, params: tuple = ()):
+    return _db_manager.get_products_page(category, status, cursor, limit, where, params)
+
+def count_products(status: str = 'active', where: str = None, params: tuple = ()):
+    return _db_manager.count_products(status, where, params)
+
+def get_orders_page(user_id: str = None, status: str = None, cursor: str = None, limit: int = 20):
+    return _db_manager.get_orders_page(user_id, status, cursor, limit)
+
+def get_users_page(cursor: str = None, limit: int = 20):
+    return _db_manager.get_users_page(cursor, limit)
+
+def get_topups_page(status: str = None, cursor: str = None, limit: int = 20):
+    return _db_manager.get_topups_page(status, cursor, limit)
+
+def get_user_order_history(user_id: str, days: int = 30, include_archive: bool = False):
+    return _db_manager.get_user_order_history(user_id, days, include_archive)
+
+def get_user_transactions(user_id: str, limit: int = 10, include_archive: bool = False):
+    return _db_manager.get_user_transactions(user_id, limit, include_archive)
 
 def get_bot_statistics():
     return _db_manager.get_bot_statistics()
@@ -1773,6 +4486,12 @@ def get_bot_statistics():
 def get_daily_stats(days: int = 7):
     return _db_manager.get_daily_stats(days)
 
+def get_hourly_stats(hours: int = 24):
+    return _db_manager.get_hourly_stats(hours)
+
+def refresh_rollups():
+    return _db_manager.refresh_rollups()
+
 def is_user_admin(user_id: str):
     return _db_manager.is_user_admin(user_id)
 
@@ -1794,6 +4513,9 @@ def get_setting(key: str, default: Any = None):
 def update_setting(key: str, value: Any, description: str = None):
     return _db_manager.update_setting(key, value, description)
 
+def reload_settings():
+    return _db_manager.reload_settings()
+
 def create_notification(user_id: str, title: str, message: str, notification_type: str = "info", action_url: str = None):
     return _db_manager.create_notification(user_id, title, message, notification_type, action_url)
 
@@ -1806,7 +4528,7 @@ def mark_notification_read(notification_id: int):
 def create_referral(referrer_id: str, referred_id: str):
     return _db_manager.create_referral(referrer_id, referred_id)
 
-def complete_referral(referred_id: str, commission_amount: float = None):
+def complete_referral(referred_id: str, commission_amount: int = None):
     return _db_manager.complete_referral(referred_id, commission_amount)
 
 def add_system_log(level: str, module: str, message: str, user_id: str = None, details: str = None):
@@ -1815,11 +4537,39 @@ def add_system_log(level: str, module: str, message: str, user_id: str = None, d
 def add_admin_log(admin_id: str, action: str, target_type: str = None, target_id: str = None, details: str = None):
     return _db_manager.add_admin_log(admin_id, action, target_type, target_id, details)
 
-def cleanup_old_data(days: int = 30):
-    return _db_manager.cleanup_old_data(days)
+def flush_logs():
+    return _db_manager.flush_logs()
+
+def preview_cleanup(days: int = 30, history_days: int = None):
+    return _db_manager.preview_cleanup(days, history_days)
+
+def cleanup_old_data(days: int = 30, batch_size: int = None, progress=None, time_budget: float = None,
+                     history_days: int = None):
+    return _db_manager.cleanup_old_data(days, batch_size, progress, time_budget, history_days)
 
-def backup_database(backup_path: str = None):
-    return _db_manager.backup_database(backup_path)
+def incremental_vacuum(max_pages: int = None):
+    return _db_manager.incremental_vacuum(max_pages)
+
+def archive_old_data(days: int = None, batch_size: int = None, progress=None, time_budget: float = None):
+    return _db_manager.archive_old_data(days, batch_size, progress, time_budget)
+
+def export_orders(start_date: str = None, end_date: str = None, include_archive: bool = True):
+    return _db_manager.export_orders(start_date, end_date, include_archive)
+
+def export_transactions(start_date: str = None, end_date: str = None, include_archive: bool = True):
+    return _db_manager.export_transactions(start_date, end_date, include_archive)
+
+def backup_database(backup_path: str = None, compress: bool = None, progress=None):
+    return _db_manager.backup_database(backup_path, compress, progress)
+
+def run_scheduled_backup():
+    return _db_manager.run_scheduled_backup()
+
+def rotate_backups(backup_dir: str = None, keep: int = None):
+    return _db_manager.rotate_backups(backup_dir, keep)
+
+def list_backups(backup_dir: str = None):
+    return _db_manager.list_backups(backup_dir)
 
 def optimize_database():
     return _db_manager.optimize_database()
@@ -1836,21 +4586,21 @@ def get_active_users(days: int = 30):
 def count_inactive_users(days: int = 30):
     return _db_manager.count_inactive_users(days)
 
-def delete_inactive_users(days: int = 30):
-    return _db_manager.delete_inactive_users(days)
+def delete_inactive_users(days: int = 30, batch_size: int = None, progress=None):
+    return _db_manager.delete_inactive_users(days, batch_size, progress)
 
 # ==================== ORDER HANDLER COMPATIBILITY FUNCTIONS ====================
 
-def update_user_saldo(user_id: str, amount: float) -> bool:
+def update_user_saldo(user_id: str, amount: int) -> bool:
     """Compatibility function for order_handler"""
     return _db_manager.update_user_saldo(user_id, amount)
 
-def get_user_saldo(user_id: str) -> float:
+def get_user_saldo(user_id: str) -> int:
     """Compatibility function for order_handler"""
     return _db_manager.get_user_saldo(user_id)
 
 def save_order(user_id: str, product_name: str, product_code: str, 
-               customer_input: str, price: float, status: str = 'pending',
+               customer_input: str, price: int, status: str = 'pending',
                provider_order_id: str = '', sn: str = '', note: str = '') -> int:
     """Compatibility function for order_handler"""
     return _db_manager.save_order(user_id, product_name, product_code, customer_input, 
@@ -1860,6 +4610,18 @@ def get_order(order_id: int):
     """Compatibility function for order_handler"""
     return _db_manager.get_order(order_id)
 
+def get_order_by_provider_id(provider_order_id: str):
+    return _db_manager.get_order_by_provider_id(provider_order_id)
+
+def get_pending_orders():
+    return _db_manager.get_pending_orders()
+
+def get_all_processing_orders(hours: int = 24):
+    return _db_manager.get_all_processing_orders(hours)
+
+def check_query_plans():
+    return _db_manager.check_query_plans()
+
 # New compatibility functions
 def get_pending_topups_count():
     return _db_manager.get_pending_topups_count()
@@ -1876,13 +4638,150 @@ def get_total_orders():
 def get_total_revenue():
     return _db_manager.get_total_revenue_amount()
 
+def get_stats_counters(*keys: str):
+    return _db_manager.get_stats_counters(*keys)
+
+def rebuild_stats_counters():
+    return _db_manager.rebuild_stats_counters()
+
 def get_db_manager():
     return _db_manager
 
+def submit_write(op, *args, **kwargs):
+    """Queue a write on the single writer thread, returns a Future"""
+    return _db_manager.submit_write(op, *args, **kwargs)
+
+def close_database():
+    db.shutdown()
+    return _db_manager.close()
+
 # Aliases untuk compatibility
 get_user_info = get_user
 get_user_statistics = get_user_stats
 
+# ==================== ASYNC DATABASE API ====================
+class AsyncDatabase:
+    """Awaitable counterpart untuk module-level API, dijalankan di executor khusus.
+
+    Contoh: ``await database.db.get_user_balance(user_id)``. Jumlah query yang
+    berjalan bersamaan dibatasi oleh semaphore; pemanggil yang melebihi batas
+    akan menunggu (back-pressure) hingga ``queue_timeout`` detik.
+    """
+
+    def __init__(self, max_workers: int = 5, max_pending: int = 15, queue_timeout: float = 30.0):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="db-worker"
+                )
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_pending)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """Jalankan fungsi database sync di executor tanpa memblokir event loop"""
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise sqlite3.OperationalError(
+                f"Database busy: {self.max_pending} queries already pending"
+            )
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            semaphore.release()
+
+    async def write(self, op, *args, **kwargs):
+        """Await hasil operasi tulis yang diantrikan ke writer thread"""
+        return await asyncio.wrap_future(submit_write(op, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        func = globals().get(name)
+        if name.startswith('_') or not callable(func) or isinstance(func, type):
+            raise AttributeError(f"database has no function '{name}'")
+
+        async def wrapper(*args, **kwargs):
+            return await self.run(func, *args, **kwargs)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def shutdown(self, wait: bool = True):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+db = AsyncDatabase(
+    max_workers=getattr(config, 'DB_POOL_SIZE', 5),
+    max_pending=getattr(config, 'DB_POOL_SIZE', 5) + getattr(config, 'DB_MAX_OVERFLOW', 10)
+)
+
+# ==================== BACKGROUND MAINTENANCE ====================
+async def background_rollup_refresh(interval_minutes: float = None):
+    """Background task: proses perubahan order/topup baru ke tabel rollup"""
+    if interval_minutes is None:
+        interval_minutes = getattr(config, 'ROLLUP_REFRESH_MINUTES', 5)
+    while True:
+        try:
+            await db.refresh_rollups()
+            await asyncio.sleep(interval_minutes * 60)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Background rollup refresh error: {e}")
+            await asyncio.sleep(60)
+
+def initialize_rollup_refresh():
+    """Start background rollup refresh (panggil dari event loop, mis. post_init)"""
+    try:
+        asyncio.create_task(background_rollup_refresh())
+        logger.info("✅ Background rollup refresh initialized")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize rollup refresh: {e}")
+
+async def background_backup(check_minutes: float = 15):
+    """Background task: backup online + rotasi sesuai database.backup_interval_hours"""
+    while True:
+        try:
+            await db.run_scheduled_backup()
+            await asyncio.sleep(check_minutes * 60)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Background backup error: {e}")
+            await asyncio.sleep(check_minutes * 60)
+
+def initialize_backup_service():
+    """Start background backup jika AUTO_BACKUP (panggil dari event loop, mis. post_init)"""
+    if not getattr(config, 'AUTO_BACKUP', True):
+        return
+    try:
+        asyncio.create_task(background_backup())
+        logger.info("✅ Background backup service initialized")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize backup service: {e}")
+
 if __name__ == "__main__":
     # Comprehensive test
     print("🧪 PRODUCTION DATABASE TEST...")
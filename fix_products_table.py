@@ -1,14 +1,6 @@
-import sqlite3
+import database
 
-db_path = "bot_database.db"  # Ubah jika pakai bot_topup.db
-conn = sqlite3.connect(db_path)
-c = conn.cursor()
-
-try:
-    c.execute("ALTER TABLE products ADD COLUMN stock INTEGER DEFAULT 0")
-    print("Kolom 'stock' berhasil ditambahkan.")
-except sqlite3.OperationalError as e:
-    print("Kolom 'stock' mungkin sudah ada atau gagal ditambah:", e)
-
-conn.commit()
-conn.close()
+# Kolom products yang hilang sekarang ditambahkan oleh migration runner
+# (DatabaseManager._ensure_product_columns), skrip ini cukup menjalankannya.
+if database.init_database():
+    print(f"Schema database up-to-date (versi {database.get_schema_version()}).")
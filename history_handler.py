@@ -7,7 +7,6 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 import database
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -49,13 +48,7 @@ async def show_order_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
             }.get(order['status'], '📦')
             
             # Handle date format
-            try:
-                if 'T' in order['created_at']:
-                    order_date = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00')).strftime('%d/%m/%Y %H:%M')
-                else:
-                    order_date = datetime.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
-            except:
-                order_date = order['created_at']
+            order_date = database.format_timestamp(order['created_at'], '%d/%m/%Y %H:%M')
             
             orders_text += (
                 f"{status_emoji} *Order #{order['id']}*\n"
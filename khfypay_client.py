@@ -1,37 +1,287 @@
 #!/usr/bin/env python3
 """
-KhfyPay Client - Simple Implementation
+KhfyPay Client - shared async HTTP client untuk semua panggilan provider
+
+Satu ClientSession long-lived per event loop (keep-alive connection pool +
+DNS cache), timeout per endpoint. Dipakai order_handler, stok_handler,
+auto_status_chacker dan admin updateproduk lewat get_khfypay_client().
+Katalog produk di-cache lewat get_catalog_cache().
 """
 
-import aiohttp
+import asyncio
 import logging
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+import config
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = "https://panel.khfy-store.com/api_v2"
+DEFAULT_STOCK_URL = "https://panel.khfy-store.com/api_v3/cek_stock_akrab"
+
+# Timeout total per endpoint (detik); bisa dioverride lewat config.KHFYPAY_ENDPOINT_TIMEOUTS
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    'list_product': 30,
+    'trx': 60,
+    'history': 20,
+    'cek_stock_akrab': 15,
+}
+
+
 class KhfyPayClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url: str = None, stock_url: str = None):
         self.api_key = api_key
-        self.base_url = "https://panel.khfy-store.com/api_v2"
-    
+        self.base_url = (base_url or getattr(config, 'KHFYPAY_BASE_URL', DEFAULT_BASE_URL)).rstrip('/')
+        self.stock_url = stock_url or getattr(config, 'KHFYPAY_STOCK_URL', DEFAULT_STOCK_URL)
+        self.timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+        self.timeouts.update(getattr(config, 'KHFYPAY_ENDPOINT_TIMEOUTS', {}))
+        self.default_timeout = getattr(config, 'KHFYPAY_TIMEOUT', 60)
+        # aiohttp session terikat ke event loop: bot, status checker (thread sendiri), dst.
+        self._sessions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'timeouts': 0, 'sessions': 0}
+
+    # ==================== SESSION ====================
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=getattr(config, 'KHFYPAY_POOL_SIZE', 20),
+            limit_per_host=getattr(config, 'KHFYPAY_POOL_SIZE', 20),
+            ttl_dns_cache=getattr(config, 'KHFYPAY_DNS_CACHE_SECONDS', 300),
+            keepalive_timeout=getattr(config, 'KHFYPAY_KEEPALIVE_SECONDS', 60),
+            enable_cleanup_closed=True,
+        )
+        self.stats['sessions'] += 1
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.default_timeout),
+        )
+
+    def session(self) -> aiohttp.ClientSession:
+        """Session untuk event loop yang sedang berjalan (dibuat sekali per loop)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = self._create_session()
+                self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """Tutup session milik event loop ini"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def warm_up(self) -> bool:
+        """Buka koneksi (DNS + TCP + TLS) ke provider lebih awal agar request pertama tidak membayar handshake"""
+        started = time.monotonic()
+        try:
+            async with self.session().head(self.base_url, timeout=aiohttp.ClientTimeout(total=10),
+                                           allow_redirects=False) as response:
+                await response.read()
+            logger.info(f"🔌 KhfyPay connection warmed up in {(time.monotonic() - started) * 1000:.0f} ms")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ KhfyPay warm-up failed: {e}")
+            return False
+
+    # ==================== REQUEST ====================
+    async def request(self, endpoint: str, params: Dict[str, Any] = None, url: str = None,
+                      with_api_key: bool = True) -> Any:
+        """GET satu endpoint provider, return JSON.
+
+        Error jaringan (``asyncio.TimeoutError`` / ``aiohttp.ClientError``) dan
+        HTTP non-2xx (``aiohttp.ClientResponseError``) diteruskan ke pemanggil.
+        """
+        url = url or f"{self.base_url}/{endpoint}"
+        query = dict(params or {})
+        if with_api_key:
+            query.setdefault('api_key', self.api_key)
+        timeout = aiohttp.ClientTimeout(total=self.timeouts.get(endpoint, self.default_timeout))
+        self.stats['requests'] += 1
+        try:
+            async with self.session().get(url, params=query, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+
+    async def _safe_request(self, endpoint: str, params: Dict[str, Any] = None, **kwargs) -> Any:
+        try:
+            return await self.request(endpoint, params, **kwargs)
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ KhfyPay {endpoint} timeout")
+        except Exception as e:
+            logger.error(f"KhfyPay API error ({endpoint}): {e}")
+        return None
+
+    async def list_products(self) -> Any:
+        """Daftar produk (api_v2/list_product); None jika gagal"""
+        return await self._safe_request('list_product')
+
     async def create_transaction(self, product_code, target, ref_id):
         """Create transaction in KhfyPay"""
+        return await self._safe_request('trx', {
+            "produk": product_code,
+            "tujuan": target,
+            "reff_id": ref_id,
+        })
+
+    async def check_status(self, ref_id: str) -> Any:
+        """Status transaksi berdasarkan reff_id (api_v2/history); None jika gagal"""
+        return await self._safe_request('history', {"refid": ref_id})
+
+    async def get_stock(self) -> Any:
+        """Stok akrab real-time (api_v3/cek_stock_akrab); None jika gagal"""
+        return await self._safe_request('cek_stock_akrab', url=self.stock_url, with_api_key=False)
+
+    def run_sync(self, coro_func, *args, **kwargs):
+        """Jalankan method async dari kode sync (loop sementara, session-nya ditutup setelahnya)"""
+        async def runner():
+            try:
+                return await coro_func(*args, **kwargs)
+            finally:
+                await self.close()
+        return asyncio.run(runner())
+
+
+# ==================== CATALOG CACHE ====================
+class CatalogCache:
+    """Cache list_product provider: TTL (config.PRODUCT_CACHE_TIMEOUT), single-flight, stale-while-revalidate.
+
+    - segar: langsung dari memori
+    - basi: data lama dikembalikan, refresh jalan di background
+    - belum ada data: semua pemanggil menunggu satu fetch yang sama
+    Listener dipanggil (di thread) sekali per fetch sukses, bukan per pembacaan.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Any]], ttl: float = None):
+        self._fetch = fetch
+        self.ttl = ttl if ttl is not None else getattr(config, 'PRODUCT_CACHE_TIMEOUT', 60)
+        # Setelah fetch gagal, tunggu sebentar sebelum mencoba lagi (jangan banjiri provider yang down)
+        self.retry_after = min(self.ttl, 30)
+        self.data: Any = None
+        self.fetched_at = 0.0
+        self.version = 0
+        self._next_attempt = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Any], Any]] = []
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0, 'shared': 0, 'errors': 0}
+
+    def add_listener(self, callback: Callable[[Any], Any]):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at if self.data is not None else float('inf')
+
+    def is_fresh(self, max_age: float = None) -> bool:
+        return self.age() < (self.ttl if max_age is None else max_age)
+
+    def invalidate(self):
+        """Tandai basi; pembacaan berikutnya memicu refresh"""
+        self.fetched_at = 0.0
+        self._next_attempt = 0.0
+
+    def refresh(self) -> "asyncio.Task":
+        """Mulai fetch, atau ikut fetch yang sedang berjalan di loop ini"""
+        loop = asyncio.get_running_loop()
+        task = self._inflight
+        if task is not None and not task.done() and task.get_loop() is loop:
+            self.stats['shared'] += 1
+            return task
+        task = loop.create_task(self._do_refresh())
+        self._inflight = task
+        return task
+
+    async def _do_refresh(self) -> Any:
+        self.stats['fetches'] += 1
+        started = time.monotonic()
         try:
-            params = {
-                "produk": product_code,
-                "tujuan": target,
-                "reff_id": ref_id,
-                "api_key": self.api_key
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/trx", params=params) as response:
-                    return await response.json()
+            data = await self._fetch()
         except Exception as e:
-            logger.error(f"KhfyPay API error: {e}")
-            return None
+            logger.error(f"❌ Catalog fetch error: {e}")
+            data = None
+        if data is None:
+            self.stats['errors'] += 1
+            self._next_attempt = time.monotonic() + self.retry_after
+            return self.data
+        for callback in list(self._listeners):
+            try:
+                await asyncio.to_thread(callback, data)
+            except Exception as e:
+                logger.error(f"❌ Catalog listener error: {e}")
+        self.data = data
+        self.fetched_at = time.monotonic()
+        self.version += 1
+        logger.info(f"📦 Catalog refreshed (v{self.version}) in {(self.fetched_at - started) * 1000:.0f} ms")
+        return data
+
+    async def get(self, max_age: float = None, wait: bool = False) -> Any:
+        """Data katalog; ``wait=True`` menunggu refresh jika basi (mis. cek stok sebelum order)"""
+        if self.is_fresh(max_age):
+            self.stats['hits'] += 1
+            return self.data
+        if self.data is None or wait:
+            self.stats['misses'] += 1
+            return await asyncio.shield(self.refresh())
+        self.stats['stale_hits'] += 1
+        self.revalidate()
+        return self.data
+
+    def revalidate(self) -> bool:
+        """Non-blocking: jadwalkan refresh di background jika basi. False jika tidak ada event loop"""
+        if self.is_fresh() or time.monotonic() < self._next_attempt:
+            return True
+        try:
+            self.refresh()
+            return True
+        except RuntimeError:
+            return False
+
+
+_client: Optional[KhfyPayClient] = None
+_client_lock = threading.Lock()
+_catalog_cache: Optional[CatalogCache] = None
+
 
 def get_khfypay_client():
-    """Get KhfyPay client instance"""
-    import config
-    api_key = getattr(config, 'KHFYPAY_API_KEY', '')
-    return KhfyPayClient(api_key)
+    """Get KhfyPay client instance (satu instance bersama untuk seluruh proses)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = getattr(config, 'KHFYPAY_API_KEY', '') or getattr(config, 'API_KEY_PROVIDER', '')
+            _client = KhfyPayClient(api_key)
+        return _client
+
+
+def get_catalog_cache() -> CatalogCache:
+    """Cache katalog produk provider (satu instance bersama)"""
+    global _catalog_cache
+    client = get_khfypay_client()
+    with _client_lock:
+        if _catalog_cache is None:
+            _catalog_cache = CatalogCache(client.list_products)
+        return _catalog_cache
+
+
+async def warm_up_khfypay_client() -> bool:
+    """Dipanggil dari post_init bot"""
+    return await get_khfypay_client().warm_up()
+
+
+async def close_khfypay_client():
+    """Tutup session loop ini saat shutdown"""
+    if _client is not None:
+        await _client.close()
@@ -1,6 +1,5 @@
 import logging
 import uuid
-import requests
 import aiohttp
 import asyncio
 import sqlite3
@@ -9,6 +8,7 @@ import json
 import traceback
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     ConversationHandler,
     CallbackQueryHandler,
@@ -20,6 +20,8 @@ from telegram.ext import (
 )
 import database
 import config
+from khfypay_client import get_khfypay_client
+from catalog_sync import get_catalog_sync_service
 import telegram
 
 logger = logging.getLogger(__name__)
@@ -32,7 +34,6 @@ PRODUCTS_PER_PAGE = 8
 bot_application = None
 pending_admin_notifications = {}
 pending_orders_timeout = {}
-order_lock = asyncio.Lock()
 
 # ==================== OPERATOR DETECTION SYSTEM ====================
 
@@ -231,25 +232,21 @@ class KhfyPayAPI:
         self.api_key = api_key
         self.base_url = "https://panel.khfy-store.com/api_v2"
         self.circuit_breaker = CircuitBreaker()
+        # Session + connection pool bersama (khfypay_client), bukan koneksi baru per request
+        self.client = get_khfypay_client()
     
     async def get_products(self):
         """Get list products from KhfyPay dengan circuit breaker"""
         try:
-            return await self.circuit_breaker.execute(self._get_products_sync)
+            return await self.circuit_breaker.execute(self._get_products)
         except Exception as e:
             logger.error(f"❌ Circuit breaker blocked get_products: {e}")
             return None
     
-    def _get_products_sync(self):
-        """Sync implementation of get_products"""
+    async def _get_products(self):
+        """Async implementation of get_products"""
         try:
-            url = f"{self.base_url}/list_product"
-            params = {"api_key": self.api_key}
-            
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = await self.client.request('list_product', {"api_key": self.api_key})
             logger.info(f"✅ Got {len(data) if isinstance(data, list) else 'unknown'} products from provider")
             return data
         except Exception as e:
@@ -259,15 +256,14 @@ class KhfyPayAPI:
     async def create_order(self, product_code, target, custom_reffid=None):
         """Create new order in KhfyPay dengan circuit breaker"""
         try:
-            return await self.circuit_breaker.execute(self._create_order_sync, product_code, target, custom_reffid)
+            return await self.circuit_breaker.execute(self._create_order, product_code, target, custom_reffid)
         except Exception as e:
             logger.error(f"❌ Circuit breaker blocked create_order: {e}")
             return {"status": "error", "message": "Service temporarily unavailable"}
     
-    def _create_order_sync(self, product_code, target, custom_reffid=None):
-        """Sync implementation of create_order"""
+    async def _create_order(self, product_code, target, custom_reffid=None):
+        """Async implementation of create_order"""
         try:
-            url = f"{self.base_url}/trx"
             reffid = custom_reffid or f"akrab_{uuid.uuid4().hex[:16]}"
             
             params = {
@@ -279,19 +275,16 @@ class KhfyPayAPI:
             
             logger.info(f"🔄 Sending order to KhfyPay: {params}")
             
-            response = requests.get(url, params=params, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = await self.client.request('trx', params)
             result['reffid'] = reffid
             
             logger.info(f"✅ Order created with response: {result}")
             return result
             
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             logger.error(f"❌ Timeout creating order for {product_code}")
             return {"status": "error", "message": "Timeout - Silakan cek status manual"}
-        except requests.exceptions.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"❌ Network error creating order: {e}")
             return {"status": "error", "message": f"Network error: {str(e)}"}
         except Exception as e:
@@ -301,42 +294,38 @@ class KhfyPayAPI:
     async def check_order_status(self, reffid):
         """Check order status by reffid dengan circuit breaker"""
         try:
-            return await self.circuit_breaker.execute(self._check_order_status_sync, reffid)
+            return await self.circuit_breaker.execute(self._check_order_status, reffid)
         except Exception as e:
             logger.error(f"❌ Circuit breaker blocked check_order_status: {e}")
             return None
     
-    def _check_order_status_sync(self, reffid):
-        """Sync implementation of check_order_status"""
+    async def _check_order_status(self, reffid):
+        """Async implementation of check_order_status"""
         try:
-            url = f"{self.base_url}/history"
             params = {
                 "api_key": self.api_key,
                 "refid": reffid
             }
             
             logger.info(f"🔍 Checking status for reffid: {reffid}")
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = await self.client.request('history', params)
             logger.info(f"📊 Status check raw response: {result}")
             return result
             
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             logger.error(f"⏰ Timeout checking status for {reffid}")
             return None
-        except requests.exceptions.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"🌐 Network error checking status: {e}")
             return None
         except Exception as e:
             logger.error(f"❌ Error checking KhfyPay order status: {e}")
             return None
 
-    def check_order_status_detailed(self, reffid):
+    async def check_order_status_detailed(self, reffid):
         """Check order status dengan parsing yang sesuai format provider"""
         try:
-            result = self._check_order_status_sync(reffid)
+            result = await self._check_order_status(reffid)
             if not result:
                 return None, "Menunggu konfirmasi provider", "", ""
             
@@ -713,81 +702,33 @@ def get_order_by_id(order_id):
 # ==================== STOCK MANAGEMENT SYSTEM ====================
 
 def sync_product_stock_from_provider():
-    """Sinkronisasi stok produk dari provider KhfyPay"""
+    """Pastikan stok produk mengikuti provider tanpa memblokir tampilan menu.
+
+    Di dalam event loop: hanya revalidasi background (single-flight) jika cache
+    sudah lewat PRODUCT_CACHE_TIMEOUT; DB tetap dibaca seperti biasa.
+    Di luar event loop (thread/script): fetch sinkron jika cache basi.
+    """
     try:
-        api_key = getattr(config, 'KHFYPAY_API_KEY', '')
-        if not api_key:
-            logger.error("❌ API key tidak tersedia untuk sinkronisasi stok")
-            return False
-        
-        khfy_api = KhfyPayAPI(api_key)
-        provider_products = asyncio.run(khfy_api.get_products())
-        
+        service = get_catalog_sync_service()
+        if service.revalidate():
+            return True
+        provider_products = get_khfypay_client().run_sync(service.cache.get, wait=True)
         if not provider_products:
             logger.error("❌ Gagal mendapatkan produk dari provider")
             return False
-        
-        updated_stock_count = 0
-        
-        if isinstance(provider_products, list):
-            for provider_product in provider_products:
-                if isinstance(provider_product, dict):
-                    product_code = provider_product.get('code', '').strip()
-                    product_status = provider_product.get('status', '').lower()
-                    
-                    if product_code:
-                        if product_status == 'active':
-                            new_stock = 100
-                            gangguan = 0
-                            kosong = 0
-                        elif product_status == 'empty':
-                            new_stock = 0
-                            gangguan = 0
-                            kosong = 1
-                        elif product_status == 'problem':
-                            new_stock = 0
-                            gangguan = 1
-                            kosong = 0
-                        elif product_status == 'inactive':
-                            new_stock = 0
-                            gangguan = 0
-                            kosong = 1
-                        else:
-                            new_stock = 0
-                            gangguan = 0
-                            kosong = 1
-                        
-                        try:
-                            if hasattr(database, 'update_product'):
-                                success = database.update_product(
-                                    product_code,
-                                    stock=new_stock,
-                                    gangguan=gangguan,
-                                    kosong=kosong
-                                )
-                            else:
-                                conn = sqlite3.connect('bot_database.db')
-                                cursor = conn.cursor()
-                                cursor.execute('''
-                                    UPDATE products SET stock = ?, gangguan = ?, kosong = ?
-                                    WHERE code = ?
-                                ''', (new_stock, gangguan, kosong, product_code))
-                                success = cursor.rowcount > 0
-                                conn.commit()
-                                conn.close()
-                            
-                            if success:
-                                updated_stock_count += 1
-                        except Exception as update_error:
-                            logger.error(f"❌ Error updating product {product_code}: {update_error}")
-        
-        logger.info(f"✅ Berhasil update stok untuk {updated_stock_count} produk")
-        return updated_stock_count > 0
-        
+        return True
     except Exception as e:
         logger.error(f"❌ Error sync_product_stock_from_provider: {e}")
         return False
 
+async def refresh_product_stock_before_order():
+    """Cek stok terbaru sebelum order: tunggu fetch hanya jika cache basi (dibagi dengan request lain)"""
+    try:
+        return await get_catalog_sync_service().cache.get(wait=True) is not None
+    except Exception as e:
+        logger.error(f"❌ Error refreshing product stock: {e}")
+        return False
+
 def get_product_stock_status(stock, gangguan, kosong):
     """Get stock status dengan tampilan yang informatif"""
     if kosong == 1:
@@ -844,6 +785,68 @@ def update_product_stock_after_order(product_code, quantity=1):
 
 # ==================== PRODUCT MANAGEMENT ====================
 
+# Group menu order, dicek berurutan: (nama group, kolom, pola). Kolom 'code' = prefix,
+# kolom 'name' = substring (lowercase). Tidak cocok -> category produk.
+PRODUCT_GROUP_RULES = (
+    ("BPAL (Bonus Akrab L)", 'code', ('BPAL',)),
+    ("BPAXXL (Bonus Akrab XXL)", 'code', ('BPAXXL',)),
+    ("XLA (Umum)", 'code', ('XLA',)),
+    ("Pulsa", 'name', ('pulsa',)),
+    ("Internet", 'name', ('data', 'internet', 'kuota')),
+    ("Listrik", 'name', ('listrik', 'pln')),
+    ("Game", 'name', ('game',)),
+    ("E-Money", 'name', ('emoney', 'gopay', 'dana')),
+)
+DEFAULT_PRODUCT_GROUP = 'Lainnya'
+
+def get_product_group(product):
+    """Nama group menu order untuk satu produk (lihat PRODUCT_GROUP_RULES)"""
+    code = product.get('code') or ''
+    name = (product.get('name') or '').lower()
+    for group, column, patterns in PRODUCT_GROUP_RULES:
+        if column == 'code':
+            if code.startswith(patterns):
+                return group
+        elif any(pattern in name for pattern in patterns):
+            return group
+    return product.get('category') or DEFAULT_PRODUCT_GROUP
+
+def product_group_sql():
+    """Ekspresi SQL + params yang menghitung group seperti get_product_group"""
+    whens, params = [], []
+    for group, column, patterns in PRODUCT_GROUP_RULES:
+        if column == 'code':
+            tests = ['substr(code, 1, ?) = ?' for _ in patterns]
+            for pattern in patterns:
+                params.extend((len(pattern), pattern))
+        else:
+            tests = ['instr(lower(name), ?) > 0' for _ in patterns]
+            params.extend(patterns)
+        whens.append(f"WHEN {' OR '.join(tests)} THEN ?")
+        params.append(group)
+    params.append(DEFAULT_PRODUCT_GROUP)
+    return f"CASE {' '.join(whens)} ELSE COALESCE(NULLIF(category, ''), ?) END", tuple(params)
+
+def with_stock_info(product):
+    """Dict produk untuk menu order, ditambah stock_status / display_stock"""
+    stock_status, actual_stock = get_product_stock_status(
+        product.get('stock', 0), 
+        product.get('gangguan', 0), 
+        product.get('kosong', 0)
+    )
+    return {
+        'code': product['code'],
+        'name': product['name'],
+        'price': product['price'],
+        'category': product.get('category', ''),
+        'description': product.get('description', ''),
+        'stock': product.get('stock', 0),
+        'gangguan': product.get('gangguan', 0),
+        'kosong': product.get('kosong', 0),
+        'stock_status': stock_status,
+        'display_stock': actual_stock
+    }
+
 def get_grouped_products_with_stock():
     """Get products grouped by category dari database dengan tampilan stok"""
     try:
@@ -867,46 +870,7 @@ def get_grouped_products_with_stock():
         
         groups = {}
         for product in products_data:
-            group = product.get('category', 'Lainnya')
-            
-            if product['code'].startswith("BPAL"):
-                group = "BPAL (Bonus Akrab L)"
-            elif product['code'].startswith("BPAXXL"):
-                group = "BPAXXL (Bonus Akrab XXL)"
-            elif product['code'].startswith("XLA"):
-                group = "XLA (Umum)"
-            elif "pulsa" in product['name'].lower():
-                group = "Pulsa"
-            elif "data" in product['name'].lower() or "internet" in product['name'].lower() or "kuota" in product['name'].lower():
-                group = "Internet"
-            elif "listrik" in product['name'].lower() or "pln" in product['name'].lower():
-                group = "Listrik"
-            elif "game" in product['name'].lower():
-                group = "Game"
-            elif "emoney" in product['name'].lower() or "gopay" in product['name'].lower() or "dana" in product['name'].lower():
-                group = "E-Money"
-            
-            if group not in groups:
-                groups[group] = []
-            
-            stock_status, actual_stock = get_product_stock_status(
-                product.get('stock', 0), 
-                product.get('gangguan', 0), 
-                product.get('kosong', 0)
-            )
-            
-            groups[group].append({
-                'code': product['code'],
-                'name': product['name'],
-                'price': product['price'],
-                'category': product.get('category', ''),
-                'description': product.get('description', ''),
-                'stock': product.get('stock', 0),
-                'gangguan': product.get('gangguan', 0),
-                'kosong': product.get('kosong', 0),
-                'stock_status': stock_status,
-                'display_stock': actual_stock
-            })
+            groups.setdefault(get_product_group(product), []).append(with_stock_info(product))
         
         sorted_groups = {}
         for group in sorted(groups.keys()):
@@ -1059,14 +1023,12 @@ class RealTimePoller:
             order_id = order['id']
             user_id = order['user_id']
             
-            created_at = order['created_at']
-            if isinstance(created_at, str):
-                created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+            created_at = database.from_epoch(order['created_at'])
             
             if (datetime.now() - created_at).total_seconds() < 30:
                 return
             
-            status, message, sn, timestamp = self.khfy_api.check_order_status_detailed(reffid)
+            status, message, sn, timestamp = await self.khfy_api.check_order_status_detailed(reffid)
             
             if not status:
                 logger.warning(f"⚠️ No status for order {order_id}")
@@ -1076,7 +1038,6 @@ class RealTimePoller:
             current_status = order['status']
             
             new_status = None
-            refund_amount = 0
             
             # PERBAIKAN UTAMA: Deteksi status SUKSES yang lebih akurat
             if any(s in status for s in ['SUKSES', 'SUCCESS', 'BERHASIL', 'COMPLETED', 'SELESAI']):
@@ -1089,7 +1050,6 @@ class RealTimePoller:
             elif any(s in status for s in ['GAGAL', 'FAILED', 'ERROR', 'BATAL']):
                 if current_status != 'failed':
                     new_status = 'failed'
-                    refund_amount = order['price']
                     logger.info(f"❌ REAL-TIME: Order {order_id} failed - Status: {status}")
             
             # Deteksi status PENDING
@@ -1099,12 +1059,13 @@ class RealTimePoller:
                     logger.info(f"⏳ REAL-TIME: Order {order_id} still pending - Status: {status}")
             
             # Update status jika ada perubahan
-            if new_status:
+            if new_status == 'failed':
+                # Gagal + refund satu transaksi; False = order sudah ditutup jalur lain
+                if not database.fail_order_with_refund(order_id, note=f"Real-time: {status} - {message}", sn=sn):
+                    return
+                await self.send_real_time_notification(user_id, order, new_status, message, sn, timestamp)
+            elif new_status:
                 update_order_status(order_id, new_status, sn=sn, note=f"Real-time: {status} - {message}")
-                
-                if refund_amount > 0:
-                    update_user_saldo_modern(user_id, refund_amount, f"Refund: Order failed - {status}")
-                
                 await self.send_real_time_notification(user_id, order, new_status, message, sn, timestamp)
                 
         except Exception as e:
@@ -1184,10 +1145,7 @@ class RealTimePoller:
             
             for order in pending_orders:
                 order_id = order['id']
-                created_at = order['created_at']
-                
-                if isinstance(created_at, str):
-                    created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+                created_at = database.from_epoch(order['created_at'])
                 
                 time_diff = (current_time - created_at).total_seconds()
                 
@@ -1206,17 +1164,13 @@ class RealTimePoller:
             
             logger.info(f"⏰ Auto-failing timeout order {order_id}")
             
-            update_order_status(
-                order_id, 
-                'failed', 
+            refund_success = database.fail_order_with_refund(
+                order_id,
                 note=f"Auto failed: Timeout 3 menit tanpa respon provider"
             )
-            
-            refund_success = update_user_saldo_modern(
-                user_id, 
-                order['price'], 
-                f"Refund: Order timeout - {order['product_name']}"
-            )
+            if not refund_success:
+                logger.info(f"ℹ️ Timeout order {order_id} already closed, skipped")
+                return
             
             message = ModernMessageBuilder.create_order_message(
                 order,
@@ -1316,21 +1270,31 @@ async def show_modern_products(update: Update, context: ContextTypes.DEFAULT_TYP
     
     try:
         data = query.data
-        group_name = data.replace('morder_group_', '')
+        if data.startswith('morder_group_'):
+            group_name = data.replace('morder_group_', '')
+            context.user_data['product_page'] = 0
+            context.user_data.pop('product_cursor', None)
+            context.user_data.pop('product_page_cursors', None)
+        else:
+            group_name = context.user_data.get('current_group')
         
-        groups = get_grouped_products_with_stock()
-        if group_name not in groups:
+        sync_product_stock_from_provider()
+        
+        # Filter group dihitung di SQL; halaman diambil dengan keyset seek di DB
+        group_sql, group_params = product_group_sql()
+        group_filter = {'where': f"{group_sql} = ?", 'params': group_params + (group_name,)}
+        counts = await database.db.count_products(**group_filter)
+        if not counts['total']:
             await show_modern_error(update, "Kategori tidak ditemukan")
             return ConversationHandler.END
         
-        products = groups[group_name]
         context.user_data['current_group'] = group_name
-        context.user_data['current_products'] = products
         
         page = context.user_data.get('product_page', 0)
-        start_idx = page * PRODUCTS_PER_PAGE
-        end_idx = start_idx + PRODUCTS_PER_PAGE
-        page_products = products[start_idx:end_idx]
+        result = await database.db.get_products_page(
+            cursor=context.user_data.get('product_cursor'), limit=PRODUCTS_PER_PAGE, **group_filter
+        )
+        page_products = [with_stock_info(product) for product in result['items']]
         
         keyboard = []
         for product in page_products:
@@ -1355,11 +1319,14 @@ async def show_modern_products(update: Update, context: ContextTypes.DEFAULT_TYP
             keyboard.append([InlineKeyboardButton(button_text, callback_data=f"morder_product_{product['code']}")])
         
         nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton("◀️ Sebelumnya", callback_data="morder_prev_page"))
+        page_cursors = context.user_data.setdefault('product_page_cursors', {})
+        if result['prev_cursor']:
+            nav_buttons.append(InlineKeyboardButton("◀️ Sebelumnya", callback_data=database.cursor_callback_data(
+                'morder_page_', 'p', result['prev_cursor'], page_cursors)))
         
-        if end_idx < len(products):
-            nav_buttons.append(InlineKeyboardButton("Selanjutnya ▶️", callback_data="morder_next_page"))
+        if result['next_cursor']:
+            nav_buttons.append(InlineKeyboardButton("Selanjutnya ▶️", callback_data=database.cursor_callback_data(
+                'morder_page_', 'n', result['next_cursor'], page_cursors)))
         
         if nav_buttons:
             keyboard.append(nav_buttons)
@@ -1367,9 +1334,9 @@ async def show_modern_products(update: Update, context: ContextTypes.DEFAULT_TYP
         keyboard.append([InlineKeyboardButton("🔙 Kembali ke Kategori", callback_data="morder_back_to_groups")])
         keyboard.append([InlineKeyboardButton("🏠 Menu Utama", callback_data="main_menu_main")])
         
-        total_in_group = len(products)
-        available_in_group = sum(1 for p in products if p['display_stock'] > 0 and p['gangguan'] == 0 and p['kosong'] == 0)
-        total_pages = (len(products) + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
+        total_in_group = counts['total']
+        available_in_group = counts['available']
+        total_pages = (total_in_group + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
         page_info = f" (Halaman {page + 1}/{total_pages})" if total_pages > 1 else ""
         
         message = (
@@ -1394,18 +1361,65 @@ async def show_modern_products(update: Update, context: ContextTypes.DEFAULT_TYP
         await show_modern_error(update, "Error memuat produk")
         return CHOOSING_PRODUCT
 
+async def search_modern_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cari <teks> - cari produk tersedia lewat index FTS, tanpa memuat seluruh katalog"""
+    try:
+        keyword = ' '.join(context.args or []).strip()
+        if not keyword:
+            await update.message.reply_text(
+                "🔎 Ketik kata kunci setelah perintah, contoh: `/cari pulsa telkomsel 10`",
+                parse_mode="Markdown"
+            )
+            return CHOOSING_PRODUCT if context.user_data.get('current_group') else CHOOSING_GROUP
+        
+        products = await database.db.search_products(keyword, limit=PRODUCTS_PER_PAGE)
+        
+        keyboard = []
+        for product in products:
+            operator = get_operator_from_product_code(product['code'])
+            operator_text = f" | {operator}" if operator else ""
+            button_text = f"🟢 {product['name']} - Rp {product['price']:,}{operator_text} | Stock: {product['stock']}"
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"morder_product_{product['code']}")])
+        
+        keyboard.append([InlineKeyboardButton("🔙 Kembali ke Kategori", callback_data="morder_back_to_groups")])
+        keyboard.append([InlineKeyboardButton("🏠 Menu Utama", callback_data="main_menu_main")])
+        
+        if products:
+            message = (
+                f"🔎 **HASIL PENCARIAN:** {escape_markdown(keyword)}\n"
+                f"▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬\n\n"
+                f"Ditemukan {len(products)} produk tersedia. Pilih produk:"
+            )
+        else:
+            message = (
+                f"🔎 **HASIL PENCARIAN:** {escape_markdown(keyword)}\n\n"
+                f"❌ Tidak ada produk tersedia yang cocok.\n"
+                f"Coba kata kunci lain atau pilih dari kategori."
+            )
+        
+        await update.message.reply_text(message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        return CHOOSING_PRODUCT
+        
+    except Exception as e:
+        logger.error(f"❌ Error in search_modern_products: {e}")
+        await update.message.reply_text("❌ Gagal mencari produk. Silakan coba lagi.")
+        return CHOOSING_GROUP
+
 async def handle_modern_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle modern pagination"""
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    cursor = database.callback_cursor(query.data.replace('morder_page_', ''),
+                                      context.user_data.get('product_page_cursors', {}))
+    direction, _ = database.decode_cursor(cursor)
     current_page = context.user_data.get('product_page', 0)
     
-    if data == 'morder_next_page':
+    if direction == 'n':
         context.user_data['product_page'] = current_page + 1
-    elif data == 'morder_prev_page':
+    elif direction == 'p':
         context.user_data['product_page'] = max(0, current_page - 1)
+    context.user_data['product_cursor'] = cursor
     
     return await show_modern_products(update, context)
 
@@ -1414,8 +1428,9 @@ async def back_to_modern_groups(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    if 'product_page' in context.user_data:
-        del context.user_data['product_page']
+    context.user_data.pop('product_page', None)
+    context.user_data.pop('product_cursor', None)
+    context.user_data.pop('product_page_cursors', None)
     
     return await show_modern_group_menu(update, context)
 
@@ -1597,6 +1612,32 @@ async def receive_modern_target(update: Update, context: ContextTypes.DEFAULT_TY
         await show_modern_error(update, "Error memproses tujuan")
         return ENTER_TUJUAN
 
+async def show_insufficient_balance(update, product, target, saldo):
+    """Tampilkan pesan saldo tidak cukup"""
+    price = product['price']
+    message = ModernMessageBuilder.create_order_message(
+        {
+            'product_name': product['name'],
+            'customer_input': target,
+            'price': price,
+            'provider_order_id': 'N/A'
+        },
+        'failed',
+        [
+            f"💰 **Saldo:** Rp {saldo:,}",
+            f"💳 **Dibutuhkan:** Rp {price:,}",
+            f"🔶 **Kurang:** Rp {max(price - saldo, 0):,}",
+            "💸 **Silakan top up saldo terlebih dahulu**"
+        ]
+    )
+    
+    keyboard = [
+        [InlineKeyboardButton("💸 TOP UP", callback_data="topup_menu")],
+        [InlineKeyboardButton("🏠 MENU UTAMA", callback_data="main_menu_main")]
+    ]
+    
+    await safe_edit_modern_message(update, message, InlineKeyboardMarkup(keyboard))
+
 async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process modern order dengan improved status detection"""
     query = update.callback_query
@@ -1610,94 +1651,89 @@ async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYP
         await show_modern_error(update, "Data order tidak lengkap")
         return ConversationHandler.END
     
+    debited = False
     try:
         user_id = str(query.from_user.id)
         price = product['price']
         
-        async with order_lock:
-            saldo_awal = get_user_saldo(user_id)
-            if saldo_awal < price:
-                message = ModernMessageBuilder.create_order_message(
-                    {
-                        'product_name': product['name'],
-                        'customer_input': target,
-                        'price': price,
-                        'provider_order_id': 'N/A'
-                    },
-                    'failed',
-                    [
-                        f"💰 **Saldo:** Rp {saldo_awal:,}",
-                        f"💳 **Dibutuhkan:** Rp {price:,}",
-                        f"🔶 **Kurang:** Rp {price - saldo_awal:,}",
-                        "💸 **Silakan top up saldo terlebih dahulu**"
-                    ]
-                )
-                
-                keyboard = [
-                    [InlineKeyboardButton("💸 TOP UP", callback_data="topup_menu")],
-                    [InlineKeyboardButton("🏠 MENU UTAMA", callback_data="main_menu_main")]
-                ]
-                
-                await safe_edit_modern_message(update, message, InlineKeyboardMarkup(keyboard))
-                return ConversationHandler.END
-            
-            anim_message = await ModernAnimations.show_processing(
-                update, context, 
-                "Memeriksa Stok Terbaru...", 2
+        saldo_awal = get_user_saldo(user_id)
+        if saldo_awal < price:
+            await show_insufficient_balance(update, product, target, saldo_awal)
+            return ConversationHandler.END
+        
+        anim_message = await ModernAnimations.show_processing(
+            update, context, 
+            "Memeriksa Stok Terbaru...", 2
+        )
+        
+        await refresh_product_stock_before_order()
+        updated_product = get_product_by_code_with_stock(product['code'])
+        
+        if not updated_product or updated_product.get('kosong') == 1 or updated_product.get('display_stock', 0) <= 0:
+            message = ModernMessageBuilder.create_order_message(
+                product, 'failed',
+                ["❌ **Stok sudah habis**", "🔄 Silakan pilih produk lain"]
             )
             
-            sync_product_stock_from_provider()
-            updated_product = get_product_by_code_with_stock(product['code'])
+            keyboard = [
+                [InlineKeyboardButton("🛒 PRODUK LAIN", callback_data="morder_back_to_groups")],
+                [InlineKeyboardButton("🏠 MENU UTAMA", callback_data="main_menu_main")]
+            ]
             
-            if not updated_product or updated_product.get('kosong') == 1 or updated_product.get('display_stock', 0) <= 0:
-                message = ModernMessageBuilder.create_order_message(
-                    product, 'failed',
-                    ["❌ **Stok sudah habis**", "🔄 Silakan pilih produk lain"]
+            try:
+                await context.bot.edit_message_text(
+                    chat_id=anim_message.chat_id,
+                    message_id=anim_message.message_id,
+                    text=message,
+                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    parse_mode="Markdown"
                 )
-                
-                keyboard = [
-                    [InlineKeyboardButton("🛒 PRODUK LAIN", callback_data="morder_back_to_groups")],
-                    [InlineKeyboardButton("🏠 MENU UTAMA", callback_data="main_menu_main")]
-                ]
-                
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=anim_message.chat_id,
-                        message_id=anim_message.message_id,
-                        text=message,
-                        reply_markup=InlineKeyboardMarkup(keyboard),
-                        parse_mode="Markdown"
-                    )
-                except:
-                    await safe_edit_modern_message(update, message, InlineKeyboardMarkup(keyboard))
-                
-                return CHOOSING_PRODUCT
-            
-            await ModernAnimations.typing_effect(update, context, 1)
+            except:
+                await safe_edit_modern_message(update, message, InlineKeyboardMarkup(keyboard))
             
-            if not update_user_saldo_modern(user_id, -price, f"Order: {product['name']}"):
+            return CHOOSING_PRODUCT
+        
+        await ModernAnimations.typing_effect(update, context, 1)
+        
+        # Debit atomic di database (WHERE balance >= price) - tanpa lock global
+        debit = await database.db.debit_user_balance(user_id, price, f"Order: {product['name']}")
+        if not debit:
+            if debit == database.DebitResult.INSUFFICIENT:
+                await show_insufficient_balance(update, product, target, get_user_saldo(user_id))
+            elif debit == database.DebitResult.BANNED:
+                await show_modern_error(update, "⛔ Akun Anda diblokir, order tidak dapat diproses")
+            elif debit == database.DebitResult.INVALID_AMOUNT:
+                await show_modern_error(update, "Harga produk tidak valid, silakan pilih produk lain")
+            elif debit == database.DebitResult.NOT_FOUND:
+                await show_modern_error(update, "Akun tidak ditemukan, silakan /start ulang")
+            else:
                 await show_modern_error(update, "Gagal memotong saldo")
-                return ConversationHandler.END
-            
-            reffid = f"akrab_{uuid.uuid4().hex[:16]}"
-            order_id = save_order(
-                user_id=user_id,
-                product_name=product['name'],
-                product_code=product['code'],
-                customer_input=target,
-                price=price,
-                status='processing',
-                provider_order_id=reffid,
-                sn='',
-                note='Sedang diproses ke provider - REAL-TIME TRACKING',
-                saldo_awal=saldo_awal
-            )
-            
-            if not order_id:
-                update_user_saldo_modern(user_id, price, "Refund: Gagal save order")
-                await show_modern_error(update, "Gagal menyimpan order")
-                return ConversationHandler.END
+            return ConversationHandler.END
+        debited = bool(debit)
+        
+        reffid = f"akrab_{uuid.uuid4().hex[:16]}"
+        order_id = save_order(
+            user_id=user_id,
+            product_name=product['name'],
+            product_code=product['code'],
+            customer_input=target,
+            price=price,
+            status='processing',
+            provider_order_id=reffid,
+            sn='',
+            note='Sedang diproses ke provider - REAL-TIME TRACKING',
+            saldo_awal=saldo_awal
+        )
         
+        if not order_id:
+            database.credit_user_balance(user_id, price, "Refund: Gagal save order", transaction_type="refund")
+            debited = False
+            await show_modern_error(update, "Gagal menyimpan order")
+            return ConversationHandler.END
+        # Order sudah tercatat: refund selanjutnya hanya lewat transisi status order
+        # (fail_order_with_refund), bukan dari except di bawah
+        debited = False
+    
         try:
             await context.bot.edit_message_text(
                 chat_id=anim_message.chat_id,
@@ -1719,7 +1755,7 @@ async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYP
         timestamp = ""
         
         if order_result:
-            status, message, sn, time_str = khfy_api.check_order_status_detailed(reffid)
+            status, message, sn, time_str = await khfy_api.check_order_status_detailed(reffid)
             if status:
                 provider_status = status.upper().strip()
                 provider_message = message
@@ -1738,14 +1774,18 @@ async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYP
         
         elif provider_status and any(s in provider_status for s in ['GAGAL', 'FAILED', 'ERROR', 'BATAL']):
             final_status = 'failed'
-            update_user_saldo_modern(user_id, price, f"Refund: {provider_message}")
-            status_info = ["❌ **Gagal di Provider**", f"💡 {provider_message}", "✅ Saldo telah dikembalikan"]
+            refunded = database.fail_order_with_refund(
+                order_id, note=f"Provider: {provider_status} - {provider_message}", sn=sn_number
+            )
+            status_info = ["❌ **Gagal di Provider**", f"💡 {provider_message}",
+                           "✅ Saldo telah dikembalikan" if refunded else "ℹ️ Order sudah diproses sebelumnya"]
             logger.info(f"💥 Order {order_id} detected as FAILED - Provider status: {provider_status}")
         
         else:
             logger.info(f"🔍 Order {order_id} waiting for provider confirmation - Current status: {provider_status}")
         
-        update_order_status(order_id, final_status, sn=sn_number, note=f"Provider: {provider_status} - {provider_message}")
+        if final_status != 'failed':
+            update_order_status(order_id, final_status, sn=sn_number, note=f"Provider: {provider_status} - {provider_message}")
         
         saldo_akhir = get_user_saldo(user_id)
         
@@ -1814,7 +1854,7 @@ async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYP
         except:
             await safe_edit_modern_message(update, message, InlineKeyboardMarkup(keyboard))
         
-        order_keys = ['selected_product', 'order_target', 'product_page', 'current_group', 'current_products']
+        order_keys = ['selected_product', 'order_target', 'product_page', 'product_cursor', 'product_page_cursors', 'current_group']
         for key in order_keys:
             if key in user_data:
                 del user_data[key]
@@ -1824,11 +1864,12 @@ async def process_modern_order(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         logger.error(f"❌ Critical error in modern order: {e}")
         
-        try:
-            user_id = str(query.from_user.id)
-            update_user_saldo_modern(user_id, product['price'], "Refund: System error")
-        except:
-            pass
+        # Refund hanya jika saldo sudah terpotong dan belum dikembalikan
+        if debited:
+            try:
+                database.credit_user_balance(user_id, price, "Refund: System error", transaction_type="refund")
+            except Exception as refund_error:
+                logger.error(f"❌ Refund after system error failed for {user_id}: {refund_error}")
         
         await show_modern_error(update, f"System error: {str(e)}")
         return ConversationHandler.END
@@ -1902,7 +1943,7 @@ async def cancel_modern_conversation(update: Update, context: ContextTypes.DEFAU
     if query:
         await query.answer()
     
-    order_keys = ['selected_product', 'order_target', 'product_page', 'current_group', 'current_products']
+    order_keys = ['selected_product', 'order_target', 'product_page', 'product_cursor', 'product_page_cursors', 'current_group']
     for key in order_keys:
         if key in context.user_data:
             del context.user_data[key]
@@ -1920,15 +1961,20 @@ async def cancel_modern_conversation(update: Update, context: ContextTypes.DEFAU
 def get_modern_conversation_handler():
     """Get modern conversation handler untuk didaftarkan di main.py"""
     return ConversationHandler(
-        entry_points=[CallbackQueryHandler(menu_handler, pattern="^main_menu_order$")],
+        entry_points=[
+            CallbackQueryHandler(menu_handler, pattern="^main_menu_order$"),
+            CommandHandler("cari", search_modern_products)
+        ],
         states={
             CHOOSING_GROUP: [
                 CallbackQueryHandler(show_modern_products, pattern="^morder_group_"),
+                CommandHandler("cari", search_modern_products),
                 CallbackQueryHandler(cancel_modern_conversation, pattern="^main_menu_main$")
             ],
             CHOOSING_PRODUCT: [
                 CallbackQueryHandler(select_modern_product, pattern="^morder_product_"),
-                CallbackQueryHandler(handle_modern_pagination, pattern="^(morder_next_page|morder_prev_page)$"),
+                CallbackQueryHandler(handle_modern_pagination, pattern="^morder_page_"),
+                CommandHandler("cari", search_modern_products),
                 CallbackQueryHandler(back_to_modern_groups, pattern="^morder_back_to_groups$"),
                 CallbackQueryHandler(cancel_modern_conversation, pattern="^main_menu_main$")
             ],
@@ -5,6 +5,8 @@ import json
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import config
+from khfypay_client import get_khfypay_client
+from catalog_sync import initialize_catalog_sync
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,7 @@ class KhfyPayStockAPI:
         self.api_key = api_key
         self.base_url = "https://panel.khfy-store.com/api_v2"
         self.stock_url = "https://panel.khfy-store.com/api_v3/cek_stock_akrab"
+        self.client = get_khfypay_client()
     
     async def get_real_time_stock(self):
         """Get real-time stock from KhfyPay API - REAL DATA dari provider"""
@@ -45,25 +48,19 @@ class KhfyPayStockAPI:
         try:
             logger.info(f"🔍 Calling Stock API: {self.stock_url}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.stock_url, timeout=15) as response:
-                    logger.info(f"🔍 Stock API Response Status: {response.status}")
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"🔍 Stock API Response type: {type(data)}")
-                        
-                        # Debug log
-                        if isinstance(data, dict):
-                            logger.info(f"🔍 Stock API Keys: {list(data.keys())}")
-                        elif isinstance(data, list):
-                            logger.info(f"🔍 Stock API List length: {len(data)}")
-                        
-                        return data
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Stock API Error: {response.status} - {error_text}")
-                        return None
+            data = await self.client.request('cek_stock_akrab', url=self.stock_url, with_api_key=False)
+            logger.info(f"🔍 Stock API Response type: {type(data)}")
+            
+            # Debug log
+            if isinstance(data, dict):
+                logger.info(f"🔍 Stock API Keys: {list(data.keys())}")
+            elif isinstance(data, list):
+                logger.info(f"🔍 Stock API List length: {len(data)}")
+            
+            return data
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"❌ Stock API Error: {e.status} - {e.message}")
+            return None
         except Exception as e:
             logger.error(f"❌ Error in _get_stock_v3: {e}")
             return None
@@ -71,15 +68,7 @@ class KhfyPayStockAPI:
     async def _get_products_v2(self):
         """Get products from API v2"""
         try:
-            url = f"{self.base_url}/list_product"
-            params = {"api_key": self.api_key}
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=15) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data
-                    return None
+            return await self.client.request('list_product', {"api_key": self.api_key})
         except Exception as e:
             logger.error(f"❌ Error in _get_products_v2: {e}")
             return None
@@ -540,30 +529,9 @@ async def show_no_products_message(update):
 
 # ==================== BACKGROUND STOCK SYNC ====================
 
-async def background_stock_sync():
-    """Background task untuk monitoring stok REAL"""
-    while True:
-        try:
-            await asyncio.sleep(300)  # Check every 5 minutes
-            api_key = getattr(config, 'KHFYPAY_API_KEY', '')
-            if api_key:
-                stock_api = KhfyPayStockAPI(api_key)
-                real_time_data = await stock_api.get_real_time_stock()
-                if real_time_data:
-                    processed = process_real_time_stock(real_time_data)
-                    if processed:
-                        logger.info(f"🔍 REAL Background stock: {processed['total_products']} produk, {processed['available_products']} tersedia, {processed['total_stock']} total stok")
-        except Exception as e:
-            logger.error(f"❌ Background stock sync error: {e}")
-            await asyncio.sleep(60)
-
 def initialize_stock_sync():
-    """Initialize background stock monitoring"""
-    try:
-        asyncio.create_task(background_stock_sync())
-        logger.info("✅ Background REAL-TIME stock monitoring initialized")
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize background stock monitoring: {e}")
+    """Initialize background catalog sync (satu service untuk seluruh bot, lihat catalog_sync)"""
+    initialize_catalog_sync()
 
 # Import datetime
 from datetime import datetime
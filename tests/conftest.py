@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database membuat bot_database.db di cwd saat di-import; jangan di folder repo
+os.chdir(tempfile.mkdtemp(prefix='cekot-tests-'))
+
+import config
+import database
+
+
+def open_manager(path):
+    """DatabaseManager baru untuk ``path`` (melewati singleton modul)"""
+    manager = object.__new__(database.DatabaseManager)
+    manager.__init__(str(path))
+    return manager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / 'bot_database.db'
+
+
+@pytest.fixture
+def manager(db_path, monkeypatch):
+    monkeypatch.setattr(config, 'RETENTION_BATCH_PAUSE', 0, raising=False)
+    manager = open_manager(db_path)
+    yield manager
+    manager.close()
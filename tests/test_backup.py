@@ -0,0 +1,31 @@
+import sqlite3
+
+import config
+
+
+def test_backup_finishes_while_other_connections_commit(manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BACKUP_PAGES_PER_STEP', 2, raising=False)
+    monkeypatch.setattr(config, 'BACKUP_STEP_PAUSE', 0, raising=False)
+    with manager.get_connection() as conn:
+        conn.executemany("INSERT INTO system_logs (level, module, message) VALUES ('INFO', 'test', ?)",
+                         [('x' * 500,) for _ in range(200)])
+        logs_before = conn.execute('SELECT COUNT(*) FROM system_logs').fetchone()[0]
+
+    steps = []
+
+    def write_between_steps(done, total):
+        steps.append(done)
+        # Tanpa snapshot tetap, commit ini membuat backup mulai ulang dari halaman 0
+        assert len(steps) < 1000, 'backup keeps restarting'
+        with manager.get_connection() as conn:
+            conn.execute("INSERT INTO system_logs (level, module, message) VALUES ('INFO', 'test', 'baru')")
+
+    path = manager.backup_database(str(tmp_path / 'backup.db'), compress=False, progress=write_between_steps)
+
+    assert path
+    assert steps == sorted(steps)
+    backup = sqlite3.connect(path)
+    try:
+        assert backup.execute('SELECT COUNT(*) FROM system_logs').fetchone()[0] == logs_before
+    finally:
+        backup.close()
@@ -0,0 +1,116 @@
+import sqlite3
+
+OLD_EPOCH = 1700000000
+
+
+def provider_product(code, name, price, **fields):
+    """Produk seperti hasil catalog_sync.normalize_provider_products"""
+    product = {
+        'code': code,
+        'name': name,
+        'price': price,
+        'description': f"Produk {name}",
+        'category': 'Pulsa',
+        'provider': 'TSEL',
+        'gangguan': 0,
+        'kosong': 0,
+        'stock': 100,
+    }
+    product.update(fields)
+    return product
+
+
+CATALOG = [
+    provider_product('PLS5', 'Pulsa 5', 5500),
+    provider_product('PLS10', 'Pulsa 10', 10500),
+    provider_product('PLS20', 'Pulsa 20', 20500),
+]
+
+
+def products(db_path):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            'SELECT code, price, status, stock, category, updated_at FROM products'
+        )}
+    finally:
+        conn.close()
+
+
+def age_all_rows(manager):
+    with manager.get_connection() as conn:
+        conn.execute('UPDATE products SET updated_at = ?', (OLD_EPOCH,))
+
+
+def test_first_sync_inserts_everything(manager, db_path):
+    stats = manager.sync_provider_products(CATALOG)
+
+    assert {key: stats[key] for key in ('total', 'new', 'updated', 'unchanged', 'deactivated')} == \
+        {'total': 3, 'new': 3, 'updated': 0, 'unchanged': 0, 'deactivated': 0}
+    assert stats['signature'] == manager.get_products_signature()
+    assert {code: row[:3] for code, row in products(db_path).items()} == {
+        'PLS5': (5500, 'active', 100),
+        'PLS10': (10500, 'active', 100),
+        'PLS20': (20500, 'active', 100),
+    }
+
+
+def test_unchanged_rows_are_not_written(manager, db_path):
+    manager.sync_provider_products(CATALOG)
+    age_all_rows(manager)
+
+    stats = manager.sync_provider_products(CATALOG)
+
+    assert (stats['new'], stats['updated'], stats['unchanged'], stats['deactivated']) == (0, 0, 3, 0)
+    assert {row[4] for row in products(db_path).values()} == {OLD_EPOCH}
+
+
+def test_only_changed_rows_are_written(manager, db_path):
+    manager.sync_provider_products(CATALOG)
+    age_all_rows(manager)
+
+    changed = [CATALOG[0], provider_product('PLS10', 'Pulsa 10', 10600), CATALOG[2]]
+    stats = manager.sync_provider_products(changed)
+
+    assert (stats['updated'], stats['unchanged']) == (1, 2)
+    rows = products(db_path)
+    assert rows['PLS10'][0] == 10600
+    assert rows['PLS10'][4] != OLD_EPOCH
+    assert rows['PLS5'][4] == rows['PLS20'][4] == OLD_EPOCH
+
+
+def test_local_stock_change_is_reset_by_sync(manager, db_path):
+    manager.sync_provider_products(CATALOG)
+    # Order mengurangi stock lokal tanpa mengubah fingerprint provider
+    assert manager.update_product('PLS5', stock=97)
+    signature = manager.get_products_signature()
+
+    stats = manager.sync_provider_products(CATALOG)
+
+    assert (stats['updated'], stats['unchanged']) == (1, 2)
+    assert products(db_path)['PLS5'][2] == 100
+    assert stats['signature'] != signature
+
+
+def test_missing_products_are_deactivated(manager, db_path):
+    manager.sync_provider_products(CATALOG)
+
+    stats = manager.sync_provider_products(CATALOG[:2])
+
+    assert stats['deactivated'] == 1
+    assert products(db_path)['PLS20'][1] == 'inactive'
+
+    # Muncul lagi di katalog -> aktif kembali
+    stats = manager.sync_provider_products(CATALOG)
+    assert stats['updated'] == 1
+    assert products(db_path)['PLS20'][1] == 'active'
+
+
+def test_sync_keeps_admin_category(manager, db_path):
+    manager.sync_provider_products(CATALOG)
+    assert manager.update_product('PLS5', category='Promo')
+
+    manager.sync_provider_products([provider_product('PLS5', 'Pulsa 5', 5600)] + CATALOG[1:])
+
+    assert products(db_path)['PLS5'][0] == 5600
+    assert products(db_path)['PLS5'][3] == 'Promo'
@@ -0,0 +1,106 @@
+import database
+
+
+def make_user(manager, user_id='100', balance=10000):
+    manager.get_or_create_user(user_id, 'budi', 'Budi')
+    if balance:
+        assert manager.credit_user_balance(user_id, balance, 'Topup', transaction_type='topup')
+    return user_id
+
+
+def ledger(manager, user_id):
+    with manager.get_connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT type, amount FROM transactions WHERE user_id = ? ORDER BY id', (user_id,)
+        )]
+
+
+def test_debit_success_takes_balance_and_records_transaction(manager):
+    user_id = make_user(manager)
+
+    result = manager.debit_user_balance(user_id, 2500, 'Order: Pulsa 5')
+
+    assert result is database.DebitResult.OK
+    assert result
+    assert manager.get_user_balance(user_id) == 7500
+    assert ledger(manager, user_id) == [('topup', 10000), ('order', -2500)]
+
+
+def test_debit_insufficient_leaves_balance_untouched(manager):
+    user_id = make_user(manager, balance=2000)
+
+    result = manager.debit_user_balance(user_id, 2500, 'Order: Pulsa 5')
+
+    assert result is database.DebitResult.INSUFFICIENT
+    assert not result
+    assert manager.get_user_balance(user_id) == 2000
+    assert ledger(manager, user_id) == [('topup', 2000)]
+
+
+def test_debit_banned_user_is_rejected_even_with_balance(manager):
+    user_id = make_user(manager)
+    assert manager.ban_user(user_id, 'spam')
+
+    result = manager.debit_user_balance(user_id, 2500, 'Order: Pulsa 5')
+
+    assert result is database.DebitResult.BANNED
+    assert not result
+    assert manager.get_user_balance(user_id) == 10000
+    assert ledger(manager, user_id) == [('topup', 10000)]
+
+
+def test_debit_unknown_user_and_invalid_amount(manager):
+    user_id = make_user(manager)
+
+    assert manager.debit_user_balance('999', 100) is database.DebitResult.NOT_FOUND
+    assert manager.debit_user_balance(user_id, 0) is database.DebitResult.INVALID_AMOUNT
+    assert manager.debit_user_balance(user_id, 'abc') is database.DebitResult.INVALID_AMOUNT
+    assert manager.get_user_balance(user_id) == 10000
+
+
+def test_debit_exact_balance_then_refund(manager):
+    user_id = make_user(manager, balance=2500)
+
+    assert manager.debit_user_balance(user_id, 2500)
+    assert manager.debit_user_balance(user_id, 1) is database.DebitResult.INSUFFICIENT
+    assert manager.credit_user_balance(user_id, 2500, 'Refund: Gagal save order', transaction_type='refund')
+
+    assert manager.get_user_balance(user_id) == 2500
+    assert ledger(manager, user_id) == [('topup', 2500), ('order', -2500), ('refund', 2500)]
+
+
+def make_order(manager, user_id, price=2500, status='processing'):
+    with manager.get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO products (code, name, price) VALUES ('PLS5', 'Pulsa 5', ?)", (price,))
+    return manager.save_order(user_id, 'Pulsa 5', 'PLS5', '0812', price, status=status, provider_order_id='ref-1')
+
+
+def order_status(manager, order_id):
+    with manager.get_connection() as conn:
+        return conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()[0]
+
+
+def test_fail_order_with_refund_refunds_once(manager):
+    user_id = make_user(manager)
+    assert manager.debit_user_balance(user_id, 2500)
+    order_id = make_order(manager, user_id)
+
+    assert manager.fail_order_with_refund(order_id, note='Provider: GAGAL')
+    # Webhook / status checker datang belakangan: tidak ada refund kedua
+    assert not manager.fail_order_with_refund(order_id, note='Webhook: GAGAL')
+
+    assert order_status(manager, order_id) == 'failed'
+    assert manager.get_user_balance(user_id) == 10000
+    assert ledger(manager, user_id) == [('topup', 10000), ('order', -2500), ('refund', 2500)]
+
+
+def test_fail_order_with_refund_skips_completed_order(manager):
+    user_id = make_user(manager)
+    assert manager.debit_user_balance(user_id, 2500)
+    order_id = make_order(manager, user_id)
+    assert manager.update_order_status(order_id, 'completed')
+
+    assert not manager.fail_order_with_refund(order_id)
+
+    assert order_status(manager, order_id) == 'completed'
+    assert manager.get_user_balance(user_id) == 7500
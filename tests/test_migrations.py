@@ -0,0 +1,146 @@
+import calendar
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+import database
+from conftest import open_manager
+
+LATEST_VERSION = database.DatabaseManager.SCHEMA_MIGRATIONS[-1][0]
+
+
+def create_baseline_db(path):
+    """Database versi 0: schema dasar dengan uang REAL dan waktu berupa teks"""
+    conn = sqlite3.connect(str(path))
+    legacy = object.__new__(database.DatabaseManager)
+    legacy._migration_base_schema(conn.cursor())
+    conn.execute('''
+        INSERT INTO users (user_id, full_name, balance, bonus_balance, registered_at, last_active)
+        VALUES ('1', 'Budi', 1500.5, 0.4, '2024-01-02 03:04:05', '2024-01-02 03:04:05.123456')
+    ''')
+    conn.execute('''
+        INSERT INTO products (code, name, price, cost_price, updated_at)
+        VALUES ('PLS5', 'Pulsa 5', 2499.5, 2000.49, '2024-01-02T10:00:00+07:00')
+    ''')
+    conn.execute('''
+        INSERT INTO transactions (user_id, type, amount, status, created_at)
+        VALUES ('1', 'order', -999.49, 'completed', '2024-01-02T10:00:00Z')
+    ''')
+    conn.commit()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    conn.close()
+
+
+@pytest.fixture
+def jakarta_time(monkeypatch):
+    """Zona waktu server UTC+7 agar waktu lokal dan UTC berbeda"""
+    monkeypatch.setenv('TZ', 'Asia/Jakarta')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, 0),
+    ('', 0),
+    (1500, 1500),
+    (1500.5, 1501),
+    ('2499.5', 2500),
+    (2.4999, 2),
+    (' 10000 ', 10000),
+])
+def test_to_rupiah_rounds_half_up(value, expected):
+    assert database.to_rupiah(value) == expected
+
+
+def test_to_rupiah_rejects_garbage():
+    with pytest.raises(ValueError):
+        database.to_rupiah('sepuluh ribu')
+
+
+def test_migrates_baseline_db_to_latest(db_path):
+    create_baseline_db(db_path)
+
+    manager = open_manager(db_path)
+    try:
+        assert manager.get_schema_version() == LATEST_VERSION == 13
+    finally:
+        manager.close()
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        user = conn.execute('''
+            SELECT balance, typeof(balance), bonus_balance, registered_at, typeof(registered_at), last_active
+            FROM users WHERE user_id = '1'
+        ''').fetchone()
+        product = conn.execute("SELECT price, cost_price, updated_at FROM products WHERE code = 'PLS5'").fetchone()
+        transaction = conn.execute('SELECT amount, created_at FROM transactions').fetchone()
+    finally:
+        conn.close()
+
+    assert user[:3] == (1501, 'integer', 0)
+    # CURRENT_TIMESTAMP polos = UTC, pecahan detik = datetime lokal dari Python
+    assert user[3:5] == (calendar.timegm((2024, 1, 2, 3, 4, 5)), 'integer')
+    assert user[5] == int(datetime(2024, 1, 2, 3, 4, 5, 123456).timestamp())
+    assert product == (2500, 2000, calendar.timegm((2024, 1, 2, 3, 0, 0)))
+    assert transaction == (-999, calendar.timegm((2024, 1, 2, 10, 0, 0)))
+
+
+def test_up_to_date_db_is_not_migrated_again(db_path, monkeypatch):
+    open_manager(db_path).close()
+
+    def fail(self, cursor):
+        raise AssertionError('migration ran on an up-to-date database')
+
+    for _, _, method in database.DatabaseManager.SCHEMA_MIGRATIONS:
+        monkeypatch.setattr(database.DatabaseManager, method, fail)
+    manager = open_manager(db_path)
+    try:
+        assert manager.get_schema_version() == LATEST_VERSION
+    finally:
+        manager.close()
+
+
+def test_plain_timestamps_follow_how_each_column_was_written(db_path, jakarta_time):
+    create_baseline_db(db_path)
+    conn = sqlite3.connect(str(db_path))
+    # topups dibuat admin_handler lama (ensure_database_tables)
+    conn.execute('''
+        CREATE TABLE topups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            payment_method TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            approved_at TEXT,
+            approved_by TEXT
+        )
+    ''')
+    # created_at = default CURRENT_TIMESTAMP (UTC); updated_at / approved_at = datetime.now().strftime (lokal)
+    conn.execute('''
+        INSERT INTO products (code, name, price, created_at, updated_at)
+        VALUES ('LOC', 'Pulsa 10', 10500, '2024-01-02 03:00:00', '2024-01-02 10:00:00')
+    ''')
+    conn.execute('''
+        INSERT INTO topups (user_id, amount, status, created_at, approved_at)
+        VALUES ('1', 50000, 'approved', '2024-01-02 03:00:00', '2024-01-02 10:00:00')
+    ''')
+    conn.commit()
+    conn.close()
+
+    open_manager(db_path).close()
+
+    expected = calendar.timegm((2024, 1, 2, 3, 0, 0))
+    assert int(datetime(2024, 1, 2, 10, 0, 0).timestamp()) == expected
+    conn = sqlite3.connect(str(db_path))
+    try:
+        product = conn.execute("SELECT created_at, updated_at FROM products WHERE code = 'LOC'").fetchone()
+        topup = conn.execute('SELECT created_at, approved_at FROM topups').fetchone()
+    finally:
+        conn.close()
+    assert product == (expected, expected)
+    assert topup == (expected, expected)
@@ -0,0 +1,38 @@
+import database
+
+
+def add_products(manager, codes):
+    with manager.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO products (code, name, price, category) VALUES (?, ?, 1000, 'Pulsa')",
+            [(code, f"Produk {code}") for code in codes]
+        )
+
+
+def test_products_page_walks_forward_and_back(manager):
+    codes = [f"P{i:02d}" for i in range(7)]
+    add_products(manager, codes)
+
+    first = manager.get_products_page(limit=3)
+    second = manager.get_products_page(cursor=first['next_cursor'], limit=3)
+    third = manager.get_products_page(cursor=second['next_cursor'], limit=3)
+    back = manager.get_products_page(cursor=third['prev_cursor'], limit=3)
+
+    assert [p['code'] for p in first['items'] + second['items'] + third['items']] == codes
+    assert first['prev_cursor'] is None and third['next_cursor'] is None
+    assert [p['code'] for p in back['items']] == codes[3:6]
+
+
+def test_cursor_callback_data_fits_telegram_limit():
+    store = {}
+    short = database.encode_cursor('n', 'PLS5')
+    long = database.encode_cursor('n', 'X' * 60)
+
+    assert database.cursor_callback_data('product_page_', 'n', short, store) == f"product_page_{short}"
+    assert store == {}
+
+    callback_data = database.cursor_callback_data('product_page_', 'n', long, store)
+    assert callback_data == 'product_page_n'
+    assert len(callback_data.encode()) <= database.CALLBACK_DATA_LIMIT
+    assert database.callback_cursor('n', store) == long
+    assert database.callback_cursor(short, store) == short
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class Interrupted(Exception):
+    pass
+
+
+def add_logs(manager, levels):
+    with manager.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO system_logs (level, module, message) VALUES (?, 'test', 'msg')",
+            [(level,) for level in levels]
+        )
+
+
+def remaining(manager):
+    with manager.get_connection() as conn:
+        return [tuple(row) for row in conn.execute('SELECT id, level FROM system_logs ORDER BY id')]
+
+
+def saved_cursor(manager, name):
+    with manager.get_connection() as conn:
+        row = conn.execute('SELECT value FROM stats_counters WHERE key = ?', (f'retention:{name}:rowid',)).fetchone()
+    return row[0] if row else None
+
+
+def test_purge_resumes_from_saved_cursor(manager):
+    add_logs(manager, ['DEBUG', 'INFO'] * 5)
+    with manager.get_connection() as conn:
+        first_id = conn.execute('SELECT MIN(id) FROM system_logs').fetchone()[0]
+
+    def crash_after_first_batch(name, deleted, after_rowid, max_rowid):
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        manager.purge_in_batches('logs', 'system_logs', "level = 'DEBUG'", batch_size=4,
+                                 progress=crash_after_first_batch)
+
+    # Batch pertama (4 baris) sudah commit, cursor tersimpan
+    cursor = saved_cursor(manager, 'logs')
+    assert cursor == first_id + 3
+    assert [level for _, level in remaining(manager)] == ['INFO', 'INFO'] + ['DEBUG', 'INFO'] * 3
+
+    seen = []
+    result = manager.purge_in_batches('logs', 'system_logs', "level = 'DEBUG'", batch_size=4,
+                                      progress=lambda *args: seen.append(args[2]))
+
+    assert result == {'deleted': 3, 'batches': 2, 'finished': True}
+    # Lanjut dari cursor, bukan mulai dari rowid pertama
+    assert seen == [cursor + 4, cursor + 6]
+    assert [level for _, level in remaining(manager)] == ['INFO'] * 5
+    assert saved_cursor(manager, 'logs') is None
+
+
+def test_purge_leaves_rows_added_after_start(manager):
+    add_logs(manager, ['DEBUG'] * 3)
+
+    def add_more(name, deleted, after_rowid, max_rowid):
+        if deleted == 2:
+            add_logs(manager, ['DEBUG'])
+
+    result = manager.purge_in_batches('logs', 'system_logs', "level = 'DEBUG'", batch_size=2,
+                                      progress=add_more)
+
+    assert result['deleted'] == 3
+    assert len(remaining(manager)) == 1
+
+
+def add_old_order(manager, days_ago=200):
+    manager.get_or_create_user('100', 'budi', 'Budi')
+    with manager.get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO products (code, name, price) VALUES ('PLS5', 'Pulsa 5', 5500)")
+    order_id = manager.save_order('100', 'Pulsa 5', 'PLS5', '0812', 5500, status='completed')
+    created_at = datetime.now() - timedelta(days=days_ago)
+    with manager.get_connection() as conn:
+        conn.execute('UPDATE orders SET created_at = ? WHERE id = ?', (created_at, order_id))
+    manager.refresh_rollups()
+    return created_at.strftime('%Y-%m-%d')
+
+
+def daily_rollup(manager, day):
+    with manager.get_connection() as conn:
+        row = conn.execute('SELECT orders, completed_orders, revenue FROM stats_daily WHERE day = ?', (day,)).fetchone()
+    return tuple(row) if row else None
+
+
+def test_archived_day_keeps_its_rollup(manager):
+    day = add_old_order(manager)
+    assert daily_rollup(manager, day) == (1, 1, 5500)
+
+    assert manager.archive_old_data(days=90)['orders'] == 1
+    manager.refresh_rollups()
+
+    assert manager.get_user_orders('100') == []
+    assert daily_rollup(manager, day) == (1, 1, 5500)
+
+
+def test_purged_day_keeps_its_rollup(manager):
+    day = add_old_order(manager)
+
+    result = manager.purge_in_batches('orders', 'orders', "status = 'completed'")
+    manager.refresh_rollups()
+
+    assert result['deleted'] == 1
+    assert daily_rollup(manager, day) == (1, 1, 5500)
@@ -0,0 +1,47 @@
+import sqlite3
+import threading
+
+import pytest
+
+import config
+
+
+def add_log(conn, message, started=None, release=None):
+    if started:
+        started.set()
+    if release:
+        release.wait(5)
+    conn.execute("INSERT INTO system_logs (level, module, message) VALUES ('INFO', 'test', ?)", (message,))
+    return message
+
+
+def logged(manager):
+    with manager.get_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT message FROM system_logs WHERE module = 'test' ORDER BY id")]
+
+
+def test_queued_write_is_cancelled_on_timeout(manager, monkeypatch):
+    monkeypatch.setattr(config, 'DB_WRITE_TIMEOUT', 0.1)
+    started, release = threading.Event(), threading.Event()
+    blocker = manager.writer.submit(add_log, 'blocker', started, release)
+    assert started.wait(5)
+
+    with pytest.raises(sqlite3.OperationalError):
+        manager._write(add_log, 'antre')
+    release.set()
+
+    assert blocker.result(5) == 'blocker'
+    # Op yang timeout saat masih mengantre tidak pernah ditulis
+    assert logged(manager) == ['blocker']
+
+
+def test_running_write_is_awaited_past_timeout(manager, monkeypatch):
+    monkeypatch.setattr(config, 'DB_WRITE_TIMEOUT', 0.1)
+    started, release = threading.Event(), threading.Event()
+    threading.Timer(0.3, release.set).start()
+
+    result = manager._write(add_log, 'lambat', started, release)
+
+    assert started.is_set()
+    assert result == 'lambat'
+    assert logged(manager) == ['lambat']
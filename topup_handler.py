@@ -160,8 +160,8 @@ async def show_topup_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             edit_message = False
 
         # Get user data
-        user_data = database.get_or_create_user(str(user.id), user.username or "", user.full_name)
-        saldo = database.get_user_saldo(str(user.id))
+        user_data = await database.db.get_or_create_user(str(user.id), user.username or "", user.full_name)
+        saldo = await database.db.get_user_saldo(str(user.id))
         
         # Keyboard dengan nominal yang tersedia
         keyboard = []
@@ -804,7 +804,7 @@ async def show_topup_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 }.get(topup.get('status', 'pending'), '❓')
                 
                 amount = topup.get('amount', 0)
-                created_at = topup.get('created_at', 'N/A')[:16] if topup.get('created_at') else 'N/A'
+                created_at = database.format_timestamp(topup.get('created_at'), '%Y-%m-%d %H:%M')
                 
                 text += (
                     f"{status_emoji} **Rp {amount:,.0f}**\n"
@@ -853,7 +853,7 @@ async def show_pending_topups(update: Update, context: ContextTypes.DEFAULT_TYPE
                     f"💰 **Rp {topup['amount']:,.0f}**\n"
                     f"👤 {topup.get('full_name', 'N/A')} (@{topup.get('username', 'N/A')})\n"
                     f"🆔 User: `{topup['user_id']}` | TopUp ID: `{topup['id']}`\n"
-                    f"📅 {topup.get('created_at', 'N/A')[:16]}\n"
+                    f"📅 {database.format_timestamp(topup.get('created_at'), '%Y-%m-%d %H:%M')}\n"
                 )
                 
                 text += "────────────────────\n"
@@ -908,7 +908,7 @@ async def check_topup_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"🆔 **ID Transaksi:** `{topup['id']}`\n"
             f"💰 **Nominal:** Rp {topup['amount']:,}\n"
             f"💳 **Metode:** {topup.get('payment_method', 'N/A').upper()}\n"
-            f"📅 **Waktu:** {topup['created_at'][:16]}\n"
+            f"📅 **Waktu:** {database.format_timestamp(topup['created_at'], '%Y-%m-%d %H:%M')}\n"
             f"🎯 **Status:** {status_emoji} {topup['status'].upper()}\n"
         )
         
@@ -207,13 +207,16 @@ def update_order_status_from_webhook(reffid, status_text, status_code, keteranga
             )
             return order
         
-        # Update order status
-        success = database.update_order_status(
-            order_id=order_id,
-            status=internal_status,
-            sn=sn,
-            note=keterangan
-        )
+        # Update order status (gagal: status + refund dalam satu transaksi)
+        if internal_status == 'failed':
+            success = process_order_refund(order, reffid, price, user_id, sn=sn, note=keterangan)
+        else:
+            success = database.update_order_status(
+                order_id=order_id,
+                status=internal_status,
+                sn=sn,
+                note=keterangan
+            )
         
         if not success:
             log_webhook_detailed(
@@ -238,10 +241,6 @@ def update_order_status_from_webhook(reffid, status_text, status_code, keteranga
             "SUCCESS"
         )
         
-        # Process refund untuk order gagal
-        if internal_status == 'failed' and current_status != 'failed':
-            process_order_refund(order, reffid, price, user_id)
-        
         # Update stock untuk order completed
         if internal_status == 'completed' and current_status != 'completed':
             update_product_stock(order)
@@ -267,15 +266,17 @@ def update_order_status_from_webhook(reffid, status_text, status_code, keteranga
         )
         return None
 
-def process_order_refund(order, reffid, price, user_id):
-    """Process refund untuk order yang gagal"""
+def process_order_refund(order, reffid, price, user_id, sn=None, note=None):
+    """Tandai order gagal + refund; False jika order sudah tidak terbuka (sudah di-refund / selesai)"""
     try:
-        database.update_user_balance(
-            user_id, 
-            price, 
-            f"Refund order gagal: {reffid}", 
-            "refund"
-        )
+        if not database.fail_order_with_refund(order['id'], note=note or "", sn=sn or ""):
+            log_webhook_detailed(
+                "REFUND_SKIPPED",
+                f"Order already closed, no refund",
+                {"reffid": reffid, "order_id": order['id']},
+                "INFO"
+            )
+            return False
         
         log_webhook_detailed(
             "REFUND_PROCESSED",
@@ -283,6 +284,7 @@ def process_order_refund(order, reffid, price, user_id):
             {"reffid": reffid, "user_id": user_id, "amount": price},
             "SUCCESS"
         )
+        return True
     except Exception as e:
         log_webhook_detailed(
             "REFUND_ERROR",
@@ -290,6 +292,7 @@ def process_order_refund(order, reffid, price, user_id):
             {"reffid": reffid, "error": str(e)},
             "ERROR"
         )
+        return False
 
 def update_product_stock(order):
     """Update stock produk untuk order yang completed"""